@@ -0,0 +1,442 @@
+import argparse
+import asyncio
+import dataclasses
+import json
+import signal
+import time
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from mediterrania_orchestrator.cache.profile_key import chiave_profilo
+from mediterrania_orchestrator.cache.single_flight import RichiesteInCorso
+from mediterrania_orchestrator.core.batch import GeneratorePianiBatch
+from mediterrania_orchestrator.core.nutritional_verifier import VerificatoreNutrizionale
+from mediterrania_orchestrator.core.scheduler import INTERATTIVA, LavoroScaduto, classi_predefinite
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+from mediterrania_orchestrator.utils.logger import LoggerMediterranIA
+from mediterrania_orchestrator.utils.metrics import METRICHE, RegistroMetriche
+
+# Campi del questionario senza i quali il piano non può essere generato
+CAMPI_PROFILO = ("sesso", "età", "peso", "altezza", "obiettivo", "tipo_dieta")
+
+# Campi del profilo usati nel calcolo dei requisiti
+CAMPI_NUMERICI = ("età", "peso", "altezza")
+
+MAX_INTESTAZIONI = 100
+
+class ErroreRichiesta(Exception):
+    """Errore da restituire al client con lo stato HTTP indicato"""
+
+    def __init__(self, stato: int, messaggio: str):
+        super().__init__(messaggio)
+        self.stato = stato
+
+@dataclass
+class Richiesta:
+    metodo: str
+    percorso: str
+    query: Dict[str, List[str]]
+    versione: str
+    intestazioni: Dict[str, str]
+    corpo: bytes = b""
+
+    @property
+    def keep_alive(self) -> bool:
+        connessione = self.intestazioni.get("connection", "").lower()
+        if self.versione == "HTTP/1.0":
+            return connessione == "keep-alive"
+        return connessione != "close"
+
+    def json(self):
+        try:
+            return json.loads(self.corpo)
+        except (ValueError, UnicodeDecodeError):
+            raise ErroreRichiesta(400, "Il corpo della richiesta non è JSON valido")
+
+@dataclass
+class Risposta:
+    stato: int
+    corpo: object = None
+    tipo_contenuto: str = "application/json"
+    intestazioni: Dict[str, str] = field(default_factory=dict)
+
+    def codifica(self) -> bytes:
+        if isinstance(self.corpo, (bytes, str)):
+            dati = self.corpo.encode("utf-8") if isinstance(self.corpo, str) else self.corpo
+        else:
+            dati = json.dumps(self.corpo, ensure_ascii=False, default=_json_numpy).encode("utf-8")
+        return dati
+
+def _json_numpy(valore):
+    """Converte dataclass e scalari numpy nei tipi Python corrispondenti"""
+    if dataclasses.is_dataclass(valore):
+        return dataclasses.asdict(valore)
+    if hasattr(valore, "item"):
+        return valore.item()
+    raise TypeError(f"{type(valore).__name__} non serializzabile in JSON")
+
+class ServizioAPI:
+    """
+    Servizio HTTP/1.1 asincrono davanti all'orchestratore
+
+    Un solo event loop gestisce tutte le connessioni (keep-alive incluso);
+    la generazione dei piani, che impegna la CPU, viene eseguita da un pool
+    di processi già avviati che condividono il catalogo caricato dal
+    servizio. Verifiche e ricerche di ricette sono abbastanza rapide da
+    essere eseguite direttamente nel loop.
+
+    Endpoint:
+        POST /piani               profilo del questionario -> piano; l'intestazione
+                                  X-Priorita (o ?priorita=) sceglie la classe
+                                  "interattiva" (default) o "bulk", X-Scadenza
+                                  i secondi entro cui il piano deve essere avviato
+        POST /verifica            {"piano", "dati_utente", "settimanale"} -> esito della verifica
+        GET  /ricette/<id>        ricetta
+        GET  /ricette?stagione=s  ricette disponibili nella stagione
+        GET  /metrics             metriche del servizio in formato Prometheus
+        GET  /salute              stato del servizio
+    """
+
+    def __init__(self, host: str = "127.0.0.1", porta: int = 8080, processi: Optional[int] = None,
+                 max_in_coda: int = 64, timeout_keep_alive: float = 5.0, max_corpo: int = 1024 * 1024,
+                 db_ricette: Optional[DatabaseRicette] = None, opzioni_orchestratore: Optional[Dict] = None,
+                 metriche: Optional[RegistroMetriche] = None, contesto: Optional[str] = None,
+                 scadenza_bulk: Optional[float] = None):
+        """
+        Args:
+            host: indirizzo su cui ascoltare
+            porta: porta su cui ascoltare (0 = scelta dal sistema, vedi `porta` dopo `avvia`)
+            processi: worker per la generazione dei piani (default: numero di CPU)
+            max_in_coda: piani di una classe di priorità in generazione o in
+                attesa di un worker oltre i quali le nuove richieste della
+                stessa classe ricevono 503
+            timeout_keep_alive: secondi di inattività dopo cui una connessione viene chiusa
+            max_corpo: dimensione massima in byte del corpo di una richiesta
+            db_ricette: database già caricato (default: catalogo incluso nel pacchetto)
+            opzioni_orchestratore: argomenti per l'`OrchestratoreAlimentare` dei worker
+            metriche: registro delle metriche del servizio (default: registro del processo)
+            contesto: metodo di avvio dei processi worker ("fork", "spawn", ...)
+            scadenza_bulk: secondi oltre i quali un piano bulk non ancora avviato
+                viene scartato con 503 (None = nessuna scadenza)
+        """
+        self.host = host
+        self.porta = porta
+        self.processi = processi
+        self.max_in_coda = max_in_coda
+        self.timeout_keep_alive = timeout_keep_alive
+        self.max_corpo = max_corpo
+        self.opzioni_orchestratore = opzioni_orchestratore or {}
+        self.contesto = contesto
+        self.scadenza_bulk = scadenza_bulk
+        self.logger = LoggerMediterranIA()
+        self.db_ricette = db_ricette if db_ricette is not None else DatabaseRicette()
+        self.verificatore = VerificatoreNutrizionale(self.db_ricette, self.logger)
+        self.metriche = metriche if metriche is not None else METRICHE
+        self.metriche.registra_collettore(self._valori_servizio)
+        self.generatore: Optional[GeneratorePianiBatch] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.in_coda = 0
+        self.in_coda_classe: Dict[str, int] = {}
+        self.in_corso = RichiesteInCorso()
+        self.in_chiusura = False
+        # Connessioni aperte: True mentre stanno elaborando una richiesta
+        self._connessioni: Dict[asyncio.StreamWriter, bool] = {}
+        self._arresto: Optional[asyncio.Event] = None
+
+    async def avvia(self):
+        """Avvia i worker, attende che abbiano caricato il catalogo e apre la porta"""
+        loop = asyncio.get_running_loop()
+        self._arresto = asyncio.Event()
+        self.generatore = await loop.run_in_executor(None, lambda: GeneratorePianiBatch(
+            self.processi, opzioni_orchestratore=self.opzioni_orchestratore,
+            contesto=self.contesto, db_ricette=self.db_ricette,
+            classi_priorita=classi_predefinite(self.scadenza_bulk)
+        ))
+        await loop.run_in_executor(None, self.generatore.riscalda)
+        self.server = await asyncio.start_server(self._gestisci_connessione, self.host, self.porta)
+        self.porta = self.server.sockets[0].getsockname()[1]
+        self.logger.log_info("Servizio API in ascolto su %s:%d con %d worker",
+                             self.host, self.porta, self.generatore.processi)
+
+    async def arresta(self, timeout: float = 30.0):
+        """
+        Arresto ordinato: smette di accettare connessioni, completa le richieste
+        in corso, chiude le connessioni inattive e infine termina i worker
+
+        Args:
+            timeout: secondi concessi alle richieste in corso per completarsi
+        """
+        if self.server is None:
+            return
+        self.in_chiusura = True
+        self.server.close()
+        for writer, occupata in list(self._connessioni.items()):
+            if not occupata:
+                writer.close()
+        scadenza = time.monotonic() + timeout
+        while self._connessioni and time.monotonic() < scadenza:
+            await asyncio.sleep(0.01)
+        for writer in list(self._connessioni):
+            writer.close()
+        await self.server.wait_closed()
+        self.server = None
+        await asyncio.get_running_loop().run_in_executor(None, self.generatore.chiudi)
+        self.logger.log_info("Servizio API arrestato")
+
+    def richiedi_arresto(self):
+        """Chiede a `servi` di arrestare il servizio (es. da un gestore di segnali)"""
+        if self._arresto is not None:
+            self._arresto.set()
+
+    async def servi(self):
+        """Avvia il servizio e lo mantiene attivo fino a SIGINT/SIGTERM o `richiedi_arresto`"""
+        await self.avvia()
+        loop = asyncio.get_running_loop()
+        for segnale in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(segnale, self.richiedi_arresto)
+            except (NotImplementedError, RuntimeError):
+                # Windows o loop fuori dal thread principale
+                pass
+        try:
+            await self._arresto.wait()
+        finally:
+            await self.arresta()
+
+    async def _gestisci_connessione(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve le richieste di una connessione finché il client o il servizio non la chiudono"""
+        self._connessioni[writer] = False
+        try:
+            while not self.in_chiusura:
+                try:
+                    richiesta = await asyncio.wait_for(self._leggi_richiesta(reader), self.timeout_keep_alive)
+                except asyncio.TimeoutError:
+                    break
+                except ErroreRichiesta as e:
+                    await self._scrivi(writer, Risposta(e.stato, {"errore": str(e)}), keep_alive=False)
+                    break
+                if richiesta is None:
+                    break
+                self._connessioni[writer] = True
+                inizio = time.perf_counter()
+                endpoint, risposta = await self._instrada(richiesta)
+                keep_alive = richiesta.keep_alive and not self.in_chiusura
+                await self._scrivi(writer, risposta, keep_alive)
+                self.metriche.osserva("http_durata_secondi", time.perf_counter() - inizio,
+                                      endpoint=endpoint, stato=str(risposta.stato))
+                self._connessioni[writer] = False
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self._connessioni[writer]
+            writer.close()
+
+    async def _leggi_richiesta(self, reader: asyncio.StreamReader) -> Optional[Richiesta]:
+        """Legge una richiesta HTTP/1.x; None se il client ha chiuso la connessione"""
+        try:
+            riga = await reader.readline()
+        except ValueError:
+            raise ErroreRichiesta(400, "Riga di richiesta troppo lunga")
+        if not riga:
+            return None
+        try:
+            metodo, destinazione, versione = riga.decode("latin-1").split()
+        except ValueError:
+            raise ErroreRichiesta(400, "Riga di richiesta non valida")
+        if versione not in ("HTTP/1.0", "HTTP/1.1"):
+            raise ErroreRichiesta(505, "Versione HTTP non supportata")
+
+        intestazioni = {}
+        while True:
+            riga = await reader.readline()
+            if riga in (b"\r\n", b"\n", b""):
+                break
+            nome, separatore, valore = riga.decode("latin-1").partition(":")
+            if not separatore or len(intestazioni) >= MAX_INTESTAZIONI:
+                raise ErroreRichiesta(400, "Intestazioni non valide")
+            intestazioni[nome.strip().lower()] = valore.strip()
+
+        if "chunked" in intestazioni.get("transfer-encoding", "").lower():
+            raise ErroreRichiesta(411, "Transfer-Encoding chunked non supportato: indicare Content-Length")
+        try:
+            lunghezza = int(intestazioni.get("content-length", 0))
+        except ValueError:
+            raise ErroreRichiesta(400, "Content-Length non valido")
+        if lunghezza > self.max_corpo:
+            raise ErroreRichiesta(413, f"Corpo della richiesta oltre {self.max_corpo} byte")
+        corpo = await reader.readexactly(lunghezza) if lunghezza > 0 else b""
+
+        url = urlsplit(destinazione)
+        return Richiesta(metodo.upper(), unquote(url.path), parse_qs(url.query), versione, intestazioni, corpo)
+
+    async def _scrivi(self, writer: asyncio.StreamWriter, risposta: Risposta, keep_alive: bool):
+        corpo = risposta.codifica()
+        stato = HTTPStatus(risposta.stato)
+        righe = [
+            f"HTTP/1.1 {stato.value} {stato.phrase}",
+            f"Content-Type: {risposta.tipo_contenuto}; charset=utf-8",
+            f"Content-Length: {len(corpo)}",
+            "Connection: " + ("keep-alive" if keep_alive else "close"),
+        ]
+        righe.extend(f"{nome}: {valore}" for nome, valore in risposta.intestazioni.items())
+        writer.write(("\r\n".join(righe) + "\r\n\r\n").encode("latin-1") + corpo)
+        await writer.drain()
+
+    async def _instrada(self, richiesta: Richiesta) -> Tuple[str, Risposta]:
+        """Esegue l'endpoint della richiesta; restituisce il nome dell'endpoint (per le metriche) e la risposta"""
+        percorso = richiesta.percorso.rstrip("/") or "/"
+        if percorso.startswith("/ricette/"):
+            endpoint, metodi, gestore = "ricetta", ("GET",), self._ricetta
+        else:
+            endpoint, metodi, gestore = {
+                "/piani": ("piani", ("POST",), self._crea_piano),
+                "/verifica": ("verifica", ("POST",), self._verifica),
+                "/ricette": ("ricette", ("GET",), self._ricette),
+                "/metrics": ("metrics", ("GET",), self._esporta_metriche),
+                "/salute": ("salute", ("GET",), self._salute),
+            }.get(percorso, ("sconosciuto", None, None))
+        try:
+            if gestore is None:
+                raise ErroreRichiesta(404, f"Percorso sconosciuto: {richiesta.percorso}")
+            if richiesta.metodo not in metodi:
+                raise ErroreRichiesta(405, f"Metodo {richiesta.metodo} non consentito su {percorso}")
+            risposta = await gestore(richiesta)
+            # Codificata qui perché un corpo non serializzabile diventi un errore 500
+            risposta.corpo = risposta.codifica()
+            return endpoint, risposta
+        except ErroreRichiesta as e:
+            return endpoint, Risposta(e.stato, {"errore": str(e)})
+        except Exception as e:
+            self.logger.log_errore(e, f"api_{endpoint}")
+            return endpoint, Risposta(500, {"errore": f"{type(e).__name__}: {e}"})
+
+    async def _crea_piano(self, richiesta: Richiesta) -> Risposta:
+        profilo = richiesta.json()
+        if not isinstance(profilo, dict):
+            raise ErroreRichiesta(400, "Il profilo deve essere un oggetto JSON")
+        mancanti = [campo for campo in CAMPI_PROFILO if campo not in profilo]
+        if mancanti:
+            raise ErroreRichiesta(400, "Campi mancanti: " + ", ".join(mancanti))
+        non_numerici = [campo for campo in CAMPI_NUMERICI
+                        if isinstance(profilo[campo], bool) or not isinstance(profilo[campo], (int, float))]
+        if non_numerici:
+            raise ErroreRichiesta(400, "Campi non numerici: " + ", ".join(non_numerici))
+        classe, scadenza = self._priorita(richiesta)
+        # Un profilo identico già in generazione nella stessa classe viene atteso senza occupare la coda
+        chiave = (classe, chiave_profilo(profilo))
+        if chiave not in self.in_corso and self.in_coda_classe.get(classe, 0) >= self.max_in_coda:
+            return Risposta(503, {"errore": "Servizio sovraccarico, riprovare più tardi"},
+                            intestazioni={"Retry-After": "1"})
+
+        def invia():
+            # Contato solo dopo l'invio: se `invia` solleva, nessun callback lo toglierebbe dalla coda
+            futuro = asyncio.wrap_future(self.generatore.invia(profilo, classe, scadenza))
+            self.in_coda += 1
+            self.in_coda_classe[classe] = self.in_coda_classe.get(classe, 0) + 1
+            futuro.add_done_callback(lambda _: self._piano_completato(classe))
+            return futuro
+        try:
+            piano, errore = await self.in_corso.esegui_async(chiave, invia)
+        except LavoroScaduto as e:
+            return Risposta(503, {"errore": str(e)}, intestazioni={"Retry-After": "60"})
+        if errore is None:
+            return Risposta(200, {"piano": piano})
+        if errore.startswith("ValueError: Piano non bilanciato"):
+            return Risposta(422, {"errore": errore.partition(": ")[2]})
+        if errore.startswith("KeyError"):
+            # Tipo di dieta, obiettivo o campo del profilo non riconosciuto
+            return Risposta(400, {"errore": f"Profilo non valido: {errore}"})
+        return Risposta(500, {"errore": errore})
+
+    def _priorita(self, richiesta: Richiesta) -> Tuple[str, Optional[float]]:
+        """Classe di priorità e scadenza della richiesta, da intestazioni o parametri"""
+        classe = richiesta.intestazioni.get("x-priorita") or richiesta.query.get("priorita", [INTERATTIVA])[0]
+        if classe not in self.generatore.schedulatore.classi:
+            raise ErroreRichiesta(400, f"Priorità sconosciuta: {classe}")
+        scadenza = richiesta.intestazioni.get("x-scadenza") or richiesta.query.get("scadenza", [None])[0]
+        if scadenza is not None:
+            try:
+                scadenza = float(scadenza)
+            except ValueError:
+                raise ErroreRichiesta(400, f"Scadenza non valida: {scadenza}")
+        return classe, scadenza
+
+    def _piano_completato(self, classe: str):
+        self.in_coda -= 1
+        self.in_coda_classe[classe] -= 1
+
+    async def _verifica(self, richiesta: Richiesta) -> Risposta:
+        dati = richiesta.json()
+        if not isinstance(dati, dict) or not isinstance(dati.get("piano"), dict) \
+                or not isinstance(dati.get("dati_utente"), dict):
+            raise ErroreRichiesta(400, "Servono gli oggetti \"piano\" e \"dati_utente\"")
+        try:
+            if dati.get("settimanale"):
+                esito = self.verificatore.verifica_rotazione(dati["piano"], dati["dati_utente"])
+            else:
+                esito = self.verificatore.verifica_bilanciamento(dati["piano"], dati["dati_utente"])
+        except (KeyError, TypeError) as e:
+            raise ErroreRichiesta(400, f"Dati non validi: {type(e).__name__}: {e}")
+        return Risposta(200, esito)
+
+    async def _ricetta(self, richiesta: Richiesta) -> Risposta:
+        id_ricetta = richiesta.percorso[len("/ricette/"):].strip("/")
+        ricetta = self.db_ricette.get_ricetta_by_id(id_ricetta)
+        if ricetta is None:
+            raise ErroreRichiesta(404, f"Ricetta non trovata: {id_ricetta}")
+        return Risposta(200, ricetta)
+
+    async def _ricette(self, richiesta: Richiesta) -> Risposta:
+        stagione = richiesta.query.get("stagione", [None])[0]
+        if stagione is None:
+            raise ErroreRichiesta(400, "Parametro \"stagione\" obbligatorio")
+        return Risposta(200, {"ricette": self.db_ricette.get_ricette_stagione(stagione)})
+
+    async def _esporta_metriche(self, richiesta: Richiesta) -> Risposta:
+        return Risposta(200, self.metriche.esporta_prometheus(), tipo_contenuto="text/plain; version=0.0.4")
+
+    async def _salute(self, richiesta: Richiesta) -> Risposta:
+        return Risposta(200, {
+            "stato": "in_chiusura" if self.in_chiusura else "ok",
+            "in_coda": self.in_coda,
+            "priorita": self.generatore.schedulatore.statistiche(),
+            "richieste_condivise": self.in_corso.condivise,
+            "connessioni": len(self._connessioni),
+            "worker": self.generatore.processi
+        })
+
+    def _valori_servizio(self):
+        """Stato del servizio per le metriche"""
+        yield "http_in_coda", {}, self.in_coda
+        yield "http_connessioni", {}, len(self._connessioni)
+        if self.generatore is not None:
+            for classe, statistiche in self.generatore.schedulatore.statistiche().items():
+                yield "schedulatore_in_coda", {"classe": classe}, statistiche["in_coda"]
+                yield "schedulatore_in_corso", {"classe": classe}, statistiche["in_corso"]
+                yield "schedulatore_scartati", {"classe": classe}, statistiche["scartati"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Servizio HTTP dell'orchestratore MediterranIA")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--processi", type=int, default=None, help="worker per i piani (default: CPU)")
+    parser.add_argument("--max-in-coda", type=int, default=64, help="piani in attesa oltre i quali si risponde 503")
+    parser.add_argument("--timeout-keep-alive", type=float, default=5.0)
+    parser.add_argument("--budget-costruzione-ms", type=float, default=None,
+                        help="ricostruisce i piani non bilanciati entro questo budget")
+    parser.add_argument("--scadenza-bulk", type=float, default=None,
+                        help="secondi oltre i quali i piani bulk non ancora avviati vengono scartati")
+    args = parser.parse_args()
+    servizio = ServizioAPI(
+        args.host, args.porta, args.processi, args.max_in_coda, args.timeout_keep_alive,
+        opzioni_orchestratore={"budget_costruzione_ms": args.budget_costruzione_ms},
+        scadenza_bulk=args.scadenza_bulk
+    )
+    asyncio.run(servizio.servi())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class CacheLRU:
+    def __init__(self, dimensione_max: int = 1024, ttl: Optional[float] = None,
+                 orologio: Callable[[], float] = time.monotonic):
+        """
+        Cache in memoria con eviction LRU, TTL e statistiche di hit/miss
+        
+        Args:
+            dimensione_max: numero massimo di elementi prima dell'eviction
+            ttl: durata di validità in secondi di ogni elemento (None = illimitata)
+            orologio: funzione che restituisce il tempo corrente in secondi
+        """
+        if dimensione_max <= 0:
+            raise ValueError("dimensione_max deve essere positiva")
+        self.dimensione_max = dimensione_max
+        self.ttl = ttl
+        self._orologio = orologio
+        self._elementi: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hit = 0
+        self.miss = 0
+        self.eviction = 0
+        self.scadenze = 0
+
+    def recupera(self, chiave: Hashable, default: Any = None) -> Any:
+        """Restituisce il valore associato alla chiave, o `default` se assente o scaduto"""
+        with self._lock:
+            elemento = self._elementi.get(chiave)
+            if elemento is None:
+                self.miss += 1
+                return default
+            valore, scadenza = elemento
+            if scadenza is not None and scadenza <= self._orologio():
+                del self._elementi[chiave]
+                self.scadenze += 1
+                self.miss += 1
+                return default
+            self._elementi.move_to_end(chiave)
+            self.hit += 1
+            return valore
+
+    def salva(self, chiave: Hashable, valore: Any):
+        """Memorizza un valore, rimuovendo il meno usato se la cache è piena"""
+        scadenza = self._orologio() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._elementi[chiave] = (valore, scadenza)
+            self._elementi.move_to_end(chiave)
+            while len(self._elementi) > self.dimensione_max:
+                self._elementi.popitem(last=False)
+                self.eviction += 1
+
+    def svuota(self):
+        """Rimuove tutti gli elementi mantenendo le statistiche"""
+        with self._lock:
+            self._elementi.clear()
+
+    def __len__(self) -> int:
+        return len(self._elementi)
+
+    def statistiche(self) -> Dict[str, float]:
+        """Restituisce i contatori di utilizzo della cache"""
+        with self._lock:
+            richieste = self.hit + self.miss
+            return {
+                "hit": self.hit,
+                "miss": self.miss,
+                "eviction": self.eviction,
+                "scadenze": self.scadenze,
+                "elementi": len(self._elementi),
+                "hit_rate": self.hit / richieste if richieste else 0.0
+            }
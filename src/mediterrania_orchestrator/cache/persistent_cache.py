@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+def hash_contenuto(*paths: str) -> str:
+    """Calcola un hash del contenuto di uno o più file (es. ricette.json e base_plans.json)"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for blocco in iter(lambda: f.read(1 << 20), b""):
+                digest.update(blocco)
+    return digest.hexdigest()
+
+class CachePersistente:
+    def __init__(self, path: str, versione_catalogo: str, dimensione_max: int = 10000):
+        """
+        Cache su disco dei piani generati, basata su SQLite in modalità WAL
+        
+        Il file può essere condiviso da più processi sullo stesso host e
+        sopravvive ai riavvii. Gli elementi sono validi solo per la versione
+        del catalogo con cui sono stati salvati: modificare ricette.json o
+        base_plans.json li invalida automaticamente. Gli elementi delle altre
+        versioni restano nel file, così che processi con cataloghi diversi
+        (es. durante un rilascio graduale) possano condividerlo: non più
+        letti, vengono rimossi dall'eviction LRU o da `elimina_altre_versioni`.
+        
+        Args:
+            path: percorso del file SQLite
+            versione_catalogo: hash del contenuto del catalogo (vedi `hash_contenuto`),
+                usato quando `recupera` e `salva` non ricevono una versione
+            dimensione_max: numero massimo di piani prima dell'eviction LRU;
+                l'eviction rimuove un lotto di piani (1/20 di `dimensione_max`)
+                così da non contare le righe a ogni salvataggio
+        """
+        if dimensione_max <= 0:
+            raise ValueError("dimensione_max deve essere positiva")
+        self.path = path
+        self.versione_catalogo = versione_catalogo
+        self.dimensione_max = dimensione_max
+        self._locale = threading.local()
+        self._lock = threading.Lock()
+        self.hit = 0
+        self.miss = 0
+        self.eviction = 0
+        # Stima delle righe nel file: conta solo i salvataggi di questo processo
+        # e viene riallineata con COUNT(*) quando supera `dimensione_max`
+        self._righe = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        connessione = self._connessione()
+        with connessione:
+            connessione.execute(
+                "CREATE TABLE IF NOT EXISTS piani ("
+                "chiave TEXT NOT NULL, "
+                "versione_catalogo TEXT NOT NULL, "
+                "valore TEXT NOT NULL, "
+                "ultimo_accesso REAL NOT NULL, "
+                "PRIMARY KEY (chiave, versione_catalogo))"
+            )
+            connessione.execute(
+                "CREATE INDEX IF NOT EXISTS idx_piani_accesso ON piani (ultimo_accesso)"
+            )
+        self._righe = len(self)
+
+    def _connessione(self) -> sqlite3.Connection:
+        """Restituisce la connessione del thread corrente, aprendola se necessario"""
+        connessione = getattr(self._locale, "connessione", None)
+        if connessione is None:
+            connessione = sqlite3.connect(self.path, timeout=30)
+            connessione.execute("PRAGMA journal_mode=WAL")
+            connessione.execute("PRAGMA synchronous=NORMAL")
+            self._locale.connessione = connessione
+        return connessione
+
+    def recupera(self, chiave: str, default: Any = None, versione: Optional[str] = None) -> Any:
+        """
+        Restituisce il valore salvato per la chiave, o `default` se assente
+        
+        Args:
+            chiave: chiave del piano
+            default: valore restituito se la chiave non è salvata
+            versione: versione del catalogo da leggere (default: `versione_catalogo`)
+        """
+        versione = versione if versione is not None else self.versione_catalogo
+        connessione = self._connessione()
+        riga = connessione.execute(
+            "SELECT valore FROM piani WHERE chiave = ? AND versione_catalogo = ?",
+            (chiave, versione)
+        ).fetchone()
+        if riga is None:
+            with self._lock:
+                self.miss += 1
+            return default
+
+        with connessione:
+            connessione.execute(
+                "UPDATE piani SET ultimo_accesso = ? WHERE chiave = ? AND versione_catalogo = ?",
+                (time.time(), chiave, versione)
+            )
+        with self._lock:
+            self.hit += 1
+        return json.loads(riga[0])
+
+    def salva(self, chiave: str, valore: Any, versione: Optional[str] = None):
+        """
+        Salva un valore serializzabile in JSON, applicando l'eviction LRU
+        
+        Args:
+            chiave: chiave del piano
+            valore: valore da salvare
+            versione: versione del catalogo con cui è stato calcolato (default: `versione_catalogo`)
+        """
+        versione = versione if versione is not None else self.versione_catalogo
+        serializzato = json.dumps(valore, ensure_ascii=False, separators=(",", ":"))
+        connessione = self._connessione()
+        with connessione:
+            connessione.execute(
+                "INSERT OR REPLACE INTO piani (chiave, versione_catalogo, valore, ultimo_accesso) "
+                "VALUES (?, ?, ?, ?)",
+                (chiave, versione, serializzato, time.time())
+            )
+        with self._lock:
+            # Le sostituzioni di una chiave esistente gonfiano la stima, mai il contrario
+            self._righe += 1
+            if self._righe <= self.dimensione_max:
+                return
+        self._applica_eviction(connessione)
+
+    def _applica_eviction(self, connessione: sqlite3.Connection):
+        """Conta le righe e, se sono troppe, rimuove le meno usate di recente fino a un lotto sotto il massimo"""
+        with connessione:
+            righe = connessione.execute("SELECT COUNT(*) FROM piani").fetchone()[0]
+            eccedenza = 0
+            if righe > self.dimensione_max:
+                eccedenza = righe - self.dimensione_max + self.dimensione_max // 20
+                connessione.execute(
+                    "DELETE FROM piani WHERE rowid IN ("
+                    "SELECT rowid FROM piani ORDER BY ultimo_accesso ASC LIMIT ?)",
+                    (eccedenza,)
+                )
+        with self._lock:
+            self._righe = righe - eccedenza
+            self.eviction += eccedenza
+
+    def svuota(self):
+        """Rimuove tutti i piani salvati"""
+        connessione = self._connessione()
+        with connessione:
+            connessione.execute("DELETE FROM piani")
+        with self._lock:
+            self._righe = 0
+
+    def elimina_altre_versioni(self, versione: Optional[str] = None) -> int:
+        """
+        Rimuove i piani salvati con versioni del catalogo diverse dalla corrente
+        
+        Da chiamare quando nessun processo usa più le versioni precedenti.
+        
+        Args:
+            versione: versione da conservare (default: `versione_catalogo`)
+        
+        Returns:
+            Numero di piani rimossi
+        """
+        versione = versione if versione is not None else self.versione_catalogo
+        connessione = self._connessione()
+        with connessione:
+            rimossi = connessione.execute(
+                "DELETE FROM piani WHERE versione_catalogo != ?", (versione,)
+            ).rowcount
+        with self._lock:
+            self._righe = max(self._righe - rimossi, 0)
+        return rimossi
+
+    def __len__(self) -> int:
+        """Piani salvati per tutte le versioni del catalogo (quelli contati dall'eviction)"""
+        return self._connessione().execute("SELECT COUNT(*) FROM piani").fetchone()[0]
+
+    def chiudi(self):
+        """Chiude la connessione del thread corrente"""
+        connessione = getattr(self._locale, "connessione", None)
+        if connessione is not None:
+            connessione.close()
+            self._locale.connessione = None
+
+    def statistiche(self) -> Dict[str, float]:
+        """Restituisce i contatori di utilizzo della cache"""
+        with self._lock:
+            richieste = self.hit + self.miss
+            return {
+                "hit": self.hit,
+                "miss": self.miss,
+                "eviction": self.eviction,
+                "elementi": len(self),
+                "hit_rate": self.hit / richieste if richieste else 0.0
+            }
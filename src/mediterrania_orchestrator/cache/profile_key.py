@@ -0,0 +1,36 @@
+import hashlib
+import json
+from typing import Dict, Optional
+
+from mediterrania_orchestrator.database.ingredient_index import normalizza_ingrediente
+
+def chiave_profilo(dati_utente: Dict, stagione: Optional[str] = None) -> str:
+    """
+    Calcola una chiave normalizzata per i dati utente
+    
+    Considera solo i campi che influenzano il piano generato, così che
+    questionari equivalenti (ordine o forma diversa di allergie e verdure
+    escluse) producano la stessa chiave.
+    
+    Args:
+        dati_utente: dati dal questionario utente
+        stagione: stagione usata per la generazione del piano
+    """
+    profilo = {
+        "tipo_dieta": dati_utente.get("tipo_dieta"),
+        "obiettivo": dati_utente.get("obiettivo"),
+        "allergie": sorted({normalizza_ingrediente(a) for a in dati_utente.get("allergie") or []}),
+        "verdure_escluse": sorted({normalizza_ingrediente(v) for v in dati_utente.get("verdure_escluse") or []}),
+        "preferenza_latte": dati_utente.get("preferenza_latte") or None,
+        "stagione": dati_utente.get("stagione", stagione),
+        "sesso": dati_utente.get("sesso"),
+        "età": _numero(dati_utente.get("età")),
+        "peso": _numero(dati_utente.get("peso")),
+        "altezza": _numero(dati_utente.get("altezza"))
+    }
+    serializzato = json.dumps(profilo, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(serializzato.encode("utf-8")).hexdigest()
+
+def _numero(valore):
+    """Uniforma i valori numerici (65 e 65.0 producono la stessa chiave)"""
+    return float(valore) if isinstance(valore, (int, float)) else valore
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+class RichiesteInCorso:
+    """
+    Coalescenza delle richieste identiche concorrenti ("single flight")
+
+    La prima richiesta per una chiave esegue il calcolo; quelle che arrivano
+    mentre è in corso ne attendono l'esito e ricevono lo stesso risultato o
+    la stessa eccezione. Finito il calcolo la chiave viene rilasciata: la
+    coalescenza riguarda solo le richieste contemporanee, la memorizzazione
+    degli esiti resta compito delle cache.
+
+    Thread e coroutine asyncio possono condividere la stessa istanza: ogni
+    calcolo è rappresentato da un `concurrent.futures.Future`.
+    """
+
+    def __init__(self, copia: Optional[Callable[[Any], Any]] = None):
+        """
+        Args:
+            copia: funzione che copia il risultato, così che chi lo attende non
+                condivida oggetti mutabili con chi lo ha calcolato
+        """
+        self.copia = copia
+        self._in_corso: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.calcoli = 0
+        self.condivise = 0
+
+    def _registra(self, chiave: Hashable):
+        """Restituisce il futuro della chiave e True se il chiamante deve eseguire il calcolo"""
+        with self._lock:
+            futuro = self._in_corso.get(chiave)
+            if futuro is not None:
+                self.condivise += 1
+                return futuro, False
+            futuro = self._in_corso[chiave] = Future()
+            # Un futuro in esecuzione non può essere annullato da chi lo attende
+            futuro.set_running_or_notify_cancel()
+            self.calcoli += 1
+            return futuro, True
+
+    def _completa(self, chiave: Hashable, futuro: Future, risultato: Any = None,
+                  errore: Optional[BaseException] = None):
+        with self._lock:
+            del self._in_corso[chiave]
+        if errore is not None:
+            futuro.set_exception(errore)
+        else:
+            futuro.set_result(self.copia(risultato) if self.copia is not None else risultato)
+
+    def _condiviso(self, risultato: Any) -> Any:
+        return self.copia(risultato) if self.copia is not None else risultato
+
+    def esegui(self, chiave: Hashable, funzione: Callable[[], Any]) -> Any:
+        """
+        Esegue `funzione` o attende il calcolo già in corso per la stessa chiave
+
+        Args:
+            chiave: identifica le richieste equivalenti
+            funzione: calcolo da eseguire nel thread chiamante se nessun altro
+                lo sta già eseguendo
+        """
+        futuro, esecutore = self._registra(chiave)
+        if not esecutore:
+            return self._condiviso(futuro.result())
+        try:
+            risultato = funzione()
+        except BaseException as e:
+            self._completa(chiave, futuro, errore=e)
+            raise
+        self._completa(chiave, futuro, risultato)
+        return risultato
+
+    async def esegui_async(self, chiave: Hashable, funzione: Callable[[], Awaitable]) -> Any:
+        """
+        Versione per asyncio di `esegui`
+
+        Il calcolo viene eseguito in un task separato: se il chiamante che lo
+        ha avviato viene annullato (es. il client chiude la connessione), gli
+        altri continuano ad attenderne l'esito.
+
+        Args:
+            chiave: identifica le richieste equivalenti
+            funzione: funzione che restituisce l'awaitable del calcolo
+        """
+        futuro, esecutore = self._registra(chiave)
+        if esecutore:
+            try:
+                compito = asyncio.ensure_future(funzione())
+            except BaseException as e:
+                self._completa(chiave, futuro, errore=e)
+                raise
+
+            def completato(compito: asyncio.Future):
+                if compito.cancelled():
+                    self._completa(chiave, futuro, errore=asyncio.CancelledError())
+                elif compito.exception() is not None:
+                    self._completa(chiave, futuro, errore=compito.exception())
+                else:
+                    self._completa(chiave, futuro, compito.result())
+            compito.add_done_callback(completato)
+        # shield: annullare un chiamante non annulla il calcolo condiviso
+        return self._condiviso(await asyncio.shield(asyncio.wrap_future(futuro)))
+
+    def __contains__(self, chiave: Hashable) -> bool:
+        return chiave in self._in_corso
+
+    def __len__(self) -> int:
+        return len(self._in_corso)
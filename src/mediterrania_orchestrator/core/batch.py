@@ -0,0 +1,178 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from mediterrania_orchestrator.core.orchestrator import OrchestratoreAlimentare
+from mediterrania_orchestrator.core.scheduler import BULK, INTERATTIVA, ClassePriorita, SchedulatorePriorita
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+from mediterrania_orchestrator.database.shared_catalog import CatalogoCondiviso
+
+# Stato di ciascun processo worker, creato una sola volta dall'initializer
+_orchestratore_worker: Optional[OrchestratoreAlimentare] = None
+_catalogo_worker: Optional[CatalogoCondiviso] = None
+
+@dataclass
+class EsitoProfilo:
+    indice: int
+    dati_utente: Dict
+    piano: Optional[Dict] = None
+    errore: Optional[str] = None
+
+    @property
+    def riuscito(self) -> bool:
+        return self.errore is None
+
+def _inizializza_worker(nome_catalogo: Optional[str], opzioni_orchestratore: Dict):
+    """Prepara l'orchestratore del worker, collegandolo al catalogo condiviso se presente"""
+    global _orchestratore_worker, _catalogo_worker
+    db_ricette = None
+    if nome_catalogo is not None:
+        # I worker ereditano il resource tracker del processo che ha creato il catalogo
+        _catalogo_worker = CatalogoCondiviso.collega(nome_catalogo, tracker_condiviso=True)
+        db_ricette = DatabaseRicette.da_catalogo_condiviso(_catalogo_worker)
+    _orchestratore_worker = OrchestratoreAlimentare(db_ricette=db_ricette, **opzioni_orchestratore)
+
+def _pronto() -> int:
+    """Task vuoto usato per avviare i worker (l'initializer ha già preparato l'orchestratore)"""
+    return os.getpid()
+
+def _genera_nel_worker(dati_utente: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """Genera il piano di un profilo, trasformando le eccezioni in un messaggio di errore"""
+    try:
+        return _orchestratore_worker.crea_piano_personalizzato(dati_utente), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+class GeneratorePianiBatch:
+    def __init__(self, processi: Optional[int] = None, usa_catalogo_condiviso: bool = True,
+                 opzioni_orchestratore: Optional[Dict] = None, contesto: Optional[str] = None,
+                 db_ricette: Optional[DatabaseRicette] = None,
+                 classi_priorita: Optional[List[ClassePriorita]] = None):
+        """
+        Genera i piani di molti profili in parallelo su un pool di processi
+        
+        Ogni worker mantiene un proprio `OrchestratoreAlimentare` con il
+        catalogo già caricato per tutta la vita del pool. I profili passano
+        da uno `SchedulatorePriorita` che tiene occupati al più `processi`
+        worker, così che le richieste interattive non restino in coda dietro
+        ai lavori bulk.
+        
+        Args:
+            processi: numero di processi worker (default: numero di CPU)
+            usa_catalogo_condiviso: i worker leggono il catalogo da memoria condivisa
+                invece di caricarne ciascuno una copia
+            opzioni_orchestratore: argomenti aggiuntivi per `OrchestratoreAlimentare`
+            contesto: metodo di avvio dei processi ("fork", "spawn", ...)
+            db_ricette: database già caricato da cui creare il catalogo condiviso
+                (default: catalogo incluso nel pacchetto)
+            classi_priorita: classi dello schedulatore (default: interattiva e bulk)
+        """
+        self.processi = processi or multiprocessing.cpu_count()
+        self.catalogo = None
+        if usa_catalogo_condiviso:
+            self.catalogo = CatalogoCondiviso.crea(db_ricette if db_ricette is not None else DatabaseRicette())
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processi,
+            mp_context=multiprocessing.get_context(contesto) if contesto else None,
+            initializer=_inizializza_worker,
+            initargs=(self.catalogo.nome if self.catalogo else None, opzioni_orchestratore or {})
+        )
+        self.schedulatore = SchedulatorePriorita(self._invia_al_pool, self.processi, classi_priorita)
+
+    def riscalda(self):
+        """
+        Avvia tutti i worker e attende che abbiano caricato il catalogo
+        
+        Senza riscaldamento i processi vengono avviati alla prima richiesta,
+        che ne paga il tempo di avvio.
+        """
+        for futuro in [self.executor.submit(_pronto) for _ in range(self.processi)]:
+            futuro.result()
+
+    def _invia_al_pool(self, dati_utente: Dict) -> Future:
+        return self.executor.submit(_genera_nel_worker, dati_utente)
+
+    def invia(self, dati_utente: Dict, classe: str = INTERATTIVA, scadenza: Optional[float] = None) -> Future:
+        """
+        Invia un singolo profilo allo schedulatore
+        
+        Args:
+            dati_utente: profilo da elaborare
+            classe: classe di priorità ("interattiva" o "bulk" con le classi predefinite)
+            scadenza: secondi entro cui il profilo deve essere avviato,
+                altrimenti il Future fallisce con `LavoroScaduto`
+        
+        Returns:
+            Future con la coppia (piano, errore): `errore` è il messaggio
+            dell'eccezione sollevata nel worker, None se il piano è stato creato
+        """
+        return self.schedulatore.invia(dati_utente, classe, scadenza)
+
+    def genera(self, profili: Iterable[Dict], ordinato: bool = True,
+               max_in_corso: Optional[int] = None, classe: str = BULK,
+               scadenza: Optional[float] = None) -> Iterator[EsitoProfilo]:
+        """
+        Genera i piani restituendo gli esiti man mano che sono pronti
+        
+        Un profilo che fallisce produce un `EsitoProfilo` con `errore`
+        valorizzato senza interrompere il batch.
+        
+        Args:
+            profili: dati utente da elaborare (anche un generatore)
+            ordinato: restituisce gli esiti nell'ordine dei profili invece
+                che in ordine di completamento
+            max_in_corso: profili inviati ai worker e non ancora restituiti
+                (default: quattro per processo)
+            classe: classe di priorità dei profili
+            scadenza: secondi entro cui ogni profilo deve essere avviato dal
+                suo invio; i profili scaduti producono un esito con errore
+        """
+        max_in_corso = max_in_corso or self.processi * 4
+        profili = enumerate(profili)
+        in_corso = deque()
+        esauriti = False
+
+        while True:
+            while not esauriti and len(in_corso) < max_in_corso:
+                try:
+                    indice, dati_utente = next(profili)
+                except StopIteration:
+                    esauriti = True
+                    break
+                in_corso.append((indice, dati_utente, self.invia(dati_utente, classe, scadenza)))
+            if not in_corso:
+                return
+
+            if ordinato:
+                completati = [in_corso.popleft()]
+            else:
+                pronti, _ = wait([futuro for _, _, futuro in in_corso], return_when=FIRST_COMPLETED)
+                completati = [elemento for elemento in in_corso if elemento[2] in pronti]
+                for elemento in completati:
+                    in_corso.remove(elemento)
+
+            for indice, dati_utente, futuro in completati:
+                try:
+                    piano, errore = futuro.result()
+                except Exception as e:
+                    # Errori del pool (es. worker terminato) restano confinati al profilo
+                    piano, errore = None, f"{type(e).__name__}: {e}"
+                yield EsitoProfilo(indice, dati_utente, piano=piano, errore=errore)
+
+    def chiudi(self):
+        """Annulla i profili in coda, termina i worker e rilascia il catalogo condiviso"""
+        self.schedulatore.chiudi()
+        self.executor.shutdown(wait=True)
+        if self.catalogo is not None:
+            self.catalogo.chiudi()
+            self.catalogo.elimina()
+            self.catalogo = None
+
+    def __enter__(self) -> "GeneratorePianiBatch":
+        return self
+
+    def __exit__(self, *args):
+        self.chiudi()
@@ -1,7 +1,32 @@
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+import logging
 import math
-from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+
+import numpy as np
+import pandas as pd
+
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette, NUTRIENTI
+from mediterrania_orchestrator.database.recipe_tags import MACRO_PIATTO, NUTRIENTI_PORZIONI, PORZIONE
+from mediterrania_orchestrator.utils.logger import LoggerMediterranIA
+
+# Nutrienti con range minimo-massimo; le fibre hanno solo un minimo
+NUTRIENTI_CON_RANGE = ["calorie", "proteine", "carboidrati", "grassi"]
+NUTRIENTI_VERIFICATI = NUTRIENTI_CON_RANGE + ["fibre"]
+
+# Giorni della rotazione verificata da verifica_rotazione
+GIORNI_SETTIMANA = 7
+
+def _testo_fuori_range(nutriente: str, valore: float, deviazione_perc: float,
+                       min_val: float, max_val: float) -> str:
+    return (
+        f"{nutriente.capitalize()} fuori range: "
+        f"{valore:.1f} ({deviazione_perc:+.1f}% dal target) "
+        f"[range: {min_val:.1f}-{max_val:.1f}]"
+    )
+
+def _testo_fibre_insufficienti(fibre: float, fibre_min: float) -> str:
+    return f"Fibre insufficienti: {fibre:.1f}g (minimo: {fibre_min:.1f})"
 
 @dataclass
 class RequisitiNutrizionali:
@@ -16,8 +41,11 @@ class RequisitiNutrizionali:
     fibre_min: float
 
 class VerificatoreNutrizionale:
-    def __init__(self, db_ricette: DatabaseRicette):
+    def __init__(self, db_ricette: DatabaseRicette, logger: Optional[LoggerMediterranIA] = None):
         self.db = db_ricette
+        self.logger = logger if logger is not None else LoggerMediterranIA()
+        self._vettori = None
+        self._versione_vettori = None
 
     def calcola_requisiti(self, dati_utente: Dict) -> RequisitiNutrizionali:
         """
@@ -51,12 +79,20 @@ class VerificatoreNutrizionale:
             fibre_min=25  # Minimo raccomandato giornaliero
         )
 
-    def verifica_bilanciamento(self, piano: Dict, dati_utente: Dict) -> Dict:
+    def verifica_bilanciamento(self, piano: Dict, dati_utente: Dict,
+                               totali_giornalieri: Optional[Dict] = None) -> Dict:
         """
         Verifica il bilanciamento nutrizionale del piano con logging dettagliato
+        
+        Args:
+            piano: piano da verificare
+            dati_utente: dati dal questionario utente
+            totali_giornalieri: totali già noti del giorno campione (es. da
+                `TotaliPiano`), per non ricalcolarli dal piano
         """
         requisiti = self.calcola_requisiti(dati_utente)
-        totali_giornalieri = self._calcola_totali_giornalieri(piano)
+        if totali_giornalieri is None:
+            totali_giornalieri = self._calcola_totali_giornalieri(piano)
         
         risultati = {
             "bilanciato": True,
@@ -66,6 +102,7 @@ class VerificatoreNutrizionale:
             "analisi_dettagliata": {}  # Nuovo campo per l'analisi dettagliata
         }
 
+        log_attivo = self.logger.abilitato(logging.INFO)
         # Per ogni nutriente, calcola e logga la deviazione dal target
         for nutriente in ["calorie", "proteine", "carboidrati", "grassi"]:
             valore = totali_giornalieri[nutriente]
@@ -88,32 +125,127 @@ class VerificatoreNutrizionale:
             
             risultati["analisi_dettagliata"][nutriente] = analisi
             
-            # Logga l'analisi
-            self.logger.log_info(
-                f"{nutriente.capitalize()}: "
-                f"{valore:.1f} ({deviazione_perc:+.1f}% dal target) "
-                f"[range: {min_val:.1f}-{max_val:.1f}]"
-            )
+            # Logga l'analisi, senza formattare il messaggio se il livello è disattivato
+            if log_attivo:
+                self.logger.log_info(
+                    "%s: %.1f (%+.1f%% dal target) [range: %.1f-%.1f]",
+                    nutriente.capitalize(), valore, deviazione_perc, min_val, max_val
+                )
 
             # Aggiungi problemi se fuori range
             if not analisi["dentro_range"]:
                 risultati["bilanciato"] = False
                 risultati["problemi"].append(
-                    f"{nutriente.capitalize()} fuori range: "
-                    f"{valore:.1f} ({deviazione_perc:+.1f}% dal target) "
-                    f"[range: {min_val:.1f}-{max_val:.1f}]"
+                    _testo_fuori_range(nutriente, valore, deviazione_perc, min_val, max_val)
                 )
 
         # Verifica fibre come prima
         if totali_giornalieri["fibre"] < requisiti.fibre_min:
             risultati["bilanciato"] = False
             risultati["problemi"].append(
-                f"Fibre insufficienti: {totali_giornalieri['fibre']:.1f}g "
-                f"(minimo: {requisiti.fibre_min:.1f})"
+                _testo_fibre_insufficienti(totali_giornalieri["fibre"], requisiti.fibre_min)
             )
 
         return risultati
 
+    def precontrollo(self, piano: Dict, requisiti: RequisitiNutrizionali) -> List[str]:
+        """
+        Scarta i piani evidentemente sbilanciati con i metodi template e del piatto
+        
+        Usa solo le etichette precalcolate del giorno campione. Il controllo
+        è conservativo: un piano che supera l'analisi completa non viene mai
+        scartato, mentre un piano che passa può comunque risultare
+        sbilanciato.
+        
+        Args:
+            piano: piano da verificare
+            requisiti: requisiti nutrizionali dell'utente
+        
+        Returns:
+            Problemi trovati (lista vuota se il piano passa)
+        """
+        posizioni = []
+        for ricette in piano.values():
+            if ricette and ricette[0] in self.db.posizione_per_id:
+                posizioni.append(self.db.posizione_per_id[ricette[0]])
+        if not posizioni:
+            return []
+        etichette = self.db.etichette
+        problemi = []
+
+        # Template: le mezze porzioni danno un intervallo certo per ogni totale
+        mezze_porzioni = etichette.mezze_porzioni[posizioni].sum(axis=0, dtype=np.int64).tolist()
+        for nutriente, h in zip(NUTRIENTI_PORZIONI, mezze_porzioni):
+            mezza = PORZIONE[nutriente] / 2
+            minimo = getattr(requisiti, f"{nutriente}_min")
+            massimo = getattr(requisiti, f"{nutriente}_max", math.inf)
+            if h * mezza > massimo:
+                problemi.append(
+                    f"{nutriente.capitalize()} oltre il massimo: almeno {h * mezza:.1f} (massimo: {massimo:.1f})"
+                )
+            elif (h + len(posizioni)) * mezza < minimo:
+                problemi.append(
+                    f"{nutriente.capitalize()} sotto il minimo: al più "
+                    f"{(h + len(posizioni)) * mezza:.1f} (minimo: {minimo:.1f})"
+                )
+        if problemi:
+            return problemi
+
+        # Piatto: la quota calorica del piano è compresa tra quelle delle sue ricette
+        quote_min = etichette.quote_min[posizioni].min(axis=0).tolist()
+        quote_max = etichette.quote_max[posizioni].max(axis=0).tolist()
+        for (nutriente, kcal), quota_min, quota_max in zip(MACRO_PIATTO, quote_min, quote_max):
+            quota_minima = kcal * getattr(requisiti, f"{nutriente}_min") / requisiti.calorie_max * 100
+            quota_massima = kcal * getattr(requisiti, f"{nutriente}_max") / requisiti.calorie_min * 100
+            if quota_max < quota_minima:
+                problemi.append(
+                    f"Quota calorica da {nutriente} troppo bassa: al più {quota_max}% (minimo: {quota_minima:.0f}%)"
+                )
+            elif quota_min > quota_massima:
+                problemi.append(
+                    f"Quota calorica da {nutriente} troppo alta: almeno {quota_min}% (massimo: {quota_massima:.0f}%)"
+                )
+        return problemi
+
+    def candidati_ammissibili(self, posizioni: Sequence[np.ndarray],
+                              requisiti: RequisitiNutrizionali) -> List[np.ndarray]:
+        """
+        Scarta i candidati che non possono comparire in un giorno campione bilanciato
+        
+        Usa solo le mezze porzioni precalcolate del template: le mezze
+        porzioni di un candidato, sommate alle minime (o massime) degli altri
+        pasti, delimitano i totali di ogni giorno che lo contiene. Il
+        controllo è conservativo: i candidati di un giorno che supera
+        l'analisi completa non vengono mai scartati.
+        
+        Args:
+            posizioni: posizioni nel catalogo dei candidati di ogni pasto
+                (almeno un candidato per pasto)
+            requisiti: requisiti nutrizionali dell'utente
+        
+        Returns:
+            Per ogni pasto, la maschera dei candidati ammissibili
+        """
+        if not posizioni:
+            return []
+        mezza = np.array([PORZIONE[n] / 2 for n in NUTRIENTI_PORZIONI])
+        minimi = np.array([getattr(requisiti, f"{n}_min") for n in NUTRIENTI_PORZIONI])
+        massimi = np.array([getattr(requisiti, f"{n}_max", math.inf) for n in NUTRIENTI_PORZIONI])
+
+        # Il valore reale di una ricetta è compreso tra h e h + 1 mezze porzioni
+        lunghezze = [len(p) for p in posizioni]
+        inizi = np.cumsum([0] + lunghezze[:-1])
+        mezze_porzioni = self.db.etichette.mezze_porzioni[np.concatenate(posizioni)].astype(np.int64)
+        minimi_pasti = np.minimum.reduceat(mezze_porzioni, inizi, axis=0)
+        massimi_pasti = np.maximum.reduceat(mezze_porzioni, inizi, axis=0) + 1
+        pasto = np.repeat(np.arange(len(posizioni)), lunghezze)
+
+        # Ogni candidato con i valori minimi (o massimi) degli altri pasti
+        inferiori = (mezze_porzioni + minimi_pasti.sum(axis=0) - minimi_pasti[pasto]) * mezza
+        superiori = (mezze_porzioni + 1 + massimi_pasti.sum(axis=0) - massimi_pasti[pasto]) * mezza
+        ammessi = ((inferiori <= massimi) & (superiori >= minimi)).all(axis=1)
+        return np.split(ammessi, np.cumsum(lunghezze)[:-1])
+
     def _calcola_totali_giornalieri(self, piano: Dict) -> Dict:
         """
         Calcola i totali nutrizionali giornalieri del piano
@@ -139,4 +271,212 @@ class VerificatoreNutrizionale:
                     totali["grassi"] += valori["grassi"]
                     totali["fibre"] += valori["fibre"]
 
-        return totali
\ No newline at end of file
+        return totali
+
+    def calcola_requisiti_batch(self, dati_utenti: Union[pd.DataFrame, Iterable[Dict]]) -> pd.DataFrame:
+        """
+        Versione vettoriale di `calcola_requisiti` per molti utenti
+        
+        Args:
+            dati_utenti: DataFrame o sequenza di dizionari con sesso, età,
+                peso, altezza e obiettivo
+        
+        Returns:
+            DataFrame con una riga per utente e le colonne dei campi di
+            `RequisitiNutrizionali`
+        """
+        utenti = dati_utenti if isinstance(dati_utenti, pd.DataFrame) else pd.DataFrame(list(dati_utenti))
+        peso = utenti["peso"].to_numpy(dtype=np.float64)
+        altezza = utenti["altezza"].to_numpy(dtype=np.float64)
+        eta = utenti["età"].to_numpy(dtype=np.float64)
+        obiettivo = utenti["obiettivo"].to_numpy()
+
+        # Harris-Benedict, come in calcola_requisiti
+        bmr = np.where(
+            utenti["sesso"].to_numpy() == "M",
+            88.362 + (13.397 * peso) + (4.799 * altezza) - (5.677 * eta),
+            447.593 + (9.247 * peso) + (3.098 * altezza) - (4.330 * eta)
+        )
+        calorie_target = bmr * np.select(
+            [obiettivo == "Perdere peso", obiettivo == "Aumentare massa muscolare"],
+            [0.85, 1.15],
+            default=1.0
+        )
+
+        return pd.DataFrame({
+            "calorie_min": calorie_target * 0.95,
+            "calorie_max": calorie_target * 1.05,
+            "proteine_min": peso * 1.6,
+            "proteine_max": peso * 2.2,
+            "carboidrati_min": calorie_target * 0.45 / 4,
+            "carboidrati_max": calorie_target * 0.65 / 4,
+            "grassi_min": calorie_target * 0.20 / 9,
+            "grassi_max": calorie_target * 0.35 / 9,
+            "fibre_min": np.full(len(utenti), 25.0)
+        }, index=utenti.index)
+
+    def verifica_bilanciamento_batch(self, piani: Sequence[Dict],
+                                     dati_utenti: Union[pd.DataFrame, Iterable[Dict]]) -> pd.DataFrame:
+        """
+        Versione vettoriale di `verifica_bilanciamento` per molti piani
+        
+        I testi dei problemi vengono generati solo per le righe fuori range.
+        
+        Args:
+            piani: un piano per utente, nello stesso ordine di `dati_utenti`
+            dati_utenti: DataFrame o sequenza di dizionari dei dati utente
+        
+        Returns:
+            DataFrame con una riga per piano: totali, range, target,
+            deviazione percentuale ed esito per ogni nutriente, più le
+            colonne `bilanciato` e `problemi`
+        """
+        requisiti = self.calcola_requisiti_batch(dati_utenti)
+        risultati = self._totali_batch(piani)
+        risultati.index = requisiti.index
+
+        bilanciato = np.ones(len(risultati), dtype=bool)
+        for nutriente in NUTRIENTI_CON_RANGE:
+            valore = risultati[nutriente].to_numpy()
+            min_val = requisiti[f"{nutriente}_min"].to_numpy()
+            max_val = requisiti[f"{nutriente}_max"].to_numpy()
+            target = (min_val + max_val) / 2
+            dentro_range = (min_val <= valore) & (valore <= max_val)
+            risultati[f"{nutriente}_min"] = min_val
+            risultati[f"{nutriente}_max"] = max_val
+            risultati[f"{nutriente}_target"] = target
+            risultati[f"{nutriente}_deviazione_percentuale"] = (valore - target) / target * 100
+            risultati[f"{nutriente}_dentro_range"] = dentro_range
+            bilanciato &= dentro_range
+        risultati["fibre_min"] = requisiti["fibre_min"].to_numpy()
+        risultati["fibre_sufficienti"] = risultati["fibre"] >= risultati["fibre_min"]
+        bilanciato &= risultati["fibre_sufficienti"].to_numpy()
+        risultati["bilanciato"] = bilanciato
+
+        problemi = [[] for _ in range(len(risultati))]
+        for riga in np.flatnonzero(~bilanciato):
+            problemi[riga] = self._problemi_riga(risultati.iloc[riga])
+        risultati["problemi"] = problemi
+        return risultati
+
+    def verifica_rotazione(self, piano: Dict, dati_utente: Dict,
+                           giorni: int = GIORNI_SETTIMANA) -> Dict:
+        """
+        Verifica ogni giorno della rotazione del piano, non solo il giorno campione
+        
+        Il giorno d usa, per ogni tipo pasto, la ricetta d-esima della lista
+        (ricominciando dall'inizio quando la lista finisce).
+        
+        Args:
+            piano: piano con le liste di ricette per tipo pasto
+            dati_utente: dati dal questionario utente
+            giorni: numero di giorni della rotazione
+        
+        Returns:
+            Dizionario con esito complessivo, problemi per giorno, valori e
+            deviazioni di ogni giorno, media della rotazione e giorno peggiore
+        
+        Raises:
+            TypeError: se un tipo pasto non ha una lista di ID ricetta
+        """
+        requisiti = self.calcola_requisiti(dati_utente)
+        totali = self._totali_rotazione(piano, giorni)
+
+        min_val = np.array([getattr(requisiti, f"{n}_min") for n in NUTRIENTI_CON_RANGE])
+        max_val = np.array([getattr(requisiti, f"{n}_max") for n in NUTRIENTI_CON_RANGE])
+        target = (min_val + max_val) / 2
+        valori = totali[:, :len(NUTRIENTI_CON_RANGE)]
+        deviazioni = (valori - target) / target * 100
+        dentro_range = (min_val <= valori) & (valori <= max_val)
+        fibre_sufficienti = totali[:, -1] >= requisiti.fibre_min
+        giorni_bilanciati = dentro_range.all(axis=1) & fibre_sufficienti
+
+        risultati = {
+            "bilanciato": bool(giorni_bilanciati.all()),
+            "problemi": [],
+            "requisiti": requisiti,
+            "giorni": [],
+            "media": dict(zip(NUTRIENTI_VERIFICATI, totali.mean(axis=0).tolist())),
+            "deviazioni_medie": dict(zip(NUTRIENTI_CON_RANGE, deviazioni.mean(axis=0).tolist())),
+            # Il giorno con la deviazione assoluta più alta su un singolo nutriente
+            "giorno_peggiore": int(np.abs(deviazioni).max(axis=1).argmax()) if giorni else None
+        }
+        for giorno in range(giorni):
+            risultati["giorni"].append({
+                "valori_attuali": dict(zip(NUTRIENTI_VERIFICATI, totali[giorno].tolist())),
+                "deviazioni_percentuali": dict(zip(NUTRIENTI_CON_RANGE, deviazioni[giorno].tolist())),
+                "bilanciato": bool(giorni_bilanciati[giorno])
+            })
+            if giorni_bilanciati[giorno]:
+                continue
+            for k, nutriente in enumerate(NUTRIENTI_CON_RANGE):
+                if not dentro_range[giorno, k]:
+                    risultati["problemi"].append(f"Giorno {giorno + 1}: " + _testo_fuori_range(
+                        nutriente, valori[giorno, k], deviazioni[giorno, k], min_val[k], max_val[k]
+                    ))
+            if not fibre_sufficienti[giorno]:
+                risultati["problemi"].append(f"Giorno {giorno + 1}: " + _testo_fibre_insufficienti(
+                    totali[giorno, -1], requisiti.fibre_min
+                ))
+        return risultati
+
+    def vettori_ricette(self) -> np.ndarray:
+        """
+        Vettori nutrizionali per ricetta nell'ordine di NUTRIENTI_VERIFICATI
+        
+        L'ultima riga è nulla e raccoglie le ricette assenti dal catalogo
+        (posizione -1). Ricostruiti solo quando cambia la versione del catalogo.
+        """
+        if self._vettori is None or self._versione_vettori != self.db.versione:
+            colonne = [NUTRIENTI.index(n) for n in NUTRIENTI_VERIFICATI]
+            self._vettori = np.vstack([
+                self.db.matrice_nutrienti[:, colonne],
+                np.zeros((1, len(colonne)))
+            ])
+            self._versione_vettori = self.db.versione
+        return self._vettori
+
+    def _totali_rotazione(self, piano: Dict, giorni: int) -> np.ndarray:
+        """Totali di ogni giorno della rotazione, matrice (giorni, NUTRIENTI_VERIFICATI)"""
+        for tipo_pasto, ricette in piano.items():
+            # Una stringa verrebbe ruotata carattere per carattere
+            if not isinstance(ricette, list) or not all(isinstance(r, str) for r in ricette):
+                raise TypeError(f"Il pasto {tipo_pasto} deve essere una lista di ID ricetta")
+        vettori = self.vettori_ricette()
+        posizione_per_id = self.db.posizione_per_id
+        liste = [ricette for ricette in piano.values() if ricette]
+        posizioni = np.full((giorni, len(liste)), -1, dtype=np.intp)
+        for j, ricette in enumerate(liste):
+            colonna = [posizione_per_id.get(id_ricetta, -1) for id_ricetta in ricette]
+            posizioni[:, j] = np.resize(colonna, giorni)
+        return vettori[posizioni].sum(axis=1)
+
+    def _totali_batch(self, piani: Sequence[Dict]) -> pd.DataFrame:
+        """Somma i valori nutrizionali del giorno campione di ogni piano sui vettori per ricetta"""
+        posizione_per_id = self.db.posizione_per_id
+        indici_piano, posizioni = [], []
+        for i, piano in enumerate(piani):
+            for ricette in piano.values():
+                # Come _calcola_totali_giornalieri: la prima ricetta di ogni tipo pasto
+                if ricette:
+                    indici_piano.append(i)
+                    posizioni.append(posizione_per_id.get(ricette[0], -1))
+
+        totali = np.zeros((len(piani), len(NUTRIENTI_VERIFICATI)), dtype=np.float64)
+        np.add.at(totali, np.asarray(indici_piano, dtype=np.intp),
+                  self.vettori_ricette()[np.asarray(posizioni, dtype=np.intp)])
+        return pd.DataFrame(totali, columns=NUTRIENTI_VERIFICATI)
+
+    @staticmethod
+    def _problemi_riga(riga: pd.Series) -> List[str]:
+        """Genera i testi dei problemi di una riga con gli stessi formati di verifica_bilanciamento"""
+        problemi = []
+        for nutriente in NUTRIENTI_CON_RANGE:
+            if not riga[f"{nutriente}_dentro_range"]:
+                problemi.append(_testo_fuori_range(
+                    nutriente, riga[nutriente], riga[f"{nutriente}_deviazione_percentuale"],
+                    riga[f"{nutriente}_min"], riga[f"{nutriente}_max"]
+                ))
+        if not riga["fibre_sufficienti"]:
+            problemi.append(_testo_fibre_insufficienti(riga["fibre"], riga["fibre_min"]))
+        return problemi
@@ -1,87 +1,357 @@
+import itertools
 import json
 import os
+import time
+import uuid
 from pathlib import Path
 from typing import Dict, List, Optional
 from mediterrania_orchestrator.database.database_handler import DatabaseRicette
 from mediterrania_orchestrator.utils.logger import LoggerMediterranIA
+from mediterrania_orchestrator.utils.event_log import RegistroEventi
+from mediterrania_orchestrator.utils.metrics import METRICHE, RegistroMetriche
+from mediterrania_orchestrator.utils.profiling import ProfilatoreRichieste
 from mediterrania_orchestrator.core.nutritional_verifier import VerificatoreNutrizionale
 from mediterrania_orchestrator.core.substitution_handler import GestoreSostituzioni
+from mediterrania_orchestrator.core.plan_totals import TotaliPiano
+from mediterrania_orchestrator.core.plan_builder import CostruttorePiano
+from mediterrania_orchestrator.cache.memory_cache import CacheLRU
+from mediterrania_orchestrator.cache.persistent_cache import CachePersistente, hash_contenuto
+from mediterrania_orchestrator.cache.profile_key import chiave_profilo
+from mediterrania_orchestrator.cache.single_flight import RichiesteInCorso
+
+# Numero progressivo degli orchestratori del processo, usato come etichetta delle metriche
+_numeratore_orchestratori = itertools.count()
+
+def _ms_da(inizio: float) -> float:
+    """Millisecondi trascorsi da un istante di `time.perf_counter`"""
+    return round((time.perf_counter() - inizio) * 1000, 3)
 
 class OrchestratoreAlimentare:
-    def __init__(self):
+    def __init__(self, dimensione_cache_piani: int = 1024, ttl_cache_piani: Optional[float] = 3600,
+                 path_cache_persistente: Optional[str] = None, dimensione_cache_persistente: int = 100000,
+                 db_ricette: Optional[DatabaseRicette] = None, verifica_settimanale: bool = False,
+                 budget_costruzione_ms: Optional[float] = None, path_eventi: Optional[str] = None,
+                 campionamento_eventi: Optional[Dict[str, float]] = None,
+                 metriche: Optional[RegistroMetriche] = None, path_profili: Optional[str] = None,
+                 campionamento_profili: float = 0.0, profilazione_memoria: bool = False,
+                 path_piani_base: Optional[str] = None):
+        """
+        Args:
+            dimensione_cache_piani: numero massimo di piani mantenuti in cache
+            ttl_cache_piani: validità in secondi dei piani in cache (None = illimitata)
+            path_cache_persistente: file SQLite della cache su disco (None = disattivata)
+            dimensione_cache_persistente: numero massimo di piani nella cache su disco
+            db_ricette: database già caricato da riutilizzare (es. su catalogo condiviso)
+            verifica_settimanale: verifica ogni giorno della rotazione settimanale
+                invece del solo giorno campione
+            budget_costruzione_ms: se impostato, un piano non bilanciato viene
+                ricostruito da `CostruttorePiano` entro questo tempo invece di
+                fallire subito (solo con la verifica del giorno campione)
+            path_eventi: file JSONL del registro strutturato delle decisioni
+                (None = disattivato)
+            campionamento_eventi: frazione di eventi registrati per tipo
+                ("piano", "sostituzione", "verifica", "costruzione", "errore")
+            metriche: registro delle metriche di durata per fase e delle
+                statistiche della cache (default: registro del processo)
+            path_profili: directory dei profili cProfile delle richieste
+                (None = profilazione disattivata)
+            campionamento_profili: frazione di richieste profilate; le altre
+                vengono profilate solo se il chiamante lo chiede
+            profilazione_memoria: traccia anche le allocazioni con tracemalloc
+            path_piani_base: file JSON dei piani base (default: quello incluso nel pacchetto)
+        """
+        self._path_piani_base = path_piani_base
         self.logger = LoggerMediterranIA()
-        self.db_ricette = DatabaseRicette()
-        self.verificatore = VerificatoreNutrizionale(self.db_ricette)
+        self.db_ricette = db_ricette if db_ricette is not None else DatabaseRicette()
+        self.verificatore = VerificatoreNutrizionale(self.db_ricette, self.logger)
         self.gestore_sostituzioni = GestoreSostituzioni(self.db_ricette)
+        self.verifica_settimanale = verifica_settimanale
+        self._totali_piani_base: Dict[tuple, TotaliPiano] = {}
+        self.costruttore = None
+        if budget_costruzione_ms is not None and not verifica_settimanale:
+            self.costruttore = CostruttorePiano(self.db_ricette, self.verificatore, budget_costruzione_ms)
+        self.eventi = RegistroEventi(path_eventi, campionamento_eventi) if path_eventi is not None else None
+        self.profilatore = None
+        if path_profili is not None:
+            self.profilatore = ProfilatoreRichieste(path_profili, campionamento_profili, profilazione_memoria)
+        self.cache_piani = CacheLRU(dimensione_cache_piani, ttl_cache_piani)
+        self.in_corso = RichiesteInCorso(copia=self._copia_piano)
+        self.metriche = metriche if metriche is not None else METRICHE
+        self._id_metriche = str(next(_numeratore_orchestratori))
+        self.metriche.registra_collettore(self._valori_cache)
+        self.cache_persistente = None
+        if path_cache_persistente is not None:
+            # I piani base non vengono ricaricati; il catalogo sì (`DatabaseRicette.ricarica`)
+            self._hash_piani_base = hash_contenuto(str(self.path_piani_base))
+            self.cache_persistente = CachePersistente(
+                path_cache_persistente, self._versione_persistente(), dimensione_cache_persistente
+            )
 
-    def crea_piano_personalizzato(self, dati_utente: Dict) -> Dict:
+    def crea_piano_personalizzato(self, dati_utente: Dict, profila: bool = False) -> Dict:
         """
         Crea un piano alimentare completamente personalizzato
         
         Args:
             dati_utente: dati dal questionario utente
+            profila: profila questa richiesta anche se non estratta dal
+                campionamento (richiede `path_profili`)
+        """
+        # Le richieste contemporanee per profili equivalenti condividono un solo calcolo
+        chiave = self.chiave_piano(dati_utente)
+        return self.in_corso.esegui(chiave, lambda: self._crea_piano_profilato(dati_utente, chiave, profila))
+
+    def chiave_piano(self, dati_utente: Dict) -> str:
+        """Chiave del profilo per cache e coalescenza, distinta per modalità di verifica"""
+        chiave = chiave_profilo(dati_utente, self.gestore_sostituzioni.stagione_corrente)
+        # L'esito dipende dalla modalità di verifica
+        if self.verifica_settimanale:
+            return "settimana:" + chiave
+        if self.costruttore is not None:
+            return "costruzione:" + chiave
+        return chiave
+
+    def _crea_piano_profilato(self, dati_utente: Dict, chiave: str, profila: bool) -> Dict:
+        """Esegue la pipeline, sotto profilazione se la richiesta è campionata o richiesta"""
+        if self.profilatore is None or not self.profilatore.attivo(profila):
+            return self._crea_piano(dati_utente, chiave, uuid.uuid4().hex if self.eventi is not None else None)
+        richiesta = uuid.uuid4().hex
+        with self.profilatore.profila(richiesta) as path_profilo:
+            if path_profilo is not None:
+                self.logger.log_info("Profilo della richiesta %s: %s", richiesta, path_profilo)
+            return self._crea_piano(dati_utente, chiave, richiesta)
+
+    def _crea_piano(self, dati_utente: Dict, chiave: str, richiesta: Optional[str]) -> Dict:
+        """
+        Pipeline di creazione del piano
+        
+        Args:
+            dati_utente: dati dal questionario utente
+            chiave: chiave del profilo (vedi `chiave_piano`)
+            richiesta: id della richiesta per eventi e profili (None se non serve)
         """
+        inizio = time.perf_counter()
+        durate = {}
+        fase, inizio_fase = "cache", inizio
+        esito_richiesta = "errore"
         try:
+            # 0. Piano già generato per un profilo equivalente con lo stesso catalogo
+            versione = self.db_ricette.versione
+            piano_in_cache = self._recupera_da_cache(chiave, versione)
+            durate[fase] = _ms_da(inizio_fase)
+            if piano_in_cache is not None:
+                fase, esito_richiesta = "esito", "cache"
+                self._evento("piano", richiesta, fase="cache", bilanciato=not isinstance(piano_in_cache, ValueError),
+                             durata_ms=_ms_da(inizio))
+            if isinstance(piano_in_cache, ValueError):
+                raise ValueError(*piano_in_cache.args)
+            if piano_in_cache is not None:
+                return self._copia_piano(piano_in_cache)
+                
             # 1. Seleziona piano base
+            fase, inizio_fase = "selezione", time.perf_counter()
             tipo_piano = self.determina_tipo_piano(
                 dati_utente["tipo_dieta"],
                 dati_utente["obiettivo"]
             )
             piano_base = self.piani_base[tipo_piano]
+            durate[fase] = _ms_da(inizio_fase)
             
             self.logger.log_piano_creazione(dati_utente, tipo_piano)
             
-            # 2. Applica filtro allergie
-            if dati_utente.get("allergie"):
-                piano_base = self.filtra_per_allergie(
-                    piano_base,
-                    dati_utente["allergie"]
+            # 2. Allergie, verdure escluse e preferenze latte in un solo passaggio;
+            # i totali del piano base vengono aggiornati con i delta delle sostituzioni
+            fase, inizio_fase = "personalizzazione", time.perf_counter()
+            totali = self.totali_piano_base(tipo_piano)
+            piano_base, sostituzioni = self.gestore_sostituzioni.personalizza_piano(
+                piano_base,
+                allergie=dati_utente.get("allergie"),
+                verdure_escluse=dati_utente.get("verdure_escluse"),
+                preferenza_latte=dati_utente.get("preferenza_latte"),
+                totali=totali
+            )
+            durate[fase] = _ms_da(inizio_fase)
+            for sostituzione in sostituzioni:
+                self.logger.log_sostituzione(
+                    sostituzione.ricetta_originale,
+                    sostituzione.ricetta_sostitutiva,
+                    sostituzione.motivo
                 )
+                if self.eventi is not None:
+                    self._evento(
+                        "sostituzione", richiesta, fase=fase,
+                        tipo_pasto=sostituzione.tipo_pasto,
+                        ricetta_originale=sostituzione.ricetta_originale,
+                        ricetta_sostitutiva=sostituzione.ricetta_sostitutiva,
+                        motivo=sostituzione.motivo,
+                        delta=sostituzione.delta_nutrienti
+                    )
                 
-            # 3. Sostituisci verdure escluse
-            if dati_utente.get("verdure_escluse"):
-                piano_base, sostituzioni_verdure = self.gestore_sostituzioni.sostituisci_verdure(
-                    piano_base,
-                    set(dati_utente["verdure_escluse"])
+            # 3. Verifica bilanciamento nutrizionale
+            fase, inizio_fase = "verifica", time.perf_counter()
+            livello = "settimanale" if self.verifica_settimanale else "completo"
+            # Con la ricerca attiva, i piani che il precontrollo sulle etichette scarta
+            # passano alla costruzione senza analisi completa
+            problemi = []
+            if self.costruttore is not None:
+                problemi = self.verificatore.precontrollo(piano_base, self.verificatore.calcola_requisiti(dati_utente))
+            if self.verifica_settimanale:
+                risultati_verifica = self.verificatore.verifica_rotazione(piano_base, dati_utente)
+            elif problemi:
+                livello = "precontrollo"
+                risultati_verifica = {
+                    "bilanciato": False, "problemi": problemi, "valori_attuali": totali.come_dizionario()
+                }
+            else:
+                risultati_verifica = self.verificatore.verifica_bilanciamento(
+                    piano_base, 
+                    dati_utente,
+                    totali.come_dizionario()
                 )
-                for sostituzione in sostituzioni_verdure:
-                    self.logger.log_sostituzione(
-                        sostituzione.ricetta_originale,
-                        sostituzione.ricetta_sostitutiva,
-                        sostituzione.motivo
-                    )
+            durate[fase] = _ms_da(inizio_fase)
+            self._evento(
+                "verifica", richiesta, fase=fase,
+                livello=livello,
+                bilanciato=risultati_verifica["bilanciato"],
+                problemi=risultati_verifica["problemi"],
+                valori=risultati_verifica.get("valori_attuali", risultati_verifica.get("media")),
+                ricette={tipo: ricette[:1] for tipo, ricette in piano_base.items()},
+                durata_ms=durate[fase]
+            )
                 
-            # 4. Gestisci preferenze latte
-            if dati_utente.get("preferenza_latte"):
-                piano_base, sostituzioni_latte = self.gestore_sostituzioni.sostituisci_latte(
-                    piano_base,
-                    dati_utente["preferenza_latte"]
+            # 3b. Piano non bilanciato: ricerca di una combinazione che rispetti i requisiti
+            if not risultati_verifica["bilanciato"] and self.costruttore is not None:
+                fase = "costruzione"
+                esito = self.costruttore.costruisci(
+                    self.costruttore.pool_candidati(
+                        piano_base,
+                        list(dati_utente.get("allergie") or []) + list(dati_utente.get("verdure_escluse") or []) +
+                        (["latte"] if dati_utente.get("preferenza_latte") else []),
+                        dati_utente.get("tipo_dieta")
+                    ),
+                    dati_utente,
+                    piano_base
+                )
+                self.logger.log_info(
+                    "Costruzione piano: violazione %.3f, %d nodi in %.1f ms",
+                    esito.violazione, esito.nodi_visitati, esito.durata_ms
                 )
-                for sostituzione in sostituzioni_latte:
-                    self.logger.log_sostituzione(
-                        sostituzione.ricetta_originale,
-                        sostituzione.ricetta_sostitutiva,
-                        sostituzione.motivo
+                durate[fase] = round(esito.durata_ms, 3)
+                self._evento(
+                    "costruzione", richiesta, fase=fase,
+                    bilanciato=esito.bilanciato,
+                    violazione=esito.violazione,
+                    nodi_visitati=esito.nodi_visitati,
+                    candidati_scartati=esito.candidati_scartati,
+                    esaustiva=esito.esaustiva,
+                    ricette=esito.scelta,
+                    valori=esito.totali,
+                    durata_ms=durate[fase]
+                )
+                if esito.bilanciato:
+                    piano_base = esito.piano
+                    risultati_verifica = self.verificatore.verifica_bilanciamento(
+                        piano_base, dati_utente, esito.totali
+                    )
+                elif livello == "precontrollo":
+                    # Nessuna alternativa: l'esito riporta l'analisi completa del piano personalizzato
+                    risultati_verifica = self.verificatore.verifica_bilanciamento(
+                        piano_base, dati_utente, totali.come_dizionario()
                     )
-                
-            # 5. Verifica bilanciamento nutrizionale
-            risultati_verifica = self.verificatore.verifica_bilanciamento(
-                piano_base, 
-                dati_utente
-            )
             self.logger.log_verifica_nutrizionale(risultati_verifica)
+            fase = "esito"
+            esito_richiesta = "bilanciato" if risultati_verifica["bilanciato"] else "non_bilanciato"
+            self._evento(
+                "piano", richiesta, fase="completato",
+                tipo_piano=tipo_piano,
+                bilanciato=risultati_verifica["bilanciato"],
+                sostituzioni=len(sostituzioni),
+                durate=durate,
+                durata_ms=_ms_da(inizio)
+            )
             
             if not risultati_verifica["bilanciato"]:
-                raise ValueError(
+                errore = ValueError(
                     "Piano non bilanciato nutrizionalmente: " + 
                     "; ".join(risultati_verifica["problemi"])
                 )
+                # L'esito dipende solo dal profilo: anche il fallimento va in cache
+                self._salva_in_cache(chiave, errore, versione)
+                raise errore
                 
+            self._salva_in_cache(chiave, self._copia_piano(piano_base), versione)
             return piano_base
             
         except Exception as e:
             self.logger.log_errore(e, "creazione_piano_personalizzato")
+            # Gli esiti non bilanciati sono già registrati come eventi "piano"
+            if fase != "esito":
+                self._evento("errore", richiesta, fase=fase, errore=repr(e), durata_ms=_ms_da(inizio))
             raise
+        finally:
+            self._registra_metriche(durate, time.perf_counter() - inizio, esito_richiesta)
+
+    def _registra_metriche(self, durate: Dict[str, float], durata: float, esito: str):
+        """Registra le durate per fase (in millisecondi) e l'esito della richiesta"""
+        for fase, millisecondi in durate.items():
+            self.metriche.osserva("fase_durata_secondi", millisecondi / 1000, fase=fase)
+        self.metriche.osserva("piano_durata_secondi", durata)
+        self.metriche.incrementa("richieste_total", esito=esito)
+
+    def _valori_cache(self):
+        """Statistiche delle cache dei piani e della coalescenza per le metriche"""
+        livelli = [("memoria", self.cache_piani)]
+        if self.cache_persistente is not None:
+            livelli.append(("disco", self.cache_persistente))
+        for livello, cache in livelli:
+            statistiche = cache.statistiche()
+            etichette = {"livello": livello, "orchestratore": self._id_metriche}
+            yield "cache_hit_rate", etichette, statistiche["hit_rate"]
+            yield "cache_elementi", etichette, statistiche["elementi"]
+        # Richieste che hanno atteso il calcolo di un profilo equivalente già in corso
+        yield "richieste_condivise", {"orchestratore": self._id_metriche}, self.in_corso.condivise
+
+    def _evento(self, tipo: str, richiesta: Optional[str], **campi):
+        """Registra un evento strutturato se il registro è attivo"""
+        if self.eventi is not None:
+            self.eventi.registra(tipo, richiesta, **campi)
+
+    def _recupera_da_cache(self, chiave: str, versione: str):
+        """
+        Cerca l'esito di un profilo nella cache in memoria e poi su disco
+        
+        Restituisce il piano, l'errore di bilanciamento salvato o None.
+        
+        Args:
+            chiave: chiave del profilo (vedi `chiave_piano`)
+            versione: versione del catalogo letta all'inizio della richiesta
+        """
+        esito = self.cache_piani.recupera((chiave, versione))
+        if esito is not None or self.cache_persistente is None:
+            return esito
+            
+        salvato = self.cache_persistente.recupera(chiave, versione=self._versione_persistente(versione))
+        if salvato is None:
+            return None
+        esito = ValueError(*salvato["errore"]) if "errore" in salvato else salvato["piano"]
+        self.cache_piani.salva((chiave, versione), esito)
+        return esito
+
+    def _salva_in_cache(self, chiave: str, esito, versione: str):
+        """Salva il piano o l'errore di bilanciamento in entrambi i livelli di cache"""
+        if self.cache_persistente is not None:
+            valore = {"errore": list(esito.args)} if isinstance(esito, ValueError) else {"piano": esito}
+            self.cache_persistente.salva(chiave, valore, versione=self._versione_persistente(versione))
+        self.cache_piani.salva((chiave, versione), esito)
+
+    def _versione_persistente(self, versione_catalogo: Optional[str] = None) -> str:
+        """Versione della cache su disco: catalogo corrente più piani base"""
+        versione_catalogo = versione_catalogo if versione_catalogo is not None else self.db_ricette.versione
+        return f"{versione_catalogo}:{self._hash_piani_base}"
+
+    @staticmethod
+    def _copia_piano(piano: Dict) -> Dict:
+        """Copia il piano così che le modifiche del chiamante non alterino la cache"""
+        return {tipo_pasto: list(ricette) for tipo_pasto, ricette in piano.items()}
 
     def determina_tipo_piano(self, tipo_dieta: str, obiettivo: str) -> str:
         """Determina il codice del piano base da usare"""
@@ -102,25 +372,31 @@ class OrchestratoreAlimentare:
         """
         Filtra il piano rimuovendo ricette con allergeni
         """
+        ricette_con_allergeni = self.db_ricette.get_ricette_con_ingredienti(allergie)
         piano_filtrato = {}
         for tipo_pasto, ricette_ids in piano.items():
-            ricette_filtrate = []
-            for ricetta_id in ricette_ids:
-                ricetta = self.db_ricette.get_ricetta_by_id(ricetta_id)
-                if not any(allergene in ricetta["ingredienti"] for allergene in allergie):
-                    ricette_filtrate.append(ricetta_id)
-            piano_filtrato[tipo_pasto] = ricette_filtrate
+            piano_filtrato[tipo_pasto] = [
+                ricetta_id for ricetta_id in ricette_ids
+                if ricetta_id not in ricette_con_allergeni
+            ]
         return piano_filtrato
 
+    @property
+    def path_piani_base(self) -> Path:
+        """Percorso del file JSON dei piani base"""
+        if self._path_piani_base is not None:
+            return Path(self._path_piani_base)
+        # Get the absolute path to the package directory
+        package_dir = Path(__file__).parent.parent.parent
+        return package_dir / "data" / "base_plans.json"
+
     @property
     def piani_base(self) -> Dict:
         """
         Carica i piani base dal file JSON
         """
         if not hasattr(self, '_piani_base'):
-            # Get the absolute path to the package directory
-            package_dir = Path(__file__).parent.parent.parent
-            path = package_dir / "data" / "base_plans.json"
+            path = self.path_piani_base
             
             try:
                 with open(path, "r", encoding="utf-8") as f:
@@ -130,3 +406,15 @@ class OrchestratoreAlimentare:
                 raise
                 
         return self._piani_base
+
+    def totali_piano_base(self, tipo_piano: str) -> TotaliPiano:
+        """
+        Copia dei totali del giorno campione di un piano base
+        
+        I totali di ogni piano base vengono calcolati una sola volta per
+        versione del catalogo.
+        """
+        chiave = (tipo_piano, self.db_ricette.versione)
+        if chiave not in self._totali_piani_base:
+            self._totali_piani_base[chiave] = TotaliPiano.da_piano(self.piani_base[tipo_piano], self.db_ricette)
+        return self._totali_piani_base[chiave].copia()
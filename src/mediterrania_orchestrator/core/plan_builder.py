@@ -0,0 +1,197 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from mediterrania_orchestrator.core.nutritional_verifier import (
+    NUTRIENTI_CON_RANGE, NUTRIENTI_VERIFICATI, RequisitiNutrizionali, VerificatoreNutrizionale
+)
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+from mediterrania_orchestrator.database.property_index import Filtro
+
+# Proprietà richiesta dalle ricette per ogni tipo di dieta
+PROPRIETA_DIETA = {"vegano": "vegano", "vegetariano": "vegetariano"}
+
+@dataclass
+class EsitoCostruzione:
+    piano: Dict[str, List[str]]
+    scelta: Dict[str, str]
+    totali: Dict[str, float]
+    violazione: float
+    esaustiva: bool
+    nodi_visitati: int
+    durata_ms: float
+    candidati_scartati: int = 0
+
+    @property
+    def bilanciato(self) -> bool:
+        return self.violazione == 0
+
+class CostruttorePiano:
+    """
+    Sceglie una ricetta per ogni pasto così che il giorno campione rispetti i requisiti
+
+    La ricerca è un branch-and-bound sui pasti: per ogni scelta parziale
+    calcola, con le somme minime e massime ottenibili dai pasti restanti,
+    un limite inferiore della violazione e scarta i rami che non possono
+    migliorare la soluzione migliore. Si ferma alla prima soluzione
+    bilanciata, a ricerca completata o allo scadere del budget di tempo,
+    restituendo comunque il piano migliore trovato.
+
+    Prima della ricerca `VerificatoreNutrizionale.candidati_ammissibili`
+    scarta, con le sole mezze porzioni precalcolate, i candidati che non
+    possono comparire in un giorno bilanciato: se nessun giorno risulta
+    bilanciato, il piano meno sbilanciato è quindi il migliore tra i
+    candidati ammissibili. Se un pasto resta senza candidati ammissibili
+    si cerca nel pool completo.
+    """
+
+    def __init__(self, db_ricette: DatabaseRicette, verificatore: VerificatoreNutrizionale,
+                 budget_ms: float = 50):
+        """
+        Args:
+            db_ricette: database delle ricette
+            verificatore: verificatore da cui ricavare i requisiti
+            budget_ms: tempo massimo di ricerca in millisecondi
+        """
+        self.db = db_ricette
+        self.verificatore = verificatore
+        self.budget_ms = budget_ms
+
+    def pool_candidati(self, piano: Dict[str, List[str]], ingredienti_esclusi: Iterable[str] = (),
+                       tipo_dieta: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        Candidati per ogni pasto: prima le ricette del piano, poi quelle del catalogo compatibili
+
+        Args:
+            piano: piano già personalizzato
+            ingredienti_esclusi: ingredienti che i candidati non devono contenere
+            tipo_dieta: dieta dell'utente ("vegano", "vegetariano", "nessuno")
+        """
+        vietate = self.db.get_ricette_con_ingredienti(ingredienti_esclusi)
+        pool = {}
+        for tipo_pasto, ricette in piano.items():
+            filtro = Filtro.tipo_pasto(tipo_pasto)
+            if tipo_dieta in PROPRIETA_DIETA:
+                filtro = filtro & Filtro.proprieta(PROPRIETA_DIETA[tipo_dieta])
+            candidati = dict.fromkeys(r for r in ricette if r in self.db.posizione_per_id)
+            candidati.update(dict.fromkeys(r for r in self.db.cerca_ricette(filtro) if r not in vietate))
+            pool[tipo_pasto] = list(candidati)
+        return pool
+
+    def costruisci(self, pool: Dict[str, List[str]], dati_utente: Dict,
+                   piano: Optional[Dict[str, List[str]]] = None,
+                   budget_ms: Optional[float] = None) -> EsitoCostruzione:
+        """
+        Cerca la combinazione di ricette con la violazione minima dei requisiti
+
+        Args:
+            pool: ricette candidate per tipo pasto
+            dati_utente: dati dal questionario utente
+            piano: piano di partenza; nel risultato la ricetta scelta diventa
+                la prima del suo pasto (default: il solo pool)
+            budget_ms: sovrascrive il budget di tempo del costruttore
+        """
+        inizio = time.perf_counter()
+        scadenza = inizio + (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        requisiti = self.verificatore.calcola_requisiti(dati_utente)
+        minimi, massimi, scala = self._limiti(requisiti)
+
+        # Le ricette assenti dal catalogo non sono candidati validi
+        completo = {tipo: [r for r in ricette if r in self.db.posizione_per_id] for tipo, ricette in pool.items()}
+        pool = {tipo: ricette for tipo, ricette in completo.items() if ricette}
+        posizioni = {tipo: np.array([self.db.posizione_per_id[r] for r in ricette]) for tipo, ricette in pool.items()}
+
+        candidati_scartati = 0
+        ammessi = self.verificatore.candidati_ammissibili(list(posizioni.values()), requisiti)
+        if all(maschera.any() for maschera in ammessi):
+            for (tipo, ricette), maschera in zip(list(pool.items()), ammessi):
+                candidati_scartati += int(len(maschera) - maschera.sum())
+                pool[tipo] = [r for r, ammessa in zip(ricette, maschera) if ammessa]
+                posizioni[tipo] = posizioni[tipo][maschera]
+
+        # Pasti con meno candidati per primi: l'albero si restringe prima
+        pasti = sorted(pool, key=lambda tipo: len(pool[tipo]))
+        vettori_ricette = self.verificatore.vettori_ricette()
+        vettori = [vettori_ricette[posizioni[tipo]] for tipo in pasti]
+        # Somme minime e massime ottenibili dai pasti da i in poi
+        min_resto = np.zeros((len(pasti) + 1, len(NUTRIENTI_VERIFICATI)))
+        max_resto = np.zeros((len(pasti) + 1, len(NUTRIENTI_VERIFICATI)))
+        for i in range(len(pasti) - 1, -1, -1):
+            min_resto[i] = min_resto[i + 1] + vettori[i].min(axis=0)
+            max_resto[i] = max_resto[i + 1] + vettori[i].max(axis=0)
+
+        migliore = {"violazione": np.inf, "scelta": [], "nodi": 0, "scaduto": False}
+        scelta: List[int] = []
+
+        def esplora(livello: int, parziale: np.ndarray):
+            if livello == len(pasti):
+                violazione = float(self._violazione(parziale, parziale, minimi, massimi, scala))
+                if violazione < migliore["violazione"]:
+                    migliore["violazione"] = violazione
+                    migliore["scelta"] = list(scelta)
+                return
+            somme = parziale + vettori[livello]
+            limiti = self._violazione(somme + min_resto[livello + 1], somme + max_resto[livello + 1],
+                                      minimi, massimi, scala)
+            for candidato in np.argsort(limiti, kind="stable"):
+                if limiti[candidato] >= migliore["violazione"] or migliore["violazione"] == 0:
+                    return
+                migliore["nodi"] += 1
+                if time.perf_counter() > scadenza and migliore["scelta"]:
+                    migliore["scaduto"] = True
+                    return
+                scelta.append(int(candidato))
+                esplora(livello + 1, somme[candidato])
+                scelta.pop()
+                if migliore["scaduto"]:
+                    return
+
+        esplora(0, np.zeros(len(NUTRIENTI_VERIFICATI)))
+
+        scelte = {tipo: pool[tipo][c] for tipo, c in zip(pasti, migliore["scelta"])}
+        totali = sum((vettori[i][c] for i, c in enumerate(migliore["scelta"])), np.zeros(len(NUTRIENTI_VERIFICATI)))
+        return EsitoCostruzione(
+            piano=self._componi_piano(piano if piano is not None else completo, scelte),
+            scelta=scelte,
+            totali=dict(zip(NUTRIENTI_VERIFICATI, totali.tolist())),
+            violazione=migliore["violazione"],
+            esaustiva=not migliore["scaduto"],
+            nodi_visitati=migliore["nodi"],
+            durata_ms=(time.perf_counter() - inizio) * 1000,
+            candidati_scartati=candidati_scartati
+        )
+
+    @staticmethod
+    def _limiti(requisiti: RequisitiNutrizionali):
+        """Minimi, massimi e scala di normalizzazione nell'ordine di NUTRIENTI_VERIFICATI"""
+        minimi = np.array([getattr(requisiti, f"{n}_min") for n in NUTRIENTI_CON_RANGE] + [requisiti.fibre_min])
+        massimi = np.array([getattr(requisiti, f"{n}_max") for n in NUTRIENTI_CON_RANGE] + [np.inf])
+        # Le distanze dal range sono relative al target, per le fibre al minimo
+        scala = np.append((minimi[:-1] + massimi[:-1]) / 2, requisiti.fibre_min)
+        return minimi, massimi, scala
+
+    @staticmethod
+    def _violazione(inferiori: np.ndarray, superiori: np.ndarray, minimi: np.ndarray,
+                    massimi: np.ndarray, scala: np.ndarray) -> np.ndarray:
+        """
+        Distanza relativa minima dai range per totali compresi tra `inferiori` e `superiori`
+
+        Con inferiori == superiori è la violazione esatta dei totali; è zero
+        se e solo se tutti i nutrienti rientrano nei requisiti.
+        """
+        sopra = np.maximum(inferiori - massimi, 0)
+        sotto = np.maximum(minimi - superiori, 0)
+        return ((sopra + sotto) / scala).sum(axis=-1)
+
+    @staticmethod
+    def _componi_piano(piano: Dict[str, List[str]], scelte: Dict[str, str]) -> Dict[str, List[str]]:
+        """Mette la ricetta scelta in testa al suo pasto, così da formare il giorno campione"""
+        composto = {}
+        for tipo_pasto, ricette in piano.items():
+            if tipo_pasto in scelte:
+                composto[tipo_pasto] = [scelte[tipo_pasto]] + [r for r in ricette if r != scelte[tipo_pasto]]
+            else:
+                composto[tipo_pasto] = list(ricette)
+        return composto
@@ -0,0 +1,94 @@
+from typing import TYPE_CHECKING, Dict, Optional
+
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette, NUTRIENTI
+
+if TYPE_CHECKING:
+    from mediterrania_orchestrator.core.substitution_handler import SostituzionePasto
+
+class TotaliPiano:
+    """
+    Totali nutrizionali del giorno campione di un piano, aggiornati in modo incrementale
+
+    Il giorno campione è lo stesso di `VerificatoreNutrizionale._calcola_totali_giornalieri`:
+    la prima ricetta di ogni tipo pasto. Ogni sostituzione aggiorna i totali
+    applicando il proprio vettore di delta, senza ricalcolare il piano.
+    """
+
+    def __init__(self, db_ricette: DatabaseRicette, campione: Dict[str, Optional[str]], valori: Dict[str, float]):
+        """
+        Args:
+            db_ricette: database delle ricette
+            campione: ricetta campione per tipo pasto
+            valori: totali correnti per nutriente
+        """
+        self.db = db_ricette
+        self.campione = campione
+        self.valori = valori
+
+    @classmethod
+    def da_piano(cls, piano: Dict, db_ricette: DatabaseRicette) -> "TotaliPiano":
+        """Calcola i totali del giorno campione di un piano"""
+        totali = cls(db_ricette, {}, dict.fromkeys(NUTRIENTI, 0.0))
+        for tipo_pasto, ricette in piano.items():
+            totali.campione[tipo_pasto] = None
+            totali.imposta_campione(tipo_pasto, ricette[0] if ricette else None)
+        return totali
+
+    def copia(self) -> "TotaliPiano":
+        """Copia indipendente, da aggiornare senza toccare l'originale"""
+        return TotaliPiano(self.db, dict(self.campione), dict(self.valori))
+
+    def applica(self, sostituzione: "SostituzionePasto") -> bool:
+        """
+        Applica i delta di una sostituzione se riguarda una ricetta campione
+
+        Returns:
+            True se i totali sono cambiati
+        """
+        if self.campione.get(sostituzione.tipo_pasto) != sostituzione.ricetta_originale:
+            return False
+        self._somma(sostituzione.delta_nutrienti, 1)
+        self.campione[sostituzione.tipo_pasto] = sostituzione.ricetta_sostitutiva
+        return True
+
+    def annulla(self, sostituzione: "SostituzionePasto") -> bool:
+        """
+        Annulla una sostituzione applicata in precedenza
+
+        Returns:
+            True se i totali sono cambiati
+        """
+        if self.campione.get(sostituzione.tipo_pasto) != sostituzione.ricetta_sostitutiva:
+            return False
+        self._somma(sostituzione.delta_nutrienti, -1)
+        self.campione[sostituzione.tipo_pasto] = sostituzione.ricetta_originale
+        return True
+
+    def imposta_campione(self, tipo_pasto: str, id_ricetta: Optional[str]):
+        """
+        Sostituisce la ricetta campione di un tipo pasto
+
+        Serve quando il campione cambia senza una sostituzione, ad esempio
+        se la prima ricetta viene rimossa per allergia.
+        """
+        attuale = self.campione.get(tipo_pasto)
+        if attuale == id_ricetta:
+            return
+        self._somma(self._vettore(attuale), -1)
+        self._somma(self._vettore(id_ricetta), 1)
+        self.campione[tipo_pasto] = id_ricetta
+
+    def come_dizionario(self) -> Dict[str, float]:
+        """Totali nel formato di `VerificatoreNutrizionale._calcola_totali_giornalieri`"""
+        return {nutriente: self.valori[nutriente] for nutriente in ("calorie", "proteine", "carboidrati", "grassi", "fibre")}
+
+    def _vettore(self, id_ricetta: Optional[str]) -> Dict[str, float]:
+        """Valori nutrizionali di una ricetta (vuoti se assente dal catalogo)"""
+        pos = self.db.posizione_per_id.get(id_ricetta)
+        if pos is None:
+            return {}
+        return dict(zip(NUTRIENTI, self.db.matrice_nutrienti[pos].tolist()))
+
+    def _somma(self, delta: Dict[str, float], segno: int):
+        for nutriente, valore in delta.items():
+            self.valori[nutriente] += segno * valore
@@ -0,0 +1,251 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+INTERATTIVA = "interattiva"
+BULK = "bulk"
+
+class LavoroScaduto(TimeoutError):
+    """Il lavoro non è stato avviato entro la sua scadenza ed è stato scartato"""
+
+@dataclass
+class ClassePriorita:
+    """
+    Classe di lavoro gestita dallo schedulatore
+
+    Attributes:
+        nome: nome usato per inviare i lavori della classe
+        peso: quota di avvii quando più classi hanno lavori in attesa
+        max_in_corso: lavori della classe in esecuzione contemporaneamente
+            (None = tutta la capacità)
+        scadenza: secondi entro cui un lavoro deve essere avviato, altrimenti
+            viene scartato (None = nessuna scadenza)
+        cedevole: la classe cede la capacità quando le classi non cedevoli
+            hanno lavori in attesa
+        max_in_corso_ceduto: lavori in esecuzione consentiti a una classe
+            cedevole mentre cede la capacità
+    """
+    nome: str
+    peso: float = 1.0
+    max_in_corso: Optional[int] = None
+    scadenza: Optional[float] = None
+    cedevole: bool = False
+    max_in_corso_ceduto: int = 1
+
+def classi_predefinite(scadenza_bulk: Optional[float] = None) -> List[ClassePriorita]:
+    """
+    Richieste interattive e rigenerazioni massive: quando entrambe attendono,
+    le interattive ottengono otto avvii su nove e i lavori bulk scendono a un
+    solo worker finché la coda interattiva non si svuota
+
+    Args:
+        scadenza_bulk: secondi oltre i quali un lavoro bulk non ancora avviato viene scartato
+    """
+    return [
+        ClassePriorita(INTERATTIVA, peso=8.0),
+        ClassePriorita(BULK, peso=1.0, scadenza=scadenza_bulk, cedevole=True),
+    ]
+
+@dataclass
+class _StatoClasse:
+    classe: ClassePriorita
+    coda: Deque[Tuple[Any, Future]] = field(default_factory=deque)
+    # Lavori in coda non ancora scartati per scadenza (la coda li rimuove solo in testa)
+    in_attesa: int = 0
+    in_corso: int = 0
+    # Tempo virtuale per la distribuzione pesata (stride scheduling)
+    virtuale: float = 0.0
+    avviati: int = 0
+    scartati: int = 0
+
+class SchedulatorePriorita:
+    """
+    Schedulatore a priorità davanti a un esecutore di lavori
+
+    I lavori attendono nella coda della propria classe e vengono passati a
+    `esegui` solo quando c'è capacità libera: così l'esecutore non accumula
+    lavori bulk davanti alle richieste interattive. Tra le classi con lavori
+    in attesa si avvia quella con il minor tempo virtuale, che avanza di
+    1/peso a ogni avvio; una classe rimasta inattiva riparte dal tempo
+    virtuale corrente invece di recuperare gli avvii persi.
+
+    I lavori con una scadenza superata vengono scartati a ogni
+    distribuzione, in qualunque punto della coda si trovino, e il loro
+    futuro fallisce con `LavoroScaduto`.
+    """
+
+    def __init__(self, esegui: Callable[[Any], Future], capacita: int,
+                 classi: Optional[List[ClassePriorita]] = None,
+                 orologio: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            esegui: funzione che avvia un lavoro e ne restituisce il Future
+            capacita: lavori in esecuzione contemporaneamente (es. numero di worker)
+            classi: classi di priorità (default: `classi_predefinite()`)
+            orologio: funzione che restituisce il tempo corrente in secondi
+        """
+        if capacita <= 0:
+            raise ValueError("capacita deve essere positiva")
+        classi = classi if classi is not None else classi_predefinite()
+        if not classi:
+            raise ValueError("Serve almeno una classe di priorità")
+        for classe in classi:
+            if classe.peso <= 0:
+                raise ValueError(f"Il peso della classe {classe.nome} deve essere positivo")
+        self._esegui = esegui
+        self.capacita = capacita
+        self._orologio = orologio
+        self._stati: Dict[str, _StatoClasse] = {classe.nome: _StatoClasse(classe) for classe in classi}
+        self._virtuale = 0.0
+        self._in_corso = 0
+        # Min-heap (scadenza, progressivo, stato, futuro) dei lavori con scadenza
+        self._scadenze: List[Tuple[float, int, _StatoClasse, Future]] = []
+        self._progressivo = itertools.count()
+        self._lock = threading.Lock()
+        self._chiuso = False
+
+    @property
+    def classi(self) -> List[str]:
+        return list(self._stati)
+
+    def invia(self, lavoro: Any, classe: str = INTERATTIVA, scadenza: Optional[float] = None) -> Future:
+        """
+        Accoda un lavoro nella sua classe e lo avvia appena possibile
+
+        Args:
+            lavoro: argomento passato a `esegui`
+            classe: nome della classe di priorità
+            scadenza: secondi entro cui il lavoro deve essere avviato
+                (default: scadenza della classe)
+
+        Returns:
+            Future con il risultato di `esegui`; annullarlo prima dell'avvio
+            toglie il lavoro dalla coda
+        """
+        stato = self._stati.get(classe)
+        if stato is None:
+            raise KeyError(f"Classe di priorità sconosciuta: {classe}")
+        scadenza = scadenza if scadenza is not None else stato.classe.scadenza
+        futuro = Future()
+        with self._lock:
+            if self._chiuso:
+                raise RuntimeError("Schedulatore chiuso")
+            if not stato.in_attesa and stato.in_corso == 0:
+                stato.virtuale = max(stato.virtuale, self._virtuale)
+            stato.coda.append((lavoro, futuro))
+            stato.in_attesa += 1
+            if scadenza is not None:
+                heapq.heappush(self._scadenze, (self._orologio() + scadenza, next(self._progressivo), stato, futuro))
+        self._distribuisci()
+        return futuro
+
+    def _limite(self, stato: _StatoClasse, pressione: bool) -> int:
+        limite = stato.classe.max_in_corso or self.capacita
+        if pressione and stato.classe.cedevole:
+            limite = min(limite, stato.classe.max_in_corso_ceduto)
+        return limite
+
+    def _prossimo(self) -> Optional[Tuple[_StatoClasse, Any, Future]]:
+        """Estrae il prossimo lavoro da avviare (da chiamare con il lock acquisito)"""
+        self._scarta_scaduti(self._orologio())
+        while self._in_corso < self.capacita:
+            # Le classi cedevoli si fanno da parte finché le altre hanno lavori in attesa
+            pressione = any(s.in_attesa for s in self._stati.values() if not s.classe.cedevole)
+            candidati = [s for s in self._stati.values() if s.in_attesa and s.in_corso < self._limite(s, pressione)]
+            if not candidati:
+                return None
+            stato = min(candidati, key=lambda s: s.virtuale)
+            lavoro, futuro = stato.coda.popleft()
+            if futuro.done() and not futuro.cancelled():
+                # Già scartato per scadenza
+                continue
+            stato.in_attesa -= 1
+            if not futuro.set_running_or_notify_cancel():
+                continue
+            self._virtuale = stato.virtuale
+            stato.virtuale += 1.0 / stato.classe.peso
+            stato.in_corso += 1
+            stato.avviati += 1
+            self._in_corso += 1
+            return stato, lavoro, futuro
+        return None
+
+    def _scarta_scaduti(self, adesso: float):
+        """
+        Fa fallire i lavori in coda con la scadenza superata (da chiamare con il lock acquisito)
+
+        Restano nella coda della classe e vengono saltati quando arrivano in testa.
+        """
+        while self._scadenze and self._scadenze[0][0] <= adesso:
+            _, _, stato, futuro = heapq.heappop(self._scadenze)
+            # Già avviato o annullato dal chiamante
+            if futuro.done() or futuro.running():
+                continue
+            if futuro.set_running_or_notify_cancel():
+                stato.in_attesa -= 1
+                stato.scartati += 1
+                futuro.set_exception(LavoroScaduto(f"Lavoro {stato.classe.nome} scaduto prima dell'avvio"))
+        for stato in self._stati.values():
+            if not stato.in_attesa:
+                stato.coda.clear()
+
+    def _distribuisci(self):
+        """Avvia i lavori in attesa finché c'è capacità"""
+        while True:
+            with self._lock:
+                prossimo = self._prossimo()
+            if prossimo is None:
+                return
+            stato, lavoro, futuro = prossimo
+            try:
+                interno = self._esegui(lavoro)
+            except Exception as e:
+                self._completato(stato)
+                futuro.set_exception(e)
+                continue
+            interno.add_done_callback(lambda interno, stato=stato, futuro=futuro: self._inoltra(stato, interno, futuro))
+
+    def _inoltra(self, stato: _StatoClasse, interno: Future, futuro: Future):
+        self._completato(stato)
+        if interno.cancelled():
+            futuro.set_exception(RuntimeError("Lavoro annullato dall'esecutore"))
+        elif interno.exception() is not None:
+            futuro.set_exception(interno.exception())
+        else:
+            futuro.set_result(interno.result())
+        self._distribuisci()
+
+    def _completato(self, stato: _StatoClasse):
+        with self._lock:
+            stato.in_corso -= 1
+            self._in_corso -= 1
+
+    def chiudi(self):
+        """Rifiuta i nuovi lavori e annulla quelli ancora in coda"""
+        with self._lock:
+            self._chiuso = True
+            in_coda = [futuro for stato in self._stati.values() for _, futuro in stato.coda]
+            for stato in self._stati.values():
+                stato.coda.clear()
+                stato.in_attesa = 0
+            self._scadenze.clear()
+        for futuro in in_coda:
+            futuro.cancel()
+
+    def statistiche(self) -> Dict[str, Dict[str, int]]:
+        """Lavori in coda, in esecuzione, avviati e scartati per ogni classe"""
+        with self._lock:
+            return {
+                nome: {
+                    "in_coda": stato.in_attesa,
+                    "in_corso": stato.in_corso,
+                    "avviati": stato.avviati,
+                    "scartati": stato.scartati
+                }
+                for nome, stato in self._stati.items()
+            }
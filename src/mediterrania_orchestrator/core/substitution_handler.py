@@ -1,7 +1,17 @@
-from typing import Dict, List, Set, Optional
-from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set, Optional, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime
-from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+
+import numpy as np
+
+from mediterrania_orchestrator.cache.memory_cache import CacheLRU
+from mediterrania_orchestrator.core.plan_totals import TotaliPiano
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette, NUTRIENTI
+from mediterrania_orchestrator.database.ingredient_index import normalizza_ingrediente
+from mediterrania_orchestrator.database.substitution_graph import GrafoSostituzioni, path_grafo_predefinito
+
+# Segnaposto in cache per le ricerche senza sostituto
+_NESSUNA_SOSTITUZIONE = object()
 
 @dataclass
 class SostituzionePasto:
@@ -9,11 +19,24 @@ class SostituzionePasto:
     ricetta_sostitutiva: str
     motivo: str
     valore_nutrizionale_delta: float
+    # Variazione con segno (sostitutiva - originale) per ogni nutriente
+    delta_nutrienti: Dict[str, float] = field(default_factory=dict)
+    tipo_pasto: Optional[str] = None
 
 class GestoreSostituzioni:
-    def __init__(self, db_ricette: DatabaseRicette):
+    def __init__(self, db_ricette: DatabaseRicette, dimensione_cache: int = 4096, path_grafo: Optional[str] = None):
+        """
+        Args:
+            db_ricette: database delle ricette
+            dimensione_cache: numero massimo di sostituzioni memorizzate
+            path_grafo: grafo k-NN precalcolato (default: accanto a ricette.json)
+        """
         self.db = db_ricette
         self.stagione_corrente = self._determina_stagione()
+        self.cache_sostituzioni = CacheLRU(dimensione_cache)
+        self._versione_cache = self.db.versione
+        # Senza un grafo valido per il catalogo corrente si usa la ricerca completa
+        self.grafo = GrafoSostituzioni.carica(path_grafo or path_grafo_predefinito(self.db), self.db.versione)
         
     def _determina_stagione(self) -> str:
         """Determina la stagione corrente"""
@@ -27,6 +50,72 @@ class GestoreSostituzioni:
         else:
             return "autunno"
             
+    def personalizza_piano(self, piano: Dict, allergie: Iterable[str] = (), verdure_escluse: Iterable[str] = (),
+                           preferenza_latte: Optional[str] = None,
+                           totali: Optional[TotaliPiano] = None) -> Tuple[Dict, List[SostituzionePasto]]:
+        """
+        Applica allergie, verdure escluse e preferenza latte in un solo passaggio
+        
+        Ogni ricetta viene valutata una sola volta rispetto a tutti i vincoli.
+        Le ricette con allergeni vengono rimosse; quelle con verdure escluse
+        o latte vengono sostituite da un'unica ricetta che rispetta tutti i
+        vincoli insieme, senza sostituzioni a catena.
+        
+        Args:
+            piano: piano alimentare corrente
+            allergie: ingredienti a cui l'utente è allergico
+            verdure_escluse: verdure da escludere
+            preferenza_latte: tipo di latte vegetale preferito (None = nessun vincolo)
+            totali: totali del piano di partenza, aggiornati sul posto con i
+                delta delle sostituzioni
+        """
+        allergie = list(allergie or [])
+        verdure_escluse = list(verdure_escluse or [])
+        ingredienti_da_sostituire = verdure_escluse + (["latte"] if preferenza_latte else [])
+        
+        ricette_con_allergeni = self.db.get_ricette_con_ingredienti(allergie)
+        ricette_con_verdure = self.db.get_ricette_con_ingredienti(verdure_escluse)
+        ricette_con_latte = self.db.get_ricette_con_ingredienti(["latte"]) if preferenza_latte else set()
+        
+        # Il sostituto non deve contenere nessuno degli ingredienti vietati
+        esclusi = frozenset(normalizza_ingrediente(i) for i in allergie + ingredienti_da_sostituire)
+        preferiti = (f"latte di {preferenza_latte}", preferenza_latte, "latte vegetale") if preferenza_latte else ()
+        
+        piano_modificato = {}
+        sostituzioni = []
+        for tipo_pasto, ricette in piano.items():
+            ricette_personalizzate = []
+            for id_ricetta in ricette:
+                if id_ricetta not in self.db.posizione_per_id or id_ricetta in ricette_con_allergeni:
+                    continue
+                    
+                motivi = []
+                if id_ricetta in ricette_con_verdure:
+                    motivi.append("Sostituzione per verdure escluse")
+                if id_ricetta in ricette_con_latte:
+                    motivi.append(f"Sostituzione latte con alternativa: {preferenza_latte}")
+                if not motivi:
+                    ricette_personalizzate.append(id_ricetta)
+                    continue
+                    
+                preferiti_ricetta = preferiti if id_ricetta in ricette_con_latte else ()
+                chiave = ("piano", id_ricetta, esclusi, preferiti_ricetta, tipo_pasto)
+                sostituzione = self._memoizza(chiave, lambda: self._crea_sostituzione(
+                    id_ricetta, esclusi, tipo_pasto, "; ".join(motivi), preferiti_ricetta
+                ))
+                if sostituzione:
+                    ricette_personalizzate.append(sostituzione.ricetta_sostitutiva)
+                    sostituzioni.append(sostituzione)
+                    if totali is not None:
+                        totali.applica(sostituzione)
+                    
+            piano_modificato[tipo_pasto] = ricette_personalizzate
+            if totali is not None:
+                # Se la ricetta campione è stata rimossa il campione passa alla successiva
+                totali.imposta_campione(tipo_pasto, ricette_personalizzate[0] if ricette_personalizzate else None)
+            
+        return piano_modificato, sostituzioni
+
     def sostituisci_verdure(self, piano: Dict, verdure_escluse: Set[str]) -> Dict:
         """
         Sostituisce le ricette che contengono verdure escluse
@@ -38,6 +127,8 @@ class GestoreSostituzioni:
         piano_modificato = {}
         sostituzioni = []
         
+        ricette_escluse = self.db.get_ricette_con_ingredienti(verdure_escluse)
+        
         for tipo_pasto, ricette in piano.items():
             ricette_sostituite = []
             for id_ricetta in ricette:
@@ -45,12 +136,9 @@ class GestoreSostituzioni:
                 
                 if ricetta is None:
                     continue  # Skip recipes that don't exist
-                    
-                # Get ingredient names from the ingredients list
-                ingredienti = [ing["nome"] for ing in ricetta["ingredienti"]]
                 
                 # Controlla se la ricetta contiene verdure escluse
-                if any(verdura in ingredienti for verdura in verdure_escluse):
+                if id_ricetta in ricette_escluse:
                     # Trova una ricetta sostitutiva
                     sostituzione = self._trova_sostituzione_ricetta(
                         ricetta,
@@ -77,14 +165,14 @@ class GestoreSostituzioni:
         """
         piano_modificato = {}
         sostituzioni = []
+        ricette_con_latte = self.db.get_ricette_con_ingredienti(["latte"])
         
         for tipo_pasto, ricette in piano.items():
             ricette_sostituite = []
             for id_ricetta in ricette:
-                ricetta = self.db.get_ricetta_by_id(id_ricetta)
-                
                 # Controlla se la ricetta contiene latte
-                if "latte" in [ing["nome"] for ing in ricetta["ingredienti"]]:
+                if id_ricetta in ricette_con_latte:
+                    ricetta = self.db.get_ricetta_by_id(id_ricetta)
                     # Trova una ricetta sostitutiva
                     sostituzione = self._trova_sostituzione_latte(
                         ricetta,
@@ -103,30 +191,121 @@ class GestoreSostituzioni:
         
     def _trova_sostituzione_ricetta(self, ricetta: Dict, verdure_escluse: Set[str], tipo_pasto: str) -> Optional[SostituzionePasto]:
         """Trova una ricetta sostitutiva compatibile"""
-        ricette_compatibili = []
-        
-        for id_ricetta, candidato in self.db.ricette_per_id.items():
-            ingredienti_candidato = [ing["nome"] for ing in candidato["ingredienti"]]
-            if (candidato["id_pasto"].startswith(tipo_pasto) and
-                not any(verdura in ingredienti_candidato for verdura in verdure_escluse) and
-                self._valori_nutrizionali_simili(ricetta, candidato)):
-                ricette_compatibili.append(candidato)
-                
-        if ricette_compatibili:
-            # Sceglie la ricetta più simile nutrizionalmente
-            sostituto = min(ricette_compatibili, 
-                        key=lambda x: abs(x["valori_nutrizionali"]["calorie"] - 
-                                        ricetta["valori_nutrizionali"]["calorie"]))
-                                        
-            return SostituzionePasto(
-                ricetta_originale=ricetta["id_pasto"],
-                ricetta_sostitutiva=sostituto["id_pasto"],
-                motivo="Sostituzione per verdure escluse",
-                valore_nutrizionale_delta=abs(sostituto["valori_nutrizionali"]["calorie"] - 
-                                            ricetta["valori_nutrizionali"]["calorie"])
+        chiave = ("verdure", ricetta["id_pasto"],
+                  frozenset(normalizza_ingrediente(v) for v in verdure_escluse), tipo_pasto)
+        return self._memoizza(chiave, lambda: self._crea_sostituzione(
+            ricetta["id_pasto"], verdure_escluse, tipo_pasto, motivo="Sostituzione per verdure escluse"
+        ))
+
+    def _trova_sostituzione_latte(self, ricetta: Dict, preferenza_latte: str, tipo_pasto: str) -> Optional[SostituzionePasto]:
+        """Trova una ricetta senza latte, preferendo quelle con il latte vegetale scelto"""
+        chiave = ("latte", ricetta["id_pasto"], normalizza_ingrediente(preferenza_latte), tipo_pasto)
+        return self._memoizza(chiave, lambda: self._crea_sostituzione(
+            ricetta["id_pasto"], ["latte"], tipo_pasto,
+            motivo=f"Sostituzione latte con alternativa: {preferenza_latte}",
+            preferiti=[f"latte di {preferenza_latte}", preferenza_latte, "latte vegetale"]
+        ))
+
+    def _memoizza(self, chiave: tuple, cerca) -> Optional[SostituzionePasto]:
+        """
+        Restituisce la sostituzione memorizzata per la chiave o la calcola
+        
+        Anche l'assenza di un sostituto viene memorizzata. La cache viene
+        svuotata quando cambia la versione del catalogo.
+        """
+        if self.db.versione != self._versione_cache:
+            self.cache_sostituzioni.svuota()
+            self._versione_cache = self.db.versione
+            
+        sostituzione = self.cache_sostituzioni.recupera(chiave)
+        if sostituzione is None:
+            sostituzione = cerca()
+            self.cache_sostituzioni.salva(
+                chiave, sostituzione if sostituzione is not None else _NESSUNA_SOSTITUZIONE
             )
+        return None if sostituzione is _NESSUNA_SOSTITUZIONE else sostituzione
+
+    def _crea_sostituzione(self, id_ricetta: str, ingredienti_esclusi: Iterable[str], tipo_pasto: str,
+                           motivo: str, preferiti: Iterable[str] = ()) -> Optional[SostituzionePasto]:
+        """
+        Cerca la ricetta dello stesso tipo pasto più simile nutrizionalmente
+        
+        Args:
+            id_ricetta: ID della ricetta da sostituire
+            ingredienti_esclusi: ingredienti che il sostituto non deve contenere
+            tipo_pasto: tipo pasto della ricetta
+            motivo: motivo della sostituzione
+            preferiti: ingredienti che, se presenti, rendono un candidato preferibile
+        """
+        colonne = self.db.matrice_nutrienti
+        pos_originale = self.db.posizione_per_id[id_ricetta]
+        riferimento = colonne[pos_originale]
         
-        return None
+        sostituto = self._sostituto_da_grafo(id_ricetta, ingredienti_esclusi, tipo_pasto, preferiti)
+        if sostituto is not None:
+            return self._nuova_sostituzione(id_ricetta, self.db.posizione_per_id[sostituto], tipo_pasto, motivo)
+            
+        # Filtro vettoriale: stesso tipo pasto, senza ingredienti esclusi e valori nutrizionali simili
+        maschera = (self.db.codici_tipo_pasto == self.db.codice_tipo_pasto(tipo_pasto)) & \
+            ~self.db.maschera_ricette(self.db.get_ricette_con_ingredienti(ingredienti_esclusi)) & \
+            self._maschera_valori_simili(riferimento)
+        maschera[pos_originale] = False
+        if preferiti:
+            maschera_preferiti = maschera & self.db.maschera_ricette(self.db.get_ricette_con_ingredienti(preferiti))
+            if maschera_preferiti.any():
+                maschera = maschera_preferiti
+        candidati = np.flatnonzero(maschera)
+        if candidati.size == 0:
+            return None
+            
+        # Sceglie la ricetta più simile nutrizionalmente
+        delta_calorie = np.abs(colonne[candidati, 0] - riferimento[0])
+        pos = candidati[np.argmin(delta_calorie)]
+        
+        return self._nuova_sostituzione(id_ricetta, pos, tipo_pasto, motivo)
+
+    def _nuova_sostituzione(self, id_ricetta: str, pos_sostituto: int, tipo_pasto: str,
+                            motivo: str) -> SostituzionePasto:
+        """Crea la sostituzione con il vettore completo delle variazioni nutrizionali"""
+        delta = self.db.matrice_nutrienti[pos_sostituto] - self.db.matrice_nutrienti[self.db.posizione_per_id[id_ricetta]]
+        return SostituzionePasto(
+            ricetta_originale=id_ricetta,
+            ricetta_sostitutiva=self.db.ids[pos_sostituto],
+            motivo=motivo,
+            valore_nutrizionale_delta=float(abs(delta[0])),
+            delta_nutrienti=dict(zip(NUTRIENTI, delta.tolist())),
+            tipo_pasto=tipo_pasto
+        )
+
+    def _sostituto_da_grafo(self, id_ricetta: str, ingredienti_esclusi: Iterable[str], tipo_pasto: str,
+                            preferiti: Iterable[str] = ()) -> Optional[str]:
+        """
+        Cerca il sostituto tra i vicini precalcolati della ricetta
+        
+        Restituisce None quando il grafo non è utilizzabile o nessuno dei
+        vicini è valido: in quel caso serve la ricerca sull'intero catalogo.
+        """
+        if self.grafo is None or self.grafo.versione_catalogo != self.db.versione:
+            return None
+        pos = self.db.posizione_per_id[id_ricetta]
+        if self.db.codici_tipo_pasto[pos] != self.db.codice_tipo_pasto(tipo_pasto):
+            return None
+            
+        indice = self.db.indice_ingredienti
+        validi = (v for v in self.grafo.vicini.get(id_ricetta, []) if not indice.contiene(v, ingredienti_esclusi))
+        if not preferiti:
+            return next(validi, None)
+        return next((v for v in validi if indice.contiene(v, preferiti)), None)
+
+    def _maschera_valori_simili(self, riferimento: np.ndarray, threshold: float = 0.2) -> np.ndarray:
+        """
+        Versione vettoriale di `_valori_nutrizionali_simili` su tutto il catalogo
+        
+        Confronta calorie, proteine, carboidrati e grassi di ogni ricetta
+        con quelli della ricetta di riferimento.
+        """
+        macro = self.db.matrice_nutrienti[:, :4]
+        return np.all(np.abs(macro - riferimento[:4]) <= threshold * riferimento[:4], axis=1)
         
     def _valori_nutrizionali_simili(self, ricetta1: Dict, ricetta2: Dict, threshold: float = 0.2) -> bool:
         """Verifica se i valori nutrizionali di due ricette sono simili"""
@@ -0,0 +1,80 @@
+import gc
+import hashlib
+import json
+import os
+import pickle
+import struct
+from typing import Dict, Optional
+
+# Intestazione: magic, lunghezza dei metadati JSON, metadati, payload pickle
+MAGIC = b"MEDSNAP1"
+VERSIONE_FORMATO = 4
+
+def scrivi_snapshot(path: str, stato: Dict, path_sorgente: str, versione: str):
+    """
+    Scrive lo snapshot binario del catalogo già indicizzato
+    
+    Args:
+        path: file di destinazione
+        stato: attributi del database da ripristinare al caricamento
+        path_sorgente: file JSON da cui è stato costruito lo stato
+        versione: hash del contenuto del file sorgente
+    """
+    info = os.stat(path_sorgente)
+    metadati = json.dumps({
+        "formato": VERSIONE_FORMATO,
+        "versione": versione,
+        "dimensione_sorgente": info.st_size,
+        "mtime_sorgente": info.st_mtime_ns
+    }).encode("utf-8")
+    payload = pickle.dumps(stato, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Scrittura atomica: i processi concorrenti vedono il vecchio o il nuovo file
+    temporaneo = f"{path}.{os.getpid()}.tmp"
+    with open(temporaneo, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(metadati)) + metadati + payload)
+    os.replace(temporaneo, path)
+
+def leggi_snapshot(path: str, path_sorgente: str) -> Optional[Dict]:
+    """
+    Legge lo snapshot se è ancora valido per il file sorgente
+    
+    Lo snapshot è valido se dimensione e mtime del sorgente coincidono
+    con quelli registrati o, in alternativa, se coincide l'hash del
+    contenuto. Restituisce None se lo snapshot manca, è corrotto o è
+    obsoleto. Il payload è un pickle: caricare solo snapshot generati
+    localmente.
+    """
+    try:
+        with open(path, "rb") as f:
+            contenuto = f.read()
+    except FileNotFoundError:
+        return None
+
+    inizio_metadati = len(MAGIC) + 4
+    if len(contenuto) < inizio_metadati or not contenuto.startswith(MAGIC):
+        return None
+    (lunghezza,) = struct.unpack_from("<I", contenuto, len(MAGIC))
+    try:
+        metadati = json.loads(contenuto[inizio_metadati:inizio_metadati + lunghezza])
+    except ValueError:
+        return None
+    if metadati.get("formato") != VERSIONE_FORMATO:
+        return None
+
+    info = os.stat(path_sorgente)
+    if (info.st_size, info.st_mtime_ns) != (metadati["dimensione_sorgente"], metadati["mtime_sorgente"]):
+        with open(path_sorgente, "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() != metadati["versione"]:
+                return None
+
+    # Il garbage collector rallenta molto la creazione di milioni di oggetti
+    gc_attivo = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.loads(memoryview(contenuto)[inizio_metadati + lunghezza:])
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    finally:
+        if gc_attivo:
+            gc.enable()
@@ -1,14 +1,41 @@
+import hashlib
 import json
 import os
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from mediterrania_orchestrator.database.catalog_snapshot import leggi_snapshot, scrivi_snapshot
+from mediterrania_orchestrator.database.ingredient_index import IndiceIngredienti
+from mediterrania_orchestrator.database.property_index import Filtro, IndiceProprieta
+from mediterrania_orchestrator.database.recipe_tags import EtichetteRicette
+from mediterrania_orchestrator.utils.metrics import cronometrato
+from mediterrania_orchestrator.database.shared_catalog import (
+    CatalogoCondiviso, IndiceIngredientiCondiviso, RicetteCondivise, SezioneCondivisa
+)
+
+# Sezioni del catalogo, nell'ordine usato per i codici tipo pasto
+TIPI_PASTO = ("colazioni", "pranzi", "cene", "spuntini")
+
+# Colonne della matrice nutrizionale
+NUTRIENTI = ("calorie", "proteine", "carboidrati", "grassi", "fibre", "sodio")
+
+# Attributi ripristinati dallo snapshot binario del catalogo
+_ATTRIBUTI_SNAPSHOT = (
+    "versione", "ricette", "ricette_per_id", "_tipo_pasto_per_id", "ids", "codici_tipo_pasto",
+    "matrice_nutrienti", "posizione_per_id", "indice_ingredienti", "indice_proprieta", "etichette"
+)
 
 class DatabaseRicette:
-    def __init__(self, path_ricette: str = None):
+    def __init__(self, path_ricette: str = None, usa_snapshot: bool = False, path_snapshot: str = None):
         """
         Inizializza il database delle ricette
         
         Args:
             path_ricette: percorso del file JSON delle ricette
+            usa_snapshot: carica il catalogo già indicizzato dallo snapshot binario,
+                rigenerandolo se manca o è obsoleto
+            path_snapshot: percorso dello snapshot (default: accanto al file JSON)
         """
         if path_ricette is None:
             # Get the directory containing this file
@@ -18,48 +45,163 @@ class DatabaseRicette:
             # Construct path to ricette.json in the data directory
             path_ricette = os.path.join(package_root, 'data', 'ricette.json')
             
-        self.ricette = self._carica_ricette(path_ricette)
+        self.path_ricette = path_ricette
+        self.usa_snapshot = usa_snapshot
+        self.path_snapshot = path_snapshot or path_ricette + ".snapshot"
+        self.ricarica()
+
+    @cronometrato("db_durata_secondi", operazione="ricarica")
+    def ricarica(self):
+        """
+        Ricarica il catalogo dal file JSON e ricostruisce gli indici
+        
+        `versione` cambia quando cambia il contenuto del file, così che le
+        cache basate sul catalogo possano invalidare i propri elementi.
+        """
+        if self.usa_snapshot:
+            stato = leggi_snapshot(self.path_snapshot, self.path_ricette)
+            if stato is not None:
+                self.__dict__.update(stato)
+                return
+                
+        self._costruisci_da_json()
+        
+        if self.usa_snapshot:
+            try:
+                scrivi_snapshot(
+                    self.path_snapshot,
+                    {nome: getattr(self, nome) for nome in _ATTRIBUTI_SNAPSHOT},
+                    self.path_ricette,
+                    self.versione
+                )
+            except OSError:
+                # Lo snapshot è solo un'ottimizzazione: il catalogo è già caricato
+                pass
+
+    @classmethod
+    def da_catalogo_condiviso(cls, catalogo: CatalogoCondiviso) -> "DatabaseRicette":
+        """
+        Crea un database che legge il catalogo da un `CatalogoCondiviso`
+        
+        Colonne, maschere e indice ingredienti restano nel segmento
+        condiviso; le ricette vengono decodificate a ogni accesso. Il
+        database va eliminato prima di chiudere il segmento.
+        
+        Args:
+            catalogo: segmento creato con `CatalogoCondiviso.crea` o `collega`
+        """
+        db = cls.__new__(cls)
+        db.path_ricette = catalogo.metadati["path_ricette"]
+        db.usa_snapshot = False
+        db.path_snapshot = db.path_ricette + ".snapshot"
+        db.versione = catalogo.metadati["versione"]
+        db.matrice_nutrienti = catalogo.array["matrice_nutrienti"]
+        db.codici_tipo_pasto = catalogo.array["codici_tipo_pasto"]
+        db.ids = np.array(catalogo.stringhe("ids"), dtype=object)
+        db.posizione_per_id = {id_ricetta: pos for pos, id_ricetta in enumerate(db.ids)}
+        db.ricette_per_id = RicetteCondivise(catalogo, db.posizione_per_id)
+        db.ricette = {"metadata": catalogo.metadati["metadata"]}
+        for codice, tipo_pasto in enumerate(TIPI_PASTO):
+            db.ricette[tipo_pasto] = SezioneCondivisa(
+                db.ricette_per_id, db.ids[db.codici_tipo_pasto == codice].tolist()
+            )
+        db._tipo_pasto_per_id = None
+        db.indice_ingredienti = IndiceIngredientiCondiviso(catalogo, db.ids, db.posizione_per_id)
+        db.indice_proprieta = IndiceProprieta.da_maschere(
+            catalogo.array["maschere_proprieta"],
+            {(tipo, nome): bit for tipo, nome, bit in catalogo.metadati["bit_proprieta"]}
+        )
+        db.etichette = EtichetteRicette.da_matrice(db.matrice_nutrienti, NUTRIENTI)
+        return db
+
+    def _costruisci_da_json(self):
+        """Legge il file JSON e costruisce indici e colonne"""
+        self.ricette = self._carica_ricette(self.path_ricette)
         self.ricette_per_id = self._indicizza_ricette()
+        self._costruisci_colonne()
+        self.indice_ingredienti = IndiceIngredienti(self.ricette_per_id)
+        self.indice_proprieta = IndiceProprieta(self.ricette_per_id, self._tipo_pasto_per_id)
+        self.etichette = EtichetteRicette.da_matrice(self.matrice_nutrienti, NUTRIENTI)
         
     def _carica_ricette(self, path: str) -> Dict:
         """Carica il database delle ricette dal file JSON"""
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(path, 'rb') as f:
+                contenuto = f.read()
         except FileNotFoundError:
             raise FileNotFoundError(f"File ricette.json non trovato in: {path}")
+        self.versione = hashlib.sha256(contenuto).hexdigest()
+        return json.loads(contenuto.decode('utf-8'))
             
     def _indicizza_ricette(self) -> Dict:
         """Crea un dizionario di ricette indicizzato per ID"""
         ricette_indicizzate = {}
+        self._tipo_pasto_per_id = {}
         
-        # Indicizza colazioni
-        for ricetta in self.ricette["colazioni"]:
-            ricette_indicizzate[ricetta["id_pasto"]] = ricetta
-            
-        # Indicizza pranzi
-        for ricetta in self.ricette["pranzi"]:
-            ricette_indicizzate[ricetta["id_pasto"]] = ricetta
-            
-        # Indicizza cene
-        for ricetta in self.ricette["cene"]:
-            ricette_indicizzate[ricetta["id_pasto"]] = ricetta
-            
-        # Indicizza spuntini
-        for ricetta in self.ricette["spuntini"]:
-            ricette_indicizzate[ricetta["id_pasto"]] = ricetta
+        # Indicizza colazioni, pranzi, cene e spuntini
+        for tipo_pasto in TIPI_PASTO:
+            for ricetta in self.ricette[tipo_pasto]:
+                ricette_indicizzate[ricetta["id_pasto"]] = ricetta
+                self._tipo_pasto_per_id[ricetta["id_pasto"]] = tipo_pasto
             
         return ricette_indicizzate
+
+    def _costruisci_colonne(self):
+        """
+        Crea la rappresentazione colonnare del catalogo
         
+        Le righe di `matrice_nutrienti`, `ids` e `codici_tipo_pasto` sono
+        allineate e seguono l'ordine di `ricette_per_id`.
+        """
+        n = len(self.ricette_per_id)
+        self.ids = np.empty(n, dtype=object)
+        self.codici_tipo_pasto = np.empty(n, dtype=np.int8)
+        self.matrice_nutrienti = np.zeros((n, len(NUTRIENTI)), dtype=np.float64)
+        self.posizione_per_id = {}
+
+        for pos, (id_ricetta, ricetta) in enumerate(self.ricette_per_id.items()):
+            valori = ricetta["valori_nutrizionali"]
+            self.ids[pos] = id_ricetta
+            self.codici_tipo_pasto[pos] = TIPI_PASTO.index(self._tipo_pasto_per_id[id_ricetta])
+            self.matrice_nutrienti[pos] = [valori.get(nutriente, 0) for nutriente in NUTRIENTI]
+            self.posizione_per_id[id_ricetta] = pos
+
+    def codice_tipo_pasto(self, tipo_pasto: str) -> int:
+        """Restituisce il codice numerico di un tipo pasto, -1 se sconosciuto"""
+        try:
+            return TIPI_PASTO.index(tipo_pasto)
+        except ValueError:
+            return -1
+        
+    @cronometrato("db_durata_secondi", operazione="get_ricette_con_ingredienti")
+    def get_ricette_con_ingredienti(self, ingredienti: Iterable[str]) -> Set[str]:
+        """Recupera gli ID delle ricette che contengono almeno uno degli ingredienti"""
+        return self.indice_ingredienti.ricette_con(ingredienti)
+
+    @cronometrato("db_durata_secondi", operazione="maschera_ricette")
+    def maschera_ricette(self, ids_ricette: Iterable[str]) -> np.ndarray:
+        """Converte un insieme di ID in una maschera booleana allineata a `ids`"""
+        maschera = np.zeros(len(self.ids), dtype=bool)
+        posizioni = [self.posizione_per_id[i] for i in ids_ricette if i in self.posizione_per_id]
+        maschera[posizioni] = True
+        return maschera
+        
+    @cronometrato("db_durata_secondi", campionamento=64, operazione="get_ricetta_by_id")
     def get_ricetta_by_id(self, ricetta_id: str) -> Optional[Dict]:
         """Recupera una ricetta dal suo ID"""
         return self.ricette_per_id.get(ricetta_id)
         
+    @cronometrato("db_durata_secondi", operazione="cerca_ricette")
+    def cerca_ricette(self, filtro: Filtro) -> List[str]:
+        """
+        Recupera gli ID delle ricette che soddisfano un filtro sulle proprietà
+        
+        Args:
+            filtro: predicato costruito con `Filtro` (es. vegano, stagione, tipo pasto)
+        """
+        return self.ids[filtro.valuta(self.indice_proprieta)].tolist()
+        
+    @cronometrato("db_durata_secondi", operazione="get_ricette_stagione")
     def get_ricette_stagione(self, stagione: str) -> List[Dict]:
         """Recupera tutte le ricette disponibili per una stagione"""
-        ricette_stagionali = []
-        for ricetta in self.ricette_per_id.values():
-            if "stagione" in ricetta["proprieta"]:
-                if stagione in ricetta["proprieta"]["stagione"] or "tutte" in ricetta["proprieta"]["stagione"]:
-                    ricette_stagionali.append(ricetta)
-        return ricette_stagionali
\ No newline at end of file
+        return [self.ricette_per_id[id_ricetta] for id_ricetta in self.cerca_ricette(Filtro.stagione(stagione))]
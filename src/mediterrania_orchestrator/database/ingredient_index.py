@@ -0,0 +1,88 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Set
+
+# Elisioni da espandere prima della normalizzazione (es. "d'avena" -> "di avena")
+_ELISIONI = re.compile(r"\b(d|dell|dall|all|nell|l)'\s*")
+
+# Temi di nomi e aggettivi con il singolare in -e (plurale in -i): le altre
+# parole in -e sono plurali femminili di parole in -a, quelle in -i plurali di
+# parole in -o. Serve a distinguere, ad esempio, "pesce" da "pesche" (pesca).
+_TEMI_IN_E = frozenset({
+    "album", "alimentar", "arachid", "cavolfior", "cec", "cereal", "carn", "crescion", "dolc",
+    "edamam", "extravergin", "girasol", "grand", "integral", "lampon", "latt", "legum", "lim",
+    "limon", "mar", "mascarpon", "melon", "miel", "natural", "noc", "pan", "pep", "peperon",
+    "pesc", "polver", "provolon", "sal", "salmon", "segal", "sem", "spalmabil", "stagion",
+    "vapor", "vegetal", "vener", "verd"
+})
+
+# Plurali che non seguono le regole delle desinenze
+_PLURALI_IRREGOLARI = {"uova": "uovo"}
+
+@lru_cache(maxsize=1 << 16)
+def normalizza_ingrediente(nome: str) -> str:
+    """
+    Riduce il nome di un ingrediente alla sua forma canonica
+    
+    Rende equivalenti maiuscole/minuscole, accenti, elisioni e le forme
+    singolare/plurale ("cavolfiori"/"cavolfiore", "carota"/"carote",
+    "pesche"/"pesca"), conservando la vocale di genere così che parole
+    diverse restino distinte ("pesce"/"pesca", "pasta"/"pasto").
+    """
+    nome = unicodedata.normalize("NFKD", nome.strip().lower())
+    nome = "".join(c for c in nome if not unicodedata.combining(c))
+    nome = _ELISIONI.sub(lambda m: m.group(1) + "i ", nome)
+    return " ".join(_radice(parola) for parola in nome.split())
+
+def _radice(parola: str) -> str:
+    """
+    Forma canonica di una parola: tema più vocale del singolare
+    
+    I temi non sono sempre parole reali ("funghi" -> "fungo",
+    "finocchio" -> "finocco"): conta solo che singolare e plurale coincidano.
+    """
+    parola = _PLURALI_IRREGOLARI.get(parola, parola)
+    if len(parola) <= 2 or parola[-1] not in "aeio":
+        return parola
+    tema, vocale = parola[:-1], parola[-1]
+    if vocale in "ei":
+        # -e: singolare dei nomi in -e o plurale femminile; -i: plurale dei nomi in -e o in -o
+        vocale = "e" if tema in _TEMI_IN_E else ("a" if vocale == "e" else "o")
+    # Singolari in -io e -cia/-gia, plurali in -chi/-ghi/-che/-ghe
+    if len(tema) > 2 and (tema.endswith(("ci", "gi")) or (vocale == "o" and tema.endswith("i"))):
+        tema = tema[:-1]
+    if tema.endswith(("ch", "gh")):
+        tema = tema[:-1]
+    return tema + vocale
+
+class IndiceIngredienti:
+    def __init__(self, ricette_per_id: Dict[str, Dict]):
+        """
+        Costruisce l'indice invertito ingrediente -> ID ricette
+        
+        Args:
+            ricette_per_id: ricette del catalogo indicizzate per ID
+        """
+        self.ricette_per_ingrediente: Dict[str, Set[str]] = {}
+        self.ingredienti_per_ricetta: Dict[str, FrozenSet[str]] = {}
+
+        for id_ricetta, ricetta in ricette_per_id.items():
+            ingredienti = frozenset(
+                normalizza_ingrediente(ing["nome"]) for ing in ricetta["ingredienti"]
+            )
+            self.ingredienti_per_ricetta[id_ricetta] = ingredienti
+            for ingrediente in ingredienti:
+                self.ricette_per_ingrediente.setdefault(ingrediente, set()).add(id_ricetta)
+
+    def ricette_con(self, ingredienti: Iterable[str]) -> Set[str]:
+        """Restituisce gli ID delle ricette che contengono almeno uno degli ingredienti"""
+        risultato = set()
+        for ingrediente in ingredienti:
+            risultato |= self.ricette_per_ingrediente.get(normalizza_ingrediente(ingrediente), set())
+        return risultato
+
+    def contiene(self, id_ricetta: str, ingredienti: Iterable[str]) -> bool:
+        """Verifica se una ricetta contiene almeno uno degli ingredienti"""
+        presenti = self.ingredienti_per_ricetta.get(id_ricetta, frozenset())
+        return any(normalizza_ingrediente(ingrediente) in presenti for ingrediente in ingredienti)
@@ -0,0 +1,129 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Stagioni coperte dal valore "tutte"
+STAGIONI = ("primavera", "estate", "autunno", "inverno")
+
+# Maschera di un predicato su una chiave assente dall'indice: nessuna ricetta lo soddisfa
+_SCONOSCIUTA = -1
+
+class Filtro:
+    """
+    Predicato componibile sulle proprietà delle ricette
+    
+    I filtri si combinano con `&` (AND), `|` (OR) e `~` (NOT) e vengono
+    valutati sulle maschere di bit di `IndiceProprieta`.
+    
+    Esempio:
+        Filtro.proprieta("vegano") & Filtro.proprieta("senza_glutine") & \\
+            Filtro.stagione("autunno") & Filtro.tipo_pasto("cene")
+    """
+    def __init__(self, operatore: str, chiave: Optional[Tuple[str, str]] = None, operandi: Tuple = ()):
+        self.operatore = operatore
+        self.chiave = chiave
+        self.operandi = operandi
+
+    @classmethod
+    def proprieta(cls, nome: str) -> "Filtro":
+        """Ricette con il flag booleano `proprieta[nome]` attivo"""
+        return cls("bit", ("proprieta", nome))
+
+    @classmethod
+    def adattabile_per(cls, nome: str) -> "Filtro":
+        """Ricette adattabili per `nome` (es. "celiaci", "ipertesi")"""
+        return cls("bit", ("adattabile_per", nome))
+
+    @classmethod
+    def stagione(cls, nome: str) -> "Filtro":
+        """Ricette disponibili nella stagione (incluse quelle per "tutte")"""
+        return cls("bit", ("stagione", nome))
+
+    @classmethod
+    def tipo_pasto(cls, nome: str) -> "Filtro":
+        """Ricette di un tipo pasto (es. "colazioni", "cene")"""
+        return cls("bit", ("tipo_pasto", nome))
+
+    def __and__(self, altro: "Filtro") -> "Filtro":
+        return Filtro("and", operandi=(self, altro))
+
+    def __or__(self, altro: "Filtro") -> "Filtro":
+        return Filtro("or", operandi=(self, altro))
+
+    def __invert__(self) -> "Filtro":
+        return Filtro("not", operandi=(self,))
+
+    def _bit_richiesti(self, indice: "IndiceProprieta") -> Optional[int]:
+        """Maschera unica se il filtro è un AND di soli predicati atomici"""
+        if self.operatore == "bit":
+            return indice.bit_per_chiave.get(self.chiave, _SCONOSCIUTA)
+        if self.operatore == "and":
+            sinistra = self.operandi[0]._bit_richiesti(indice)
+            destra = self.operandi[1]._bit_richiesti(indice)
+            if _SCONOSCIUTA in (sinistra, destra):
+                # Un AND con un predicato mai soddisfatto non è soddisfatto da nessuna ricetta
+                return _SCONOSCIUTA
+            if sinistra is not None and destra is not None:
+                return sinistra | destra
+        return None
+
+    def valuta(self, indice: "IndiceProprieta") -> np.ndarray:
+        """Restituisce la maschera booleana delle ricette che soddisfano il filtro"""
+        richiesti = self._bit_richiesti(indice)
+        if richiesti is not None:
+            if richiesti == _SCONOSCIUTA:
+                return np.zeros(len(indice.maschere), dtype=bool)
+            richiesti = np.uint64(richiesti)
+            return (indice.maschere & richiesti) == richiesti
+        if self.operatore == "and":
+            return self.operandi[0].valuta(indice) & self.operandi[1].valuta(indice)
+        if self.operatore == "or":
+            return self.operandi[0].valuta(indice) | self.operandi[1].valuta(indice)
+        return ~self.operandi[0].valuta(indice)
+
+class IndiceProprieta:
+    def __init__(self, ricette_per_id: Dict[str, Dict], tipo_pasto_per_id: Dict[str, str]):
+        """
+        Precalcola una maschera di bit per ogni ricetta
+        
+        Ogni bit rappresenta un flag booleano di `proprieta`, un flag di
+        `adattabile_per`, una stagione o il tipo pasto. Le maschere sono
+        allineate all'ordine di `ricette_per_id`.
+        
+        Args:
+            ricette_per_id: ricette del catalogo indicizzate per ID
+            tipo_pasto_per_id: sezione del catalogo di ogni ricetta
+        """
+        self.bit_per_chiave: Dict[Tuple[str, str], int] = {}
+        self.maschere = np.zeros(len(ricette_per_id), dtype=np.uint64)
+
+        for pos, (id_ricetta, ricetta) in enumerate(ricette_per_id.items()):
+            maschera = self._bit(("tipo_pasto", tipo_pasto_per_id[id_ricetta]))
+            for nome, valore in ricetta.get("proprieta", {}).items():
+                if nome == "stagione":
+                    stagioni = STAGIONI if "tutte" in valore else valore
+                    for stagione in stagioni:
+                        maschera |= self._bit(("stagione", stagione))
+                elif valore is True:
+                    maschera |= self._bit(("proprieta", nome))
+            for nome, valore in ricetta.get("adattabile_per", {}).items():
+                # Valori stringa indicano un adattamento possibile con modifiche
+                if valore:
+                    maschera |= self._bit(("adattabile_per", nome))
+            self.maschere[pos] = maschera
+
+    @classmethod
+    def da_maschere(cls, maschere: np.ndarray, bit_per_chiave: Dict[Tuple[str, str], int]) -> "IndiceProprieta":
+        """Ricostruisce l'indice da maschere già calcolate (es. memoria condivisa)"""
+        indice = cls.__new__(cls)
+        indice.maschere = maschere
+        indice.bit_per_chiave = dict(bit_per_chiave)
+        return indice
+
+    def _bit(self, chiave: Tuple[str, str]) -> int:
+        """Restituisce il bit associato a una chiave, allocandolo se nuovo"""
+        if chiave not in self.bit_per_chiave:
+            if len(self.bit_per_chiave) >= 64:
+                raise ValueError(f"Troppe proprietà distinte per l'indice: {chiave}")
+            self.bit_per_chiave[chiave] = 1 << len(self.bit_per_chiave)
+        return self.bit_per_chiave[chiave]
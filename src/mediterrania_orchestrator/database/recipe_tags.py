@@ -0,0 +1,54 @@
+from typing import Sequence
+
+import numpy as np
+
+# Nutrienti classificati in porzioni, nell'ordine delle colonne di `mezze_porzioni`
+NUTRIENTI_PORZIONI = ("calorie", "proteine", "carboidrati", "grassi", "fibre")
+
+# Valore di una porzione del template (kcal o grammi)
+PORZIONE = {"calorie": 100.0, "proteine": 10.0, "carboidrati": 15.0, "grassi": 5.0, "fibre": 2.5}
+
+# Macronutrienti del metodo del piatto con le kcal per grammo
+MACRO_PIATTO = (("proteine", 4), ("carboidrati", 4), ("grassi", 9))
+
+class EtichetteRicette:
+    """
+    Classificazioni precalcolate per ricetta dai metodi template e del piatto
+
+    - `mezze_porzioni`: mezze porzioni del template contenute in ogni ricetta,
+      arrotondate per difetto (il valore reale è compreso tra h e h + 1
+      mezze porzioni)
+    - `quote_min` / `quote_max`: quota percentuale delle calorie di ogni
+      macronutriente del piatto, arrotondata per difetto ed eccesso
+
+    Sono interi piccoli: i controlli sui piani si riducono a somme e
+    confronti, senza toccare i valori nutrizionali completi.
+    """
+
+    def __init__(self, mezze_porzioni: np.ndarray, quote_min: np.ndarray, quote_max: np.ndarray):
+        self.mezze_porzioni = mezze_porzioni
+        self.quote_min = quote_min
+        self.quote_max = quote_max
+
+    @classmethod
+    def da_matrice(cls, matrice_nutrienti: np.ndarray, nutrienti: Sequence[str]) -> "EtichetteRicette":
+        """
+        Calcola le etichette dalla matrice nutrizionale del catalogo
+
+        Args:
+            matrice_nutrienti: matrice (ricette, nutrienti) del database
+            nutrienti: nomi delle colonne della matrice
+        """
+        valori = matrice_nutrienti[:, [nutrienti.index(n) for n in NUTRIENTI_PORZIONI]]
+        mezza_porzione = np.array([PORZIONE[n] / 2 for n in NUTRIENTI_PORZIONI])
+        mezze_porzioni = np.clip(np.floor(valori / mezza_porzione), 0, np.iinfo(np.int16).max).astype(np.int16)
+
+        calorie = matrice_nutrienti[:, nutrienti.index("calorie")]
+        kcal = np.column_stack([matrice_nutrienti[:, nutrienti.index(n)] * fattore for n, fattore in MACRO_PIATTO])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            quote = kcal / calorie[:, None] * 100
+        # Senza calorie la quota non è definita: nessun vincolo
+        definita = (calorie > 0)[:, None]
+        quote_min = np.where(definita, np.clip(np.floor(quote), 0, 255), 0).astype(np.uint8)
+        quote_max = np.where(definita, np.clip(np.ceil(quote), 0, 255), 255).astype(np.uint8)
+        return cls(mezze_porzioni, quote_min, quote_max)
@@ -0,0 +1,242 @@
+import json
+import struct
+import sys
+from collections.abc import Mapping, Sequence
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from mediterrania_orchestrator.database.ingredient_index import normalizza_ingrediente
+
+# Allineamento degli array nel segmento condiviso
+_ALLINEAMENTO = 8
+
+class CatalogoCondiviso:
+    def __init__(self, memoria: shared_memory.SharedMemory, proprietario: bool):
+        """
+        Catalogo ricette in un segmento di memoria condivisa
+
+        Il segmento contiene le colonne numeriche, le maschere delle
+        proprietà, la tabella degli ID, l'indice ingredienti in formato
+        compresso e le ricette serializzate. Viene creato una volta dal
+        processo padre con `crea` e collegato in sola lettura dai worker
+        con `collega`.
+
+        Args:
+            memoria: segmento di memoria condivisa
+            proprietario: True se il processo corrente ha creato il segmento
+        """
+        self.memoria = memoria
+        self.proprietario = proprietario
+        (lunghezza,) = struct.unpack_from("<Q", memoria.buf, 0)
+        self.metadati = json.loads(bytes(memoria.buf[8:8 + lunghezza]))
+        inizio_dati = _allinea(8 + lunghezza)
+        self.array = {}
+        for nome, (offset, dtype, forma) in self.metadati["array"].items():
+            vista = np.ndarray(tuple(forma), dtype=np.dtype(dtype), buffer=memoria.buf, offset=inizio_dati + offset)
+            vista.flags.writeable = False
+            self.array[nome] = vista
+
+    @property
+    def nome(self) -> str:
+        """Nome del segmento, da passare ai worker"""
+        return self.memoria.name
+
+    @classmethod
+    def crea(cls, db, nome: Optional[str] = None) -> "CatalogoCondiviso":
+        """
+        Copia il catalogo di un `DatabaseRicette` in un nuovo segmento condiviso
+
+        Args:
+            db: database delle ricette già indicizzato
+            nome: nome del segmento (default: generato dal sistema)
+        """
+        ids = [str(id_ricetta) for id_ricetta in db.ids]
+        ricette = [
+            json.dumps(db.ricette_per_id[id_ricetta], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            for id_ricetta in ids
+        ]
+
+        # Indice ingredienti in formato CSR: ingredienti per ricetta e ricette per ingrediente
+        vocabolario = sorted(db.indice_ingredienti.ricette_per_ingrediente)
+        codice_ingrediente = {ingrediente: i for i, ingrediente in enumerate(vocabolario)}
+        ingredienti_per_ricetta = [
+            sorted(codice_ingrediente[i] for i in db.indice_ingredienti.ingredienti_per_ricetta[id_ricetta])
+            for id_ricetta in ids
+        ]
+        ricette_per_ingrediente = [
+            sorted(db.posizione_per_id[i] for i in db.indice_ingredienti.ricette_per_ingrediente[ingrediente])
+            for ingrediente in vocabolario
+        ]
+
+        array = {
+            "matrice_nutrienti": db.matrice_nutrienti,
+            "codici_tipo_pasto": db.codici_tipo_pasto,
+            "maschere_proprieta": db.indice_proprieta.maschere,
+        }
+        array.update(_tabella_stringhe("ids", [i.encode("utf-8") for i in ids]))
+        array.update(_tabella_stringhe("ricette", ricette))
+        array.update(_tabella_stringhe("vocabolario", [i.encode("utf-8") for i in vocabolario]))
+        array.update(_liste_csr("ingredienti_per_ricetta", ingredienti_per_ricetta))
+        array.update(_liste_csr("ricette_per_ingrediente", ricette_per_ingrediente))
+
+        metadati = {
+            "versione": db.versione,
+            "path_ricette": db.path_ricette,
+            "metadata": db.ricette.get("metadata", {}),
+            "bit_proprieta": [[tipo, nome, bit] for (tipo, nome), bit in db.indice_proprieta.bit_per_chiave.items()],
+            "array": {}
+        }
+        # Gli offset sono relativi all'inizio dei dati, che segue l'intestazione
+        offset = 0
+        for nome_array, valori in array.items():
+            valori = np.ascontiguousarray(valori)
+            array[nome_array] = valori
+            metadati["array"][nome_array] = [offset, valori.dtype.str, list(valori.shape)]
+            offset = _allinea(offset + valori.nbytes)
+        intestazione = json.dumps(metadati).encode("utf-8")
+        inizio_dati = _allinea(8 + len(intestazione))
+
+        memoria = shared_memory.SharedMemory(name=nome, create=True, size=inizio_dati + offset + _ALLINEAMENTO)
+        struct.pack_into("<Q", memoria.buf, 0, len(intestazione))
+        memoria.buf[8:8 + len(intestazione)] = intestazione
+        for nome_array, valori in array.items():
+            inizio = inizio_dati + metadati["array"][nome_array][0]
+            destinazione = np.ndarray(valori.shape, dtype=valori.dtype, buffer=memoria.buf, offset=inizio)
+            destinazione[...] = valori
+        return cls(memoria, proprietario=True)
+
+    @classmethod
+    def collega(cls, nome: str, tracker_condiviso: bool = False) -> "CatalogoCondiviso":
+        """
+        Collega un segmento creato da un altro processo
+        
+        Il segmento non deve essere rimosso dal resource tracker di chi si
+        collega all'uscita del processo: la rimozione spetta al processo
+        che lo ha creato.
+        
+        Args:
+            nome: nome del segmento
+            tracker_condiviso: il processo usa lo stesso resource tracker del
+                creatore (il creatore stesso o un suo processo figlio); la
+                registrazione del segmento è quindi quella del creatore e
+                non va rimossa
+        """
+        if sys.version_info >= (3, 13):
+            memoria = shared_memory.SharedMemory(name=nome, track=False)
+        else:
+            memoria = shared_memory.SharedMemory(name=nome)
+            if not tracker_condiviso:
+                resource_tracker.unregister(memoria._name, "shared_memory")
+        return cls(memoria, proprietario=False)
+
+    def stringa(self, tabella: str, pos: int) -> str:
+        """Decodifica l'elemento `pos` di una tabella di stringhe"""
+        offset = self.array[f"{tabella}_offset"]
+        return bytes(self.array[f"{tabella}_dati"][offset[pos]:offset[pos + 1]]).decode("utf-8")
+
+    def stringhe(self, tabella: str) -> List[str]:
+        """Decodifica tutti gli elementi di una tabella di stringhe"""
+        offset = self.array[f"{tabella}_offset"]
+        dati = bytes(self.array[f"{tabella}_dati"])
+        return [dati[offset[i]:offset[i + 1]].decode("utf-8") for i in range(len(offset) - 1)]
+
+    def lista(self, nome: str, pos: int) -> np.ndarray:
+        """Restituisce l'elemento `pos` di una lista CSR"""
+        offset = self.array[f"{nome}_offset"]
+        return self.array[f"{nome}_valori"][offset[pos]:offset[pos + 1]]
+
+    def chiudi(self):
+        """Scollega il segmento dal processo corrente"""
+        self.array = {}
+        self.memoria.close()
+
+    def elimina(self):
+        """Rimuove il segmento dal sistema (solo il processo che lo ha creato)"""
+        if self.proprietario:
+            self.memoria.unlink()
+
+class RicetteCondivise(Mapping):
+    def __init__(self, catalogo: CatalogoCondiviso, posizione_per_id: Dict[str, int]):
+        """
+        Vista in sola lettura `ID -> ricetta` sul catalogo condiviso
+
+        Ogni accesso decodifica la ricetta dal segmento e restituisce un
+        nuovo dizionario, che il chiamante può modificare liberamente.
+        """
+        self._catalogo = catalogo
+        self._posizione_per_id = posizione_per_id
+
+    def __getitem__(self, id_ricetta: str) -> Dict:
+        return json.loads(self._catalogo.stringa("ricette", self._posizione_per_id[id_ricetta]))
+
+    def __iter__(self):
+        return iter(self._posizione_per_id)
+
+    def __len__(self) -> int:
+        return len(self._posizione_per_id)
+
+class SezioneCondivisa(Sequence):
+    def __init__(self, ricette: RicetteCondivise, ids: List[str]):
+        """Lista in sola lettura delle ricette di un tipo pasto"""
+        self._ricette = ricette
+        self._ids = ids
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self._ricette[i] for i in self._ids[indice]]
+        return self._ricette[self._ids[indice]]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+class IndiceIngredientiCondiviso:
+    def __init__(self, catalogo: CatalogoCondiviso, ids: np.ndarray, posizione_per_id: Dict[str, int]):
+        """Stessa interfaccia di `IndiceIngredienti`, basata sulle liste CSR condivise"""
+        self._catalogo = catalogo
+        self._ids = ids
+        self._posizione_per_id = posizione_per_id
+        self._codice_ingrediente = {
+            ingrediente: i for i, ingrediente in enumerate(catalogo.stringhe("vocabolario"))
+        }
+
+    def ricette_con(self, ingredienti: Iterable[str]) -> Set[str]:
+        """Restituisce gli ID delle ricette che contengono almeno uno degli ingredienti"""
+        risultato = set()
+        for ingrediente in ingredienti:
+            codice = self._codice_ingrediente.get(normalizza_ingrediente(ingrediente))
+            if codice is not None:
+                risultato.update(self._ids[self._catalogo.lista("ricette_per_ingrediente", codice)])
+        return risultato
+
+    def contiene(self, id_ricetta: str, ingredienti: Iterable[str]) -> bool:
+        """Verifica se una ricetta contiene almeno uno degli ingredienti"""
+        pos = self._posizione_per_id.get(id_ricetta)
+        if pos is None:
+            return False
+        presenti = self._catalogo.lista("ingredienti_per_ricetta", pos)
+        for ingrediente in ingredienti:
+            codice = self._codice_ingrediente.get(normalizza_ingrediente(ingrediente))
+            if codice is not None and codice in presenti:
+                return True
+        return False
+
+def _allinea(offset: int) -> int:
+    return (offset + _ALLINEAMENTO - 1) // _ALLINEAMENTO * _ALLINEAMENTO
+
+def _tabella_stringhe(nome: str, valori: List[bytes]) -> Dict[str, np.ndarray]:
+    """Concatena stringhe codificate in un blob con array di offset"""
+    offset = np.zeros(len(valori) + 1, dtype=np.int64)
+    offset[1:] = np.cumsum([len(v) for v in valori])
+    return {
+        f"{nome}_offset": offset,
+        f"{nome}_dati": np.frombuffer(b"".join(valori), dtype=np.uint8)
+    }
+
+def _liste_csr(nome: str, liste: List[List[int]]) -> Dict[str, np.ndarray]:
+    """Concatena liste di interi nel formato CSR (offset + valori)"""
+    offset = np.zeros(len(liste) + 1, dtype=np.int64)
+    offset[1:] = np.cumsum([len(l) for l in liste])
+    valori = np.fromiter((v for l in liste for v in l), dtype=np.int32, count=int(offset[-1]))
+    return {f"{nome}_offset": offset, f"{nome}_valori": valori}
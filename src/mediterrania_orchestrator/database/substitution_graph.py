@@ -0,0 +1,82 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+
+NOME_FILE_GRAFO = "grafo_sostituzioni.json"
+
+class GrafoSostituzioni:
+    def __init__(self, vicini: Dict[str, List[str]], versione_catalogo: str, k: int, threshold: float):
+        """
+        Grafo k-NN delle ricette nutrizionalmente simili
+        
+        Per ogni ricetta contiene fino a `k` ricette dello stesso tipo pasto
+        che rispettano il criterio di `_valori_nutrizionali_simili`,
+        ordinate per differenza di calorie crescente.
+        
+        Args:
+            vicini: lista ordinata dei vicini di ogni ricetta
+            versione_catalogo: hash del catalogo da cui è stato costruito
+            k: numero massimo di vicini per ricetta
+            threshold: soglia di similarità usata nella costruzione
+        """
+        self.vicini = vicini
+        self.versione_catalogo = versione_catalogo
+        self.k = k
+        self.threshold = threshold
+
+    @classmethod
+    def costruisci(cls, db: DatabaseRicette, k: int = 10, threshold: float = 0.2) -> "GrafoSostituzioni":
+        """Calcola i vicini di ogni ricetta a partire dalla matrice nutrizionale del catalogo"""
+        vicini = {}
+        macro = db.matrice_nutrienti[:, :4]
+        for codice in np.unique(db.codici_tipo_pasto):
+            posizioni = np.flatnonzero(db.codici_tipo_pasto == codice)
+            gruppo = macro[posizioni]
+            # Righe elaborate a blocchi per limitare la memoria sui cataloghi grandi
+            dimensione_blocco = max(1, (1 << 22) // len(gruppo))
+            for inizio in range(0, len(gruppo), dimensione_blocco):
+                riferimenti = gruppo[inizio:inizio + dimensione_blocco]
+                # simili[i, j]: la ricetta j è un sostituto valido per la ricetta inizio + i
+                simili = np.all(np.abs(gruppo[None, :, :] - riferimenti[:, None, :]) <=
+                                threshold * riferimenti[:, None, :], axis=2)
+                simili[np.arange(len(riferimenti)), np.arange(inizio, inizio + len(riferimenti))] = False
+                delta = np.abs(gruppo[None, :, 0] - riferimenti[:, None, 0])
+                for i in range(len(riferimenti)):
+                    candidati = np.flatnonzero(simili[i])
+                    ordinati = candidati[np.argsort(delta[i, candidati], kind="stable")][:k]
+                    vicini[db.ids[posizioni[inizio + i]]] = [db.ids[posizioni[j]] for j in ordinati]
+        return cls(vicini, db.versione, k, threshold)
+
+    def salva(self, path: str):
+        """Salva il grafo in formato JSON"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "versione_catalogo": self.versione_catalogo,
+                "k": self.k,
+                "threshold": self.threshold,
+                "vicini": self.vicini
+            }, f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def carica(cls, path: str, versione_catalogo: str) -> Optional["GrafoSostituzioni"]:
+        """
+        Carica il grafo dal file JSON
+        
+        Restituisce None se il file non esiste o se è stato costruito da
+        una versione diversa del catalogo.
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            dati = json.load(f)
+        if dati.get("versione_catalogo") != versione_catalogo:
+            return None
+        return cls(dati["vicini"], dati["versione_catalogo"], dati["k"], dati["threshold"])
+
+def path_grafo_predefinito(db: DatabaseRicette) -> str:
+    """Percorso del grafo accanto al file delle ricette"""
+    return os.path.join(os.path.dirname(os.path.abspath(db.path_ricette)), NOME_FILE_GRAFO)
@@ -0,0 +1,111 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Scrittori attivi nel processo, uno per file
+_scrittori: Dict[str, "_ScrittoreEventi"] = {}
+_lock_scrittori = threading.Lock()
+
+class _ScrittoreEventi:
+    """Scrive le righe JSON su file da un thread in background, con rotazione per dimensione"""
+
+    def __init__(self, path: str, dimensione_max: int, backup: int):
+        cartella = os.path.dirname(path)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=dimensione_max, backupCount=backup, encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        self.coda = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(self.coda, file_handler)
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def scrivi(self, riga: str):
+        self.coda.put_nowait(logging.makeLogRecord({"msg": riga, "levelno": logging.INFO}))
+
+    def chiudi(self):
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+def _scrittore(path: str, dimensione_max: int, backup: int) -> _ScrittoreEventi:
+    """Restituisce lo scrittore del file, creandolo al primo uso nel processo"""
+    with _lock_scrittori:
+        scrittore = _scrittori.get(path)
+        if scrittore is None or scrittore.pid != os.getpid():
+            scrittore = _scrittori[path] = _ScrittoreEventi(path, dimensione_max, backup)
+        return scrittore
+
+def chiudi_registri():
+    """Scrive gli eventi ancora in coda e chiude tutti i file degli eventi"""
+    with _lock_scrittori:
+        for scrittore in _scrittori.values():
+            if scrittore.pid == os.getpid():
+                scrittore.chiudi()
+        _scrittori.clear()
+
+atexit.register(chiudi_registri)
+
+class RegistroEventi:
+    """
+    Registro strutturato delle decisioni in formato JSON Lines
+
+    Ogni evento è una riga JSON compatta con istante, tipo, id richiesta e
+    i campi specifici dell'evento (fase, ricette, delta, durate), leggibile
+    in streaming con `pandas.read_json(path, lines=True, chunksize=...)`.
+    Ogni tipo di evento può essere campionato con un proprio tasso; gli
+    eventi scartati non vengono nemmeno serializzati. La scrittura avviene
+    in background e il file ruota al raggiungimento di `dimensione_max`.
+    """
+
+    def __init__(self, path: str, campionamento: Optional[Dict[str, float]] = None,
+                 dimensione_max: int = 50 * 1024 * 1024, backup: int = 5,
+                 casuale: Callable[[], float] = random.random):
+        """
+        Args:
+            path: file JSONL degli eventi; "{pid}" viene sostituito con il PID,
+                per avere un file per processo quando più processi registrano
+            campionamento: frazione di eventi registrati per tipo (default 1.0)
+            dimensione_max: dimensione in byte oltre la quale il file ruota
+            backup: numero di file ruotati da conservare
+            casuale: generatore in [0, 1) usato per il campionamento
+        """
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.campionamento = dict(campionamento or {})
+        self.dimensione_max = dimensione_max
+        self.backup = backup
+        self.casuale = casuale
+
+    def attivo(self, tipo: str) -> bool:
+        """Decide se registrare il prossimo evento del tipo in base al campionamento"""
+        tasso = self.campionamento.get(tipo, 1.0)
+        return tasso >= 1.0 or (tasso > 0 and self.casuale() < tasso)
+
+    def registra(self, tipo: str, richiesta: str, **campi) -> bool:
+        """
+        Registra un evento se supera il campionamento
+
+        Args:
+            tipo: tipo di evento (es. "sostituzione", "verifica", "piano")
+            richiesta: id della richiesta a cui appartiene l'evento
+            **campi: campi dell'evento, serializzabili in JSON
+
+        Returns:
+            True se l'evento è stato registrato
+        """
+        if not self.attivo(tipo):
+            return False
+        evento = {"ts": round(time.time(), 6), "tipo": tipo, "richiesta": richiesta}
+        evento.update(campi)
+        riga = json.dumps(evento, ensure_ascii=False, separators=(",", ":"), default=str)
+        _scrittore(self.path, self.dimensione_max, self.backup).scrivi(riga)
+        return True
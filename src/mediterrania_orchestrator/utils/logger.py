@@ -1,20 +1,39 @@
+import atexit
 import logging
 import logging.handlers
+import queue
+import threading
 from datetime import datetime
 import os
 from typing import Dict, List, Optional
 
-class LoggerMediterranIA:
-    def __init__(self):
+# Listener che scrive i log in background, uno per processo
+_listener: Optional[logging.handlers.QueueListener] = None
+_pid_listener: Optional[int] = None
+_lock_listener = threading.Lock()
+
+def _installa_handler(logger: logging.Logger):
+    """
+    Collega il logger a una coda servita da un thread di scrittura
+    
+    File e console vengono scritti dal thread del `QueueListener`: chi
+    logga si limita ad accodare il record. Gli handler vengono installati
+    una sola volta per processo (di nuovo dopo un fork, perché il thread
+    non sopravvive nel figlio). Il livello DEBUG viene impostato solo se
+    l'applicazione non ne ha già scelto uno.
+    """
+    global _listener, _pid_listener
+    with _lock_listener:
+        if _pid_listener == os.getpid():
+            return
+        if logger.level == logging.NOTSET:
+            logger.setLevel(logging.DEBUG)
+            
         # Crea directory per i log se non esiste
         log_dir = "logs"
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
 
-        # Configura il logger principale
-        self.logger = logging.getLogger('MediterranIA')
-        self.logger.setLevel(logging.DEBUG)
-
         # Handler per file
         file_handler = logging.handlers.RotatingFileHandler(
             filename=f"{log_dir}/mediterrania.log",
@@ -34,30 +53,60 @@ class LoggerMediterranIA:
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
 
-        # Aggiungi handlers
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        coda = queue.SimpleQueue()
+        for handler in [h for h in logger.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+            logger.removeHandler(handler)
+        logger.addHandler(logging.handlers.QueueHandler(coda))
+        
+        _listener = logging.handlers.QueueListener(coda, file_handler, console_handler, respect_handler_level=True)
+        _listener.start()
+        _pid_listener = os.getpid()
+
+def arresta_logging():
+    """Scrive i record ancora in coda e ferma il thread di scrittura"""
+    global _listener, _pid_listener
+    with _lock_listener:
+        if _listener is not None and _pid_listener == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = None
+        _pid_listener = None
+
+atexit.register(arresta_logging)
+
+class LoggerMediterranIA:
+    def __init__(self):
+        # Configura il logger principale
+        self.logger = logging.getLogger('MediterranIA')
+        _installa_handler(self.logger)
+
+    def abilitato(self, livello: int) -> bool:
+        """Indica se i messaggi del livello verrebbero registrati"""
+        return self.logger.isEnabledFor(livello)
 
     def log_piano_creazione(self, dati_utente: Dict, piano_id: str):
         """Log della creazione di un nuovo piano"""
         self.logger.info(
-            f"Nuovo piano creato - ID: {piano_id} - "
-            f"Utente: {dati_utente['sesso']}, {dati_utente['età']} anni, "
-            f"Obiettivo: {dati_utente['obiettivo']}"
+            "Nuovo piano creato - ID: %s - Utente: %s, %s anni, Obiettivo: %s",
+            piano_id, dati_utente['sesso'], dati_utente['età'], dati_utente['obiettivo']
         )
 
     def log_sostituzione(self, ricetta_originale: str, ricetta_nuova: str, motivo: str):
         """Log di una sostituzione di ricetta"""
         self.logger.debug(
-            f"Sostituzione ricetta - "
-            f"Originale: {ricetta_originale} -> Nuova: {ricetta_nuova} - "
-            f"Motivo: {motivo}"
+            "Sostituzione ricetta - Originale: %s -> Nuova: %s - Motivo: %s",
+            ricetta_originale, ricetta_nuova, motivo
         )
 
+    def log_info(self, messaggio: str, *args):
+        """Log di un messaggio informativo, formattato con `args` solo se registrato"""
+        self.logger.info(messaggio, *args)
+
     def log_errore(self, errore: Exception, contesto: str):
         """Log di un errore"""
         self.logger.error(
-            f"Errore in {contesto}: {str(errore)}",
+            "Errore in %s: %s", contesto, errore,
             exc_info=True
         )
 
@@ -65,8 +114,8 @@ class LoggerMediterranIA:
         """Log dei risultati della verifica nutrizionale"""
         if risultati["bilanciato"]:
             self.logger.info("Verifica nutrizionale: Piano bilanciato")
-        else:
+        elif self.logger.isEnabledFor(logging.WARNING):
             self.logger.warning(
-                "Verifica nutrizionale: Piano non bilanciato\n" +
+                "Verifica nutrizionale: Piano non bilanciato\n%s",
                 "\n".join(risultati["problemi"])
             )
\ No newline at end of file
@@ -0,0 +1,259 @@
+import functools
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Limiti dei bucket degli istogrammi in secondi: da 1 µs a ~134 s, 8 bucket per raddoppio
+_SUDDIVISIONI_PER_RADDOPPIO = 8
+LIMITI_BUCKET = tuple(1e-6 * 2 ** (i / _SUDDIVISIONI_PER_RADDOPPIO) for i in range(27 * _SUDDIVISIONI_PER_RADDOPPIO + 1))
+
+QUANTILI = (0.5, 0.95, 0.99)
+
+Etichette = Tuple[Tuple[str, str], ...]
+
+class Istogramma:
+    """
+    Istogramma a bucket logaritmici fissi, per durate in secondi
+
+    Registrare un valore costa una ricerca binaria e un incremento; i
+    quantili hanno un errore relativo massimo di circa il 9% (l'ampiezza
+    di un bucket) e non superano mai il massimo osservato.
+    """
+
+    def __init__(self):
+        self.conteggi = [0] * (len(LIMITI_BUCKET) + 1)
+        self.conteggio = 0
+        self.somma = 0.0
+        self.massimo = 0.0
+        self._lock = threading.Lock()
+
+    def azzera(self):
+        with self._lock:
+            self.conteggi = [0] * (len(LIMITI_BUCKET) + 1)
+            self.conteggio = 0
+            self.somma = 0.0
+            self.massimo = 0.0
+
+    def osserva(self, valore: float):
+        indice = bisect_left(LIMITI_BUCKET, valore)
+        with self._lock:
+            self.conteggi[indice] += 1
+            self.conteggio += 1
+            self.somma += valore
+            if valore > self.massimo:
+                self.massimo = valore
+
+    def quantile(self, q: float) -> float:
+        """Limite superiore del bucket che contiene il quantile `q` (0 se vuoto)"""
+        with self._lock:
+            conteggi, totale, massimo = list(self.conteggi), self.conteggio, self.massimo
+        if totale == 0:
+            return 0.0
+        rango = max(1, math.ceil(q * totale))
+        cumulato = 0
+        for indice, conteggio in enumerate(conteggi):
+            cumulato += conteggio
+            if cumulato >= rango:
+                limite = LIMITI_BUCKET[indice] if indice < len(LIMITI_BUCKET) else massimo
+                return min(limite, massimo)
+        return massimo
+
+    def riepilogo(self) -> Dict[str, float]:
+        riepilogo = {f"p{round(q * 100)}": self.quantile(q) for q in QUANTILI}
+        riepilogo.update(conteggio=self.conteggio, somma=self.somma, massimo=self.massimo)
+        return riepilogo
+
+class RegistroMetriche:
+    """
+    Metriche del processo: istogrammi di durata, contatori e valori istantanei
+
+    Ogni metrica è identificata da nome ed etichette. I valori istantanei
+    (es. hit rate della cache) vengono letti al momento dell'esportazione
+    dai collettori registrati.
+    """
+
+    def __init__(self, prefisso: str = "mediterrania"):
+        self.prefisso = prefisso
+        self.istogrammi: Dict[Tuple[str, Etichette], Istogramma] = {}
+        self.contatori: Dict[Tuple[str, Etichette], float] = {}
+        self.collettori: List[Callable] = []
+        self._lock = threading.Lock()
+
+    def istogramma(self, nome: str, **etichette) -> Istogramma:
+        """Istogramma `nome` con le etichette date, creato al primo uso"""
+        chiave = (nome, tuple(sorted(etichette.items())))
+        istogramma = self.istogrammi.get(chiave)
+        if istogramma is None:
+            with self._lock:
+                istogramma = self.istogrammi.setdefault(chiave, Istogramma())
+        return istogramma
+
+    def osserva(self, nome: str, valore: float, **etichette):
+        """Registra un valore nell'istogramma `nome` con le etichette date"""
+        self.istogramma(nome, **etichette).osserva(valore)
+
+    def incrementa(self, nome: str, valore: float = 1, **etichette):
+        """Incrementa il contatore `nome` con le etichette date"""
+        chiave = (nome, tuple(sorted(etichette.items())))
+        with self._lock:
+            self.contatori[chiave] = self.contatori.get(chiave, 0) + valore
+
+    def registra_collettore(self, collettore: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]):
+        """
+        Aggiunge una funzione che restituisce valori istantanei (nome, etichette, valore)
+
+        Il collettore viene chiamato a ogni istantanea o esportazione. I
+        metodi vengono tenuti con un riferimento debole, così che registrare
+        un collettore non tenga in vita il suo oggetto.
+        """
+        if hasattr(collettore, "__self__"):
+            riferimento = weakref.WeakMethod(collettore)
+        else:
+            riferimento = lambda: collettore
+        with self._lock:
+            self.collettori.append(riferimento)
+
+    def svuota(self):
+        """Azzera istogrammi e contatori (i collettori restano registrati)"""
+        with self._lock:
+            # Gli istogrammi vengono azzerati sul posto: chi li ha già risolti continua a usarli
+            for istogramma in self.istogrammi.values():
+                istogramma.azzera()
+            self.contatori.clear()
+
+    def istantanea(self) -> Dict[str, List[Dict]]:
+        """
+        Stato corrente di tutte le metriche
+
+        Returns:
+            Dizionario con "istogrammi", "contatori" e "valori": liste di
+            elementi con nome, etichette e riepilogo (p50/p95/p99, conteggio,
+            somma, massimo) o valore
+        """
+        with self._lock:
+            istogrammi = list(self.istogrammi.items())
+            contatori = list(self.contatori.items())
+            self.collettori = [riferimento for riferimento in self.collettori if riferimento() is not None]
+            collettori = [riferimento() for riferimento in self.collettori]
+        return {
+            "istogrammi": [
+                dict(nome=nome, etichette=dict(etichette), **istogramma.riepilogo())
+                for (nome, etichette), istogramma in sorted(istogrammi, key=lambda e: e[0])
+                if istogramma.conteggio
+            ],
+            "contatori": [
+                {"nome": nome, "etichette": dict(etichette), "valore": valore}
+                for (nome, etichette), valore in sorted(contatori)
+            ],
+            "valori": [
+                {"nome": nome, "etichette": etichette, "valore": valore}
+                for collettore in collettori + [_valori_processo] if collettore is not None
+                for nome, etichette, valore in collettore()
+            ]
+        }
+
+    def esporta_prometheus(self) -> str:
+        """Metriche nel formato di testo di Prometheus (istogrammi come summary)"""
+        stato = self.istantanea()
+        righe = []
+        # Le righe di una stessa metrica devono essere consecutive
+        valori = sorted(stato["valori"], key=lambda elemento: elemento["nome"])
+        for tipo, elementi in (("summary", stato["istogrammi"]), ("counter", stato["contatori"]),
+                               ("gauge", valori)):
+            dichiarati = set()
+            for elemento in elementi:
+                nome = f"{self.prefisso}_{elemento['nome']}"
+                if nome not in dichiarati:
+                    righe.append(f"# TYPE {nome} {tipo}")
+                    dichiarati.add(nome)
+                if tipo == "summary":
+                    for q in QUANTILI:
+                        etichette = dict(elemento["etichette"], quantile=str(q))
+                        righe.append(f"{nome}{_etichette(etichette)} {elemento[f'p{round(q * 100)}']!r}")
+                    righe.append(f"{nome}_sum{_etichette(elemento['etichette'])} {elemento['somma']!r}")
+                    righe.append(f"{nome}_count{_etichette(elemento['etichette'])} {elemento['conteggio']}")
+                else:
+                    righe.append(f"{nome}{_etichette(elemento['etichette'])} {float(elemento['valore'])!r}")
+        return "\n".join(righe) + "\n"
+
+    def scrivi_prometheus(self, path: str):
+        """Scrive l'esportazione Prometheus su file in modo atomico (es. per il textfile collector)"""
+        cartella = os.path.dirname(os.path.abspath(path))
+        fd, temporaneo = tempfile.mkstemp(dir=cartella, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.esporta_prometheus())
+            os.replace(temporaneo, path)
+        except BaseException:
+            os.unlink(temporaneo)
+            raise
+
+def _etichette(etichette: Dict[str, str]) -> str:
+    if not etichette:
+        return ""
+    valori = ",".join(
+        '{}="{}"'.format(chiave, str(valore).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for chiave, valore in sorted(etichette.items())
+    )
+    return "{" + valori + "}"
+
+def _valori_processo() -> List[Tuple[str, Dict[str, str], float]]:
+    """Memoria del processo: picco da getrusage e residente corrente da /proc se disponibile"""
+    valori = []
+    if resource is not None:
+        # ru_maxrss è in KB su Linux e in byte su macOS
+        picco = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        valori.append(("memoria_picco_byte", {}, float(picco if sys.platform == "darwin" else picco * 1024)))
+    try:
+        with open("/proc/self/statm") as f:
+            residente = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        valori.append(("memoria_residente_byte", {}, float(residente)))
+    except (OSError, ValueError, IndexError):
+        pass
+    return valori
+
+# Registro condiviso del processo
+METRICHE = RegistroMetriche()
+
+def cronometrato(nome: str, registro: Optional[RegistroMetriche] = None, campionamento: int = 1, **etichette):
+    """
+    Decoratore che registra la durata delle chiamate nell'istogramma `nome`
+
+    Args:
+        nome: nome della metrica
+        registro: registro da usare (default: `METRICHE`)
+        campionamento: misura una chiamata ogni `campionamento`, per le
+            funzioni così rapide che la misura ne moltiplicherebbe il costo
+        **etichette: etichette fisse della metrica
+    """
+    def decoratore(funzione):
+        istogramma = None
+        chiamate = 0
+
+        @functools.wraps(funzione)
+        def cronometrata(*args, **kwargs):
+            nonlocal istogramma, chiamate
+            if campionamento > 1:
+                chiamate += 1
+                if chiamate % campionamento:
+                    return funzione(*args, **kwargs)
+            inizio = time.perf_counter()
+            try:
+                return funzione(*args, **kwargs)
+            finally:
+                if istogramma is None:
+                    istogramma = (registro or METRICHE).istogramma(nome, **etichette)
+                istogramma.osserva(time.perf_counter() - inizio)
+        return cronometrata
+    return decoratore
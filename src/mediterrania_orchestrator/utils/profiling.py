@@ -0,0 +1,125 @@
+import contextlib
+import cProfile
+import os
+import random
+import threading
+import time
+import tracemalloc
+from typing import Callable, Iterator, List, Optional
+
+# Allocazioni interne da non attribuire alla richiesta
+_FILTRI_MEMORIA = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+class ProfilatoreRichieste:
+    """
+    Profilazione campionata delle richieste con cProfile e, opzionalmente, tracemalloc
+
+    Per ogni richiesta profilata viene scritto nella cartella un file
+    `.prof` (leggibile con `pstats` o `snakeviz`) e, con `memoria=True`, un
+    file `.memoria.txt` con il picco e le righe che hanno allocato di più.
+    Vengono conservati solo gli ultimi `max_profili` profili.
+
+    Un solo profilo alla volta per processo: cProfile e tracemalloc non
+    distinguono tra richieste concorrenti, quindi una richiesta che arriva
+    mentre un'altra è profilata viene eseguita senza profilazione.
+    """
+
+    def __init__(self, cartella: str, campionamento: float = 0.0, memoria: bool = False,
+                 max_profili: int = 100, righe_memoria: int = 25,
+                 casuale: Callable[[], float] = random.random):
+        """
+        Args:
+            cartella: directory in cui scrivere i profili
+            campionamento: frazione di richieste profilate (0 = solo quelle richieste
+                esplicitamente dal chiamante)
+            memoria: traccia anche le allocazioni con tracemalloc
+            max_profili: numero di profili conservati; i più vecchi vengono eliminati
+            righe_memoria: righe di allocazione riportate nel profilo di memoria
+            casuale: generatore in [0, 1) usato per il campionamento
+        """
+        self.cartella = cartella
+        self.campionamento = campionamento
+        self.memoria = memoria
+        self.max_profili = max_profili
+        self.righe_memoria = righe_memoria
+        self.casuale = casuale
+        self._lock = threading.Lock()
+
+    def attivo(self, forzato: bool = False) -> bool:
+        """Decide se profilare la prossima richiesta"""
+        return forzato or (self.campionamento > 0 and self.casuale() < self.campionamento)
+
+    @contextlib.contextmanager
+    def profila(self, richiesta: str) -> Iterator[Optional[str]]:
+        """
+        Profila il blocco e ne scrive i risultati nella cartella
+
+        Args:
+            richiesta: id della richiesta, usato nel nome dei file
+
+        Yields:
+            Path del file `.prof` che verrà scritto, o None se un altro
+            profilo è già in corso
+        """
+        if not self._lock.acquire(blocking=False):
+            yield None
+            return
+        try:
+            os.makedirs(self.cartella, exist_ok=True)
+            # Il nome inizia con l'istante, così l'ordine alfabetico è quello cronologico
+            istante = time.time_ns()
+            base = os.path.join(
+                self.cartella,
+                f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(istante // 10**9))}"
+                f"-{istante % 10**9:09d}-{os.getpid()}-{richiesta}"
+            )
+            profiler = cProfile.Profile()
+            memoria = self.memoria and not tracemalloc.is_tracing()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Un altro profiler è già attivo nel processo
+                yield None
+                return
+            if memoria:
+                tracemalloc.start()
+            try:
+                yield base + ".prof"
+            finally:
+                profiler.disable()
+                if memoria:
+                    self._scrivi_memoria(base + ".memoria.txt")
+                    tracemalloc.stop()
+                profiler.dump_stats(base + ".prof")
+                self._ruota()
+        finally:
+            self._lock.release()
+
+    def _scrivi_memoria(self, path: str):
+        """Picco di memoria e righe con più memoria allocata ancora in uso"""
+        _, picco = tracemalloc.get_traced_memory()
+        statistiche = tracemalloc.take_snapshot().filter_traces(_FILTRI_MEMORIA).statistics("lineno")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Picco: {picco / 1024:.1f} KiB\n\n")
+            for statistica in statistiche[:self.righe_memoria]:
+                f.write(f"{statistica}\n")
+
+    def profili(self) -> List[str]:
+        """File `.prof` presenti nella cartella, dal più vecchio al più recente"""
+        if not os.path.isdir(self.cartella):
+            return []
+        return sorted(
+            os.path.join(self.cartella, nome) for nome in os.listdir(self.cartella) if nome.endswith(".prof")
+        )
+
+    def _ruota(self):
+        """Elimina i profili più vecchi oltre `max_profili`"""
+        profili = self.profili()
+        for path in profili[:max(0, len(profili) - self.max_profili)]:
+            for file in (path, path[:-len(".prof")] + ".memoria.txt"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(file)
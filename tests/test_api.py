@@ -0,0 +1,121 @@
+import asyncio
+import json
+import time
+import unittest
+
+from mediterrania_orchestrator.api.server import ServizioAPI
+from mediterrania_orchestrator.utils.metrics import RegistroMetriche
+
+PROFILO = {
+    "sesso": "F", "età": 30, "peso": 65, "altezza": 165, "obiettivo": "Perdere peso",
+    "tipo_dieta": "vegetariano", "verdure_escluse": ["cipolla"]
+}
+
+async def richiesta(reader, writer, metodo, percorso, corpo=None):
+    """Invia una richiesta sulla connessione e restituisce stato, intestazioni e corpo decodificato"""
+    dati = json.dumps(corpo).encode("utf-8") if corpo is not None else b""
+    writer.write(f"{metodo} {percorso} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(dati)}\r\n\r\n".encode() + dati)
+    await writer.drain()
+    stato, *righe = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").strip().split("\r\n")
+    intestazioni = {nome.lower(): valore.strip() for nome, _, valore in (r.partition(":") for r in righe)}
+    contenuto = await reader.readexactly(int(intestazioni["content-length"]))
+    if intestazioni["content-type"].startswith("application/json"):
+        contenuto = json.loads(contenuto)
+    return int(stato.split()[1]), intestazioni, contenuto
+
+class TestServizioAPI(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.servizio = ServizioAPI(porta=0, processi=1, metriche=RegistroMetriche())
+        await self.servizio.avvia()
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.servizio.porta)
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        await self.servizio.arresta()
+
+    async def test_ricette_sulla_stessa_connessione(self):
+        stato, intestazioni, ricetta = await richiesta(self.reader, self.writer, "GET", "/ricette/PR001")
+        self.assertEqual(stato, 200)
+        self.assertEqual(ricetta["id_pasto"], "PR001")
+        self.assertEqual(intestazioni["connection"], "keep-alive")
+
+        stato, _, _ = await richiesta(self.reader, self.writer, "GET", "/ricette/INESISTENTE")
+        self.assertEqual(stato, 404)
+        stato, _, corpo = await richiesta(self.reader, self.writer, "GET", "/ricette?stagione=inverno")
+        self.assertEqual(stato, 200)
+        self.assertTrue(corpo["ricette"])
+        stato, _, _ = await richiesta(self.reader, self.writer, "DELETE", "/ricette/PR001")
+        self.assertEqual(stato, 405)
+
+    async def test_piani_e_verifica(self):
+        stato, _, corpo = await richiesta(self.reader, self.writer, "POST", "/piani", PROFILO)
+        self.assertEqual(stato, 422)
+        self.assertIn("Piano non bilanciato", corpo["errore"])
+
+        stato, _, corpo = await richiesta(self.reader, self.writer, "POST", "/piani", {"sesso": "F"})
+        self.assertEqual(stato, 400)
+        self.assertIn("tipo_dieta", corpo["errore"])
+        stato, _, _ = await richiesta(self.reader, self.writer, "POST", "/piani", dict(PROFILO, tipo_dieta="crudista"))
+        self.assertEqual(stato, 400)
+
+        piano = {"colazioni": ["COL001"], "pranzi": ["PR001"], "cene": ["CE003"], "spuntini": ["SP001"]}
+        stato, _, esito = await richiesta(self.reader, self.writer, "POST", "/verifica",
+                                          {"piano": piano, "dati_utente": PROFILO})
+        self.assertEqual(stato, 200)
+        self.assertIn("bilanciato", esito)
+        stato, _, esito = await richiesta(self.reader, self.writer, "POST", "/verifica",
+                                          {"piano": dict(piano, pranzi="PR001"), "dati_utente": PROFILO,
+                                           "settimanale": True})
+        self.assertEqual(stato, 400)
+        self.assertIn("pranzi", esito["errore"])
+
+        stato, _, testo = await richiesta(self.reader, self.writer, "GET", "/metrics")
+        self.assertEqual(stato, 200)
+        self.assertIn('mediterrania_http_durata_secondi_count{endpoint="piani",stato="422"} 1', testo.decode())
+
+    async def test_profilo_non_numerico(self):
+        stato, _, corpo = await richiesta(self.reader, self.writer, "POST", "/piani", dict(PROFILO, peso="65kg"))
+        self.assertEqual(stato, 400)
+        self.assertIn("peso", corpo["errore"])
+        stato, _, _ = await richiesta(self.reader, self.writer, "POST", "/piani", dict(PROFILO, età=None))
+        self.assertEqual(stato, 400)
+
+    async def test_invio_fallito_non_occupa_la_coda(self):
+        self.servizio.generatore.schedulatore.chiudi()
+        stato, _, _ = await richiesta(self.reader, self.writer, "POST", "/piani", PROFILO)
+        self.assertEqual(stato, 500)
+        self.assertEqual(self.servizio.in_coda, 0)
+        self.assertEqual(self.servizio.in_coda_classe.get("interattiva", 0), 0)
+
+    async def test_coda_piena(self):
+        self.servizio.in_coda_classe["interattiva"] = self.servizio.max_in_coda
+        stato, intestazioni, _ = await richiesta(self.reader, self.writer, "POST", "/piani", PROFILO)
+        self.assertEqual(stato, 503)
+        self.assertEqual(intestazioni["retry-after"], "1")
+        # La coda bulk è separata: i lavori massivi non tolgono posto alle richieste interattive
+        stato, _, _ = await richiesta(self.reader, self.writer, "POST", "/piani?priorita=bulk", PROFILO)
+        self.servizio.in_coda_classe["interattiva"] = 0
+        self.assertEqual(stato, 422)
+        stato, _, corpo = await richiesta(self.reader, self.writer, "POST", "/piani?priorita=urgente", PROFILO)
+        self.assertEqual(stato, 400)
+        self.assertIn("Priorità sconosciuta", corpo["errore"])
+
+    async def test_arresto_ordinato(self):
+        # L'unico worker resta occupato, così che la richiesta sia ancora in corso all'arresto
+        self.servizio.generatore.executor.submit(time.sleep, 0.3)
+        in_corso = asyncio.create_task(richiesta(self.reader, self.writer, "POST", "/piani", PROFILO))
+        while self.servizio.in_coda == 0:
+            await asyncio.sleep(0.001)
+        # Una connessione inattiva viene chiusa subito, quella occupata completa la richiesta
+        reader_inattivo, writer_inattivo = await asyncio.open_connection("127.0.0.1", self.servizio.porta)
+        while len(self.servizio._connessioni) < 2:
+            await asyncio.sleep(0.001)
+        await self.servizio.arresta()
+
+        stato, intestazioni, _ = await in_corso
+        self.assertEqual(stato, 422)
+        self.assertEqual(intestazioni["connection"], "close")
+        self.assertEqual(await reader_inattivo.read(), b"")
+        writer_inattivo.close()
+        with self.assertRaises(OSError):
+            await asyncio.open_connection("127.0.0.1", self.servizio.porta)
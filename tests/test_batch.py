@@ -0,0 +1,43 @@
+import unittest
+from mediterrania_orchestrator.core.batch import GeneratorePianiBatch
+
+def profilo(tipo_dieta, età=30):
+    return {
+        "sesso": "F",
+        "età": età,
+        "peso": 65,
+        "altezza": 165,
+        "obiettivo": "Perdere peso",
+        "tipo_dieta": tipo_dieta,
+        "allergie": [],
+        "verdure_escluse": ["cavolfiori"],
+        "preferenza_latte": "soia"
+    }
+
+class TestGeneratorePianiBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.generatore = GeneratorePianiBatch(processi=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.generatore.chiudi()
+
+    def test_esiti_in_ordine_con_errori_isolati(self):
+        profili = [profilo("vegano", 20 + i) for i in range(6)]
+        profili[2] = profilo("dieta_inesistente")
+        esiti = list(self.generatore.genera(iter(profili), max_in_corso=3))
+        self.assertEqual([e.indice for e in esiti], list(range(6)))
+        self.assertFalse(esiti[2].riuscito)
+        self.assertIn("KeyError", esiti[2].errore)
+        self.assertIs(esiti[4].dati_utente, profili[4])
+
+    def test_esiti_in_ordine_di_completamento(self):
+        profili = [profilo("vegetariano", 20 + i) for i in range(8)]
+        esiti = list(self.generatore.genera(profili, ordinato=False))
+        self.assertEqual(sorted(e.indice for e in esiti), list(range(8)))
+
+    def test_invio_di_un_singolo_profilo(self):
+        piano, errore = self.generatore.invia(profilo("dieta_inesistente")).result()
+        self.assertIsNone(piano)
+        self.assertIn("KeyError", errore)
@@ -0,0 +1,169 @@
+import json
+import os
+import random
+import unittest
+from dataclasses import asdict
+
+import numpy as np
+import pandas as pd
+
+from mediterrania_orchestrator.core.nutritional_verifier import VerificatoreNutrizionale
+from mediterrania_orchestrator.core.plan_builder import CostruttorePiano
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette, NUTRIENTI
+from mediterrania_orchestrator.database.recipe_tags import PORZIONE
+from mediterrania_orchestrator.utils.logger import LoggerMediterranIA
+
+UTENTI = [
+    {"sesso": "M", "età": 30, "peso": 80, "altezza": 180, "obiettivo": "Perdere peso"},
+    {"sesso": "F", "età": 45, "peso": 60, "altezza": 165, "obiettivo": "Mantenimento"},
+    {"sesso": "M", "età": 22, "peso": 70, "altezza": 175, "obiettivo": "Aumentare massa muscolare"},
+    {"sesso": "F", "età": 60, "peso": 55, "altezza": 158, "obiettivo": "Perdere peso"},
+]
+
+class TestVerificaBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        db = DatabaseRicette()
+        cls.verificatore = VerificatoreNutrizionale(db, LoggerMediterranIA())
+        with open(os.path.join(os.path.dirname(db.path_ricette), "base_plans.json"), encoding="utf-8") as f:
+            piani_base = list(json.load(f).values())
+        cls.piani = [piani_base[i % len(piani_base)] for i in range(len(UTENTI))]
+
+    def test_requisiti_uguali_allo_scalare(self):
+        requisiti = self.verificatore.calcola_requisiti_batch(UTENTI)
+        for i, utente in enumerate(UTENTI):
+            atteso = asdict(self.verificatore.calcola_requisiti(utente))
+            for campo, valore in atteso.items():
+                self.assertAlmostEqual(requisiti.iloc[i][campo], valore, places=9)
+
+    def test_accetta_dataframe(self):
+        da_lista = self.verificatore.calcola_requisiti_batch(UTENTI)
+        da_frame = self.verificatore.calcola_requisiti_batch(pd.DataFrame(UTENTI))
+        pd.testing.assert_frame_equal(da_lista, da_frame)
+
+    def test_bilanciamento_uguale_allo_scalare(self):
+        risultati = self.verificatore.verifica_bilanciamento_batch(self.piani, UTENTI)
+        self.assertEqual(len(risultati), len(UTENTI))
+        for i, (piano, utente) in enumerate(zip(self.piani, UTENTI)):
+            atteso = self.verificatore.verifica_bilanciamento(piano, utente)
+            riga = risultati.iloc[i]
+            self.assertEqual(bool(riga["bilanciato"]), atteso["bilanciato"])
+            self.assertEqual(riga["problemi"], atteso["problemi"])
+            for nutriente, analisi in atteso["analisi_dettagliata"].items():
+                self.assertAlmostEqual(riga[nutriente], analisi["valore_attuale"], places=6)
+                self.assertAlmostEqual(riga[f"{nutriente}_deviazione_percentuale"],
+                                       analisi["deviazione_percentuale"], places=6)
+
+    def test_problemi_solo_per_righe_fuori_range(self):
+        risultati = self.verificatore.verifica_bilanciamento_batch(self.piani, UTENTI)
+        for _, riga in risultati.iterrows():
+            self.assertEqual(bool(riga["bilanciato"]), not riga["problemi"])
+
+    def test_piano_vuoto(self):
+        risultati = self.verificatore.verifica_bilanciamento_batch([{}], UTENTI[:1])
+        self.assertTrue(np.all(risultati[["calorie", "fibre"]].to_numpy() == 0))
+        self.assertFalse(risultati.iloc[0]["bilanciato"])
+
+class TestVerificaRotazione(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = DatabaseRicette()
+        cls.verificatore = VerificatoreNutrizionale(cls.db, LoggerMediterranIA())
+        with open(os.path.join(os.path.dirname(cls.db.path_ricette), "base_plans.json"), encoding="utf-8") as f:
+            cls.piano = json.load(f)["V-M"]
+
+    def _totali_con_dizionari(self, giorno):
+        totali = dict.fromkeys(["calorie", "proteine", "carboidrati", "grassi", "fibre"], 0.0)
+        for ricette in self.piano.values():
+            ricetta = self.db.get_ricetta_by_id(ricette[giorno % len(ricette)])
+            if ricetta:
+                for nutriente in totali:
+                    totali[nutriente] += ricetta["valori_nutrizionali"][nutriente]
+        return totali
+
+    def test_ogni_giorno_della_settimana(self):
+        risultati = self.verificatore.verifica_rotazione(self.piano, UTENTI[1])
+        self.assertEqual(len(risultati["giorni"]), 7)
+        for giorno, esito in enumerate(risultati["giorni"]):
+            for nutriente, valore in self._totali_con_dizionari(giorno).items():
+                self.assertAlmostEqual(esito["valori_attuali"][nutriente], valore, places=6)
+
+    def test_primo_giorno_uguale_al_giorno_campione(self):
+        rotazione = self.verificatore.verifica_rotazione(self.piano, UTENTI[0])
+        campione = self.verificatore.verifica_bilanciamento(self.piano, UTENTI[0])
+        primo = rotazione["giorni"][0]
+        self.assertEqual(primo["bilanciato"], campione["bilanciato"])
+        for nutriente, analisi in campione["analisi_dettagliata"].items():
+            self.assertAlmostEqual(primo["deviazioni_percentuali"][nutriente],
+                                   analisi["deviazione_percentuale"], places=6)
+        problemi_primo = [p[len("Giorno 1: "):] for p in rotazione["problemi"] if p.startswith("Giorno 1: ")]
+        self.assertEqual(problemi_primo, campione["problemi"])
+
+    def test_media_e_giorno_peggiore(self):
+        risultati = self.verificatore.verifica_rotazione(self.piano, UTENTI[2])
+        calorie = [g["valori_attuali"]["calorie"] for g in risultati["giorni"]]
+        self.assertAlmostEqual(risultati["media"]["calorie"], sum(calorie) / len(calorie), places=6)
+        peggiore = max(range(7), key=lambda g: max(abs(d) for d in risultati["giorni"][g]["deviazioni_percentuali"].values()))
+        self.assertEqual(risultati["giorno_peggiore"], peggiore)
+        self.assertEqual(risultati["bilanciato"], all(g["bilanciato"] for g in risultati["giorni"]))
+
+    def test_pasti_non_in_lista(self):
+        for valore in ("COL001", ["COL001", 2], None):
+            piano = dict(self.piano, colazioni=valore)
+            with self.assertRaisesRegex(TypeError, "colazioni"):
+                self.verificatore.verifica_rotazione(piano, UTENTI[0])
+
+class TestCandidatiAmmissibili(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = DatabaseRicette()
+        cls.verificatore = VerificatoreNutrizionale(cls.db, LoggerMediterranIA())
+        cls.ids = {tipo: [r["id_pasto"] for r in cls.db.ricette[tipo]]
+                   for tipo in ("colazioni", "pranzi", "cene", "spuntini")}
+
+    def test_etichette_delimitano_i_valori(self):
+        etichette = self.db.etichette
+        for nutriente, k in (("proteine", 1), ("fibre", 4)):
+            valori = self.db.matrice_nutrienti[:, NUTRIENTI.index(nutriente)]
+            mezza = PORZIONE[nutriente] / 2
+            self.assertTrue(np.all(etichette.mezze_porzioni[:, k] * mezza <= valori))
+            self.assertTrue(np.all(valori < (etichette.mezze_porzioni[:, k] + 1) * mezza))
+        self.assertTrue(np.all(etichette.quote_min <= etichette.quote_max))
+
+    def test_precontrollo_non_scarta_piani_bilanciati(self):
+        casuale = random.Random(7)
+        scartati = 0
+        for _ in range(500):
+            piano = {tipo: [casuale.choice(ids)] for tipo, ids in self.ids.items()}
+            utente = dict(casuale.choice(UTENTI), peso=casuale.choice([50, 60, 70, 80]))
+            if self.verificatore.precontrollo(piano, self.verificatore.calcola_requisiti(utente)):
+                scartati += 1
+                self.assertFalse(self.verificatore.verifica_bilanciamento(piano, utente)["bilanciato"])
+        self.assertGreater(scartati, 0)
+
+    def test_candidati_scartati_solo_se_mai_bilanciati(self):
+        posizioni = [np.array([self.db.posizione_per_id[r] for r in ids]) for ids in self.ids.values()]
+        casuale = random.Random(7)
+        scartati = 0
+        for _ in range(300):
+            utente = dict(casuale.choice(UTENTI), peso=casuale.choice([50, 60, 70, 80]))
+            ammessi = self.verificatore.candidati_ammissibili(posizioni, self.verificatore.calcola_requisiti(utente))
+            scelte = {tipo: casuale.randrange(len(ids)) for tipo, ids in self.ids.items()}
+            if not all(maschera[scelte[tipo]] for tipo, maschera in zip(self.ids, ammessi)):
+                scartati += 1
+                piano = {tipo: [self.ids[tipo][i]] for tipo, i in scelte.items()}
+                self.assertFalse(self.verificatore.verifica_bilanciamento(piano, utente)["bilanciato"])
+        self.assertGreater(scartati, 0)
+
+    def test_costruzione_con_candidati_scartati(self):
+        utente = {"sesso": "F", "età": 30, "peso": 55, "altezza": 160, "obiettivo": "Perdere peso"}
+        esito = CostruttorePiano(self.db, self.verificatore).costruisci(self.ids, utente)
+        self.assertGreater(esito.candidati_scartati, 0)
+        self.assertTrue(esito.bilanciato)
+        # Il piano conserva tutti i candidati, con la ricetta scelta in testa
+        self.assertEqual({tipo: sorted(ricette) for tipo, ricette in esito.piano.items()},
+                         {tipo: sorted(ids) for tipo, ids in self.ids.items()})
+        risultati = self.verificatore.verifica_bilanciamento(esito.piano, utente)
+        self.assertTrue(risultati["bilanciato"])
+        self.assertIn("analisi_dettagliata", risultati)
+
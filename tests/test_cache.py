@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from mediterrania_orchestrator.cache.memory_cache import CacheLRU
+from mediterrania_orchestrator.cache.persistent_cache import CachePersistente
+from mediterrania_orchestrator.cache.profile_key import chiave_profilo
+from mediterrania_orchestrator.core.orchestrator import OrchestratoreAlimentare
+from mediterrania_orchestrator.core.substitution_handler import GestoreSostituzioni
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+
+class OrologioFinto:
+    def __init__(self):
+        self.adesso = 0.0
+
+    def __call__(self):
+        return self.adesso
+
+DATI_UTENTE = {
+    "sesso": "F",
+    "età": 30,
+    "peso": 65,
+    "altezza": 165,
+    "obiettivo": "Perdere peso",
+    "tipo_dieta": "vegetariano",
+    "allergie": ["noci", "uova"],
+    "verdure_escluse": ["cavolfiori"],
+    "preferenza_latte": "soia"
+}
+
+class TestCacheLRU(unittest.TestCase):
+    def test_eviction_lru(self):
+        cache = CacheLRU(dimensione_max=2)
+        cache.salva("a", 1)
+        cache.salva("b", 2)
+        self.assertEqual(cache.recupera("a"), 1)
+        cache.salva("c", 3)
+        self.assertIsNone(cache.recupera("b"))
+        self.assertEqual(cache.recupera("a"), 1)
+        self.assertEqual(cache.recupera("c"), 3)
+        statistiche = cache.statistiche()
+        self.assertEqual((statistiche["hit"], statistiche["miss"], statistiche["eviction"]), (3, 1, 1))
+
+    def test_ttl(self):
+        orologio = OrologioFinto()
+        cache = CacheLRU(dimensione_max=10, ttl=60, orologio=orologio)
+        cache.salva("a", 1)
+        orologio.adesso = 59
+        self.assertEqual(cache.recupera("a"), 1)
+        orologio.adesso = 60
+        self.assertEqual(cache.recupera("a", "assente"), "assente")
+        self.assertEqual(cache.statistiche()["scadenze"], 1)
+        self.assertEqual(len(cache), 0)
+
+class TestCachePersistente(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "piani.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_persistenza_e_versione_catalogo(self):
+        cache = CachePersistente(self.path, "v1")
+        cache.salva("a", {"piano": {"colazioni": ["COL001"]}})
+        cache.chiudi()
+
+        riaperta = CachePersistente(self.path, "v1")
+        self.assertEqual(riaperta.recupera("a"), {"piano": {"colazioni": ["COL001"]}})
+        riaperta.chiudi()
+
+        nuovo_catalogo = CachePersistente(self.path, "v2")
+        self.assertIsNone(nuovo_catalogo.recupera("a"))
+        nuovo_catalogo.salva("a", {"piano": {"colazioni": ["COL002"]}})
+        nuovo_catalogo.chiudi()
+
+        # Aprire il file con un altro catalogo non cancella i piani delle altre versioni
+        riaperta = CachePersistente(self.path, "v1")
+        self.assertEqual(riaperta.recupera("a"), {"piano": {"colazioni": ["COL001"]}})
+        self.assertEqual(len(riaperta), 2)
+        self.assertEqual(riaperta.elimina_altre_versioni(), 1)
+        self.assertEqual(len(riaperta), 1)
+        riaperta.chiudi()
+
+    def test_eviction(self):
+        cache = CachePersistente(self.path, "v1", dimensione_max=2)
+        for chiave in ("a", "b", "c"):
+            cache.salva(chiave, chiave)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.recupera("a"))
+        self.assertEqual(cache.recupera("c"), "c")
+        self.assertEqual(cache.statistiche()["eviction"], 1)
+        cache.chiudi()
+
+    def test_eviction_a_lotti_senza_conteggi(self):
+        cache = CachePersistente(self.path, "v1", dimensione_max=40)
+        istruzioni = []
+        cache._connessione().set_trace_callback(istruzioni.append)
+        for i in range(40):
+            cache.salva(str(i), i)
+        self.assertFalse(any("COUNT" in istruzione for istruzione in istruzioni))
+        # Superato il massimo, un solo conteggio e un lotto di 1/20 sotto il massimo
+        cache.salva("40", 40)
+        self.assertEqual(sum("COUNT" in istruzione for istruzione in istruzioni), 1)
+        self.assertEqual(len(cache), 38)
+        self.assertEqual(cache.statistiche()["eviction"], 3)
+        cache.chiudi()
+
+class TestMemoizzazioneSostituzioni(unittest.TestCase):
+    def setUp(self):
+        self.db = DatabaseRicette()
+        self.gestore = GestoreSostituzioni(self.db, dimensione_cache=16)
+        self.tipo_pasto, self.ricetta = next(
+            (tipo_pasto, ricetta) for tipo_pasto in ("pranzi", "cene") for ricetta in self.db.ricette[tipo_pasto]
+            if any(ing["nome"] == "cavolfiore" for ing in ricetta["ingredienti"])
+        )
+
+    def test_sostituzione_memorizzata(self):
+        prima = self.gestore._trova_sostituzione_ricetta(self.ricetta, {"cavolfiori"}, self.tipo_pasto)
+        seconda = self.gestore._trova_sostituzione_ricetta(self.ricetta, {"Cavolfiore"}, self.tipo_pasto)
+        self.assertIsNotNone(prima)
+        self.assertIs(prima, seconda)
+        self.assertEqual(self.gestore.cache_sostituzioni.statistiche()["hit"], 1)
+
+    def test_assenza_di_sostituto_memorizzata(self):
+        ricetta = self.db.ricette["colazioni"][0]
+        self.assertIsNone(self.gestore._trova_sostituzione_ricetta(ricetta, {"x"}, "tipo_inesistente"))
+        self.assertIsNone(self.gestore._trova_sostituzione_ricetta(ricetta, {"x"}, "tipo_inesistente"))
+        self.assertEqual(self.gestore.cache_sostituzioni.statistiche()["hit"], 1)
+
+    def test_invalidazione_cambio_catalogo(self):
+        self.gestore._trova_sostituzione_ricetta(self.ricetta, {"cavolfiori"}, self.tipo_pasto)
+        self.db.versione = "nuova"
+        self.gestore._trova_sostituzione_ricetta(self.ricetta, {"cavolfiori"}, self.tipo_pasto)
+        statistiche = self.gestore.cache_sostituzioni.statistiche()
+        self.assertEqual((statistiche["hit"], statistiche["miss"]), (0, 2))
+
+class TestChiaveProfilo(unittest.TestCase):
+    def test_profili_equivalenti(self):
+        equivalente = dict(DATI_UTENTE, peso=65.0, allergie=["Uova", "noci"],
+                           verdure_escluse=["cavolfiore"], nome="Maria")
+        self.assertEqual(chiave_profilo(DATI_UTENTE, "autunno"), chiave_profilo(equivalente, "autunno"))
+
+    def test_campi_rilevanti(self):
+        base = chiave_profilo(DATI_UTENTE, "autunno")
+        self.assertNotEqual(base, chiave_profilo(DATI_UTENTE, "inverno"))
+        self.assertNotEqual(base, chiave_profilo(dict(DATI_UTENTE, peso=66), "autunno"))
+        self.assertNotEqual(base, chiave_profilo(dict(DATI_UTENTE, preferenza_latte="avena"), "autunno"))
+
+class TestCachePianiOrchestratore(unittest.TestCase):
+    def test_esito_riutilizzato(self):
+        orchestratore = OrchestratoreAlimentare(dimensione_cache_piani=8)
+        esiti = []
+        for _ in range(2):
+            try:
+                esiti.append(orchestratore.crea_piano_personalizzato(dict(DATI_UTENTE)))
+            except ValueError as e:
+                esiti.append(str(e))
+        self.assertEqual(esiti[0], esiti[1])
+        statistiche = orchestratore.cache_piani.statistiche()
+        self.assertEqual((statistiche["hit"], statistiche["miss"]), (1, 1))
+
+    def test_invalidazione_cambio_catalogo(self):
+        orchestratore = OrchestratoreAlimentare(dimensione_cache_piani=8)
+        for versione in (None, "nuova"):
+            if versione is not None:
+                # Come dopo `ricarica()` di un catalogo modificato
+                orchestratore.db_ricette.versione = versione
+            try:
+                orchestratore.crea_piano_personalizzato(dict(DATI_UTENTE))
+            except ValueError:
+                pass
+        statistiche = orchestratore.cache_piani.statistiche()
+        self.assertEqual((statistiche["hit"], statistiche["miss"]), (0, 2))
+
+    def test_avvio_con_cache_persistente(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "piani.sqlite")
+            esiti = []
+            for _ in range(2):
+                orchestratore = OrchestratoreAlimentare(path_cache_persistente=path)
+                try:
+                    esiti.append(orchestratore.crea_piano_personalizzato(dict(DATI_UTENTE)))
+                except ValueError as e:
+                    esiti.append(str(e))
+                orchestratore.cache_persistente.chiudi()
+            self.assertEqual(esiti[0], esiti[1])
+            self.assertEqual(orchestratore.cache_persistente.statistiche()["hit"], 1)
+
+    def test_cache_persistente_dopo_ricarica(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path_ricette = os.path.join(directory, "ricette.json")
+            shutil.copy(DatabaseRicette().path_ricette, path_ricette)
+            orchestratore = OrchestratoreAlimentare(
+                db_ricette=DatabaseRicette(path_ricette),
+                path_cache_persistente=os.path.join(directory, "piani.sqlite")
+            )
+            esiti = []
+            for modifica in (False, True):
+                if modifica:
+                    with open(path_ricette, "r", encoding="utf-8") as f:
+                        catalogo = json.load(f)
+                    for tipo_pasto in ("colazioni", "pranzi", "cene", "spuntini"):
+                        for ricetta in catalogo[tipo_pasto]:
+                            ricetta["valori_nutrizionali"]["proteine"] *= 2
+                    with open(path_ricette, "w", encoding="utf-8") as f:
+                        json.dump(catalogo, f)
+                    orchestratore.db_ricette.ricarica()
+                try:
+                    esiti.append(orchestratore.crea_piano_personalizzato(dict(DATI_UTENTE)))
+                except ValueError as e:
+                    esiti.append(str(e))
+            orchestratore.cache_persistente.chiudi()
+            # Il piano calcolato con il vecchio catalogo non viene più servito
+            self.assertNotEqual(esiti[0], esiti[1])
+            statistiche = orchestratore.cache_persistente.statistiche()
+            self.assertEqual((statistiche["hit"], statistiche["miss"]), (0, 2))
+
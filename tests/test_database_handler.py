@@ -0,0 +1,204 @@
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette, NUTRIENTI, TIPI_PASTO
+from mediterrania_orchestrator.database.ingredient_index import normalizza_ingrediente
+from mediterrania_orchestrator.database.property_index import Filtro
+from mediterrania_orchestrator.database.shared_catalog import CatalogoCondiviso
+from mediterrania_orchestrator.core.substitution_handler import GestoreSostituzioni
+
+class TestDatabaseRicette(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = DatabaseRicette()
+
+    def test_colonne_allineate(self):
+        self.assertEqual(len(self.db.ids), len(self.db.ricette_per_id))
+        self.assertEqual(self.db.matrice_nutrienti.shape, (len(self.db.ids), len(NUTRIENTI)))
+        for pos, id_ricetta in enumerate(self.db.ids):
+            ricetta = self.db.get_ricetta_by_id(id_ricetta)
+            self.assertEqual(self.db.posizione_per_id[id_ricetta], pos)
+            self.assertEqual(self.db.matrice_nutrienti[pos, 0], ricetta["valori_nutrizionali"]["calorie"])
+            self.assertIn(ricetta, self.db.ricette[TIPI_PASTO[self.db.codici_tipo_pasto[pos]]])
+
+    def test_nomi_canonici(self):
+        self.assertEqual(normalizza_ingrediente("Cavolfiori"), normalizza_ingrediente("cavolfiore"))
+        self.assertEqual(normalizza_ingrediente("fiocchi d'avena"), normalizza_ingrediente("fiocchi di avena"))
+        self.assertNotEqual(normalizza_ingrediente("mele"), normalizza_ingrediente("miele"))
+
+    def test_singolare_e_plurale_con_genere(self):
+        for singolare, plurale in (("pesca", "pesche"), ("pesce", "pesci"), ("pasta", "paste"), ("pasto", "pasti"),
+                                   ("arancia", "arance"), ("fungo", "funghi"), ("finocchio", "finocchi"),
+                                   ("noce", "noci"), ("uovo", "uova")):
+            self.assertEqual(normalizza_ingrediente(singolare), normalizza_ingrediente(plurale))
+        # La vocale di genere distingue parole diverse con lo stesso tema
+        for a, b in (("pesce", "pesca"), ("pesce", "pesche"), ("pesci", "pesche"), ("pasta", "pasto")):
+            self.assertNotEqual(normalizza_ingrediente(a), normalizza_ingrediente(b))
+
+    def test_indice_ingredienti(self):
+        attese = {
+            id_ricetta for id_ricetta, ricetta in self.db.ricette_per_id.items()
+            if any(ing["nome"] in ("cavolfiore", "carota", "carote") for ing in ricetta["ingredienti"])
+        }
+        self.assertTrue(attese)
+        self.assertEqual(self.db.get_ricette_con_ingredienti(["cavolfiori", "Carota"]), attese)
+        self.assertEqual(self.db.get_ricette_con_ingredienti(["ingrediente inesistente"]), set())
+
+    def test_sostituzione_vettoriale_come_scansione(self):
+        gestore = GestoreSostituzioni(self.db)
+        for tipo_pasto in TIPI_PASTO:
+            for ricetta in self.db.ricette[tipo_pasto]:
+                verdure_escluse = {ricetta["ingredienti"][0]["nome"]}
+                atteso = self._scansione(gestore, ricetta, verdure_escluse, tipo_pasto)
+                sostituzione = gestore._trova_sostituzione_ricetta(ricetta, verdure_escluse, tipo_pasto)
+                self.assertEqual(atteso, sostituzione.ricetta_sostitutiva if sostituzione else None)
+
+    def _scansione(self, gestore, ricetta, verdure_escluse, tipo_pasto):
+        """Ricerca di riferimento con la scansione lineare del catalogo"""
+        compatibili = [
+            candidato for candidato in self.db.ricette[tipo_pasto]
+            if not any(normalizza_ingrediente(ing["nome"]) in {normalizza_ingrediente(v) for v in verdure_escluse}
+                       for ing in candidato["ingredienti"])
+            and gestore._valori_nutrizionali_simili(ricetta, candidato)
+        ]
+        if not compatibili:
+            return None
+        return min(compatibili, key=lambda x: abs(x["valori_nutrizionali"]["calorie"] -
+                                                  ricetta["valori_nutrizionali"]["calorie"]))["id_pasto"]
+
+    def test_get_ricette_stagione(self):
+        for stagione in ("primavera", "estate", "autunno", "inverno"):
+            attese = [
+                ricetta for ricetta in self.db.ricette_per_id.values()
+                if stagione in ricetta["proprieta"]["stagione"] or "tutte" in ricetta["proprieta"]["stagione"]
+            ]
+            self.assertEqual(self.db.get_ricette_stagione(stagione), attese)
+
+    def test_cerca_ricette_filtri_composti(self):
+        filtro = (Filtro.proprieta("vegano") & Filtro.proprieta("senza_glutine") &
+                  Filtro.stagione("autunno") & Filtro.tipo_pasto("cene"))
+        attese = [
+            ricetta["id_pasto"] for ricetta in self.db.ricette["cene"]
+            if ricetta["proprieta"]["vegano"] and ricetta["proprieta"]["senza_glutine"]
+            and ({"autunno", "tutte"} & set(ricetta["proprieta"]["stagione"]))
+        ]
+        self.assertEqual(self.db.cerca_ricette(filtro), attese)
+
+        colazioni_o_spuntini = self.db.cerca_ricette(Filtro.tipo_pasto("colazioni") | Filtro.tipo_pasto("spuntini"))
+        self.assertEqual(len(colazioni_o_spuntini), len(self.db.ricette["colazioni"]) + len(self.db.ricette["spuntini"]))
+        self.assertIn("PR004", self.db.cerca_ricette(~Filtro.proprieta("senza_glutine")))
+        self.assertNotIn("PR004", self.db.cerca_ricette(Filtro.proprieta("senza_glutine")))
+        self.assertEqual(self.db.cerca_ricette(Filtro.proprieta("inesistente")), [])
+
+    def test_chiave_sconosciuta_in_un_and(self):
+        self.assertEqual(self.db.cerca_ricette(Filtro.proprieta("vegano") & Filtro.proprieta("inesistente")), [])
+        self.assertEqual(self.db.cerca_ricette(Filtro.stagione("autunno") & Filtro.tipo_pasto("cenne")), [])
+        # Dentro un OR o negata, la chiave sconosciuta resta un predicato mai soddisfatto
+        self.assertEqual(self.db.cerca_ricette(Filtro.proprieta("vegano") | Filtro.tipo_pasto("cenne")),
+                         self.db.cerca_ricette(Filtro.proprieta("vegano")))
+        self.assertEqual(len(self.db.cerca_ricette(~Filtro.tipo_pasto("cenne") & Filtro.proprieta("vegano"))),
+                         len(self.db.cerca_ricette(Filtro.proprieta("vegano"))))
+
+    def test_grafo_come_ricerca_completa(self):
+        con_grafo = GestoreSostituzioni(self.db)
+        senza_grafo = GestoreSostituzioni(self.db, path_grafo="grafo_inesistente.json")
+        self.assertIsNotNone(con_grafo.grafo)
+        self.assertIsNone(senza_grafo.grafo)
+        for tipo_pasto in TIPI_PASTO:
+            for ricetta in self.db.ricette[tipo_pasto]:
+                for esclusi, preferiti in (([ricetta["ingredienti"][0]["nome"]], ()),
+                                           (["latte"], ["latte di mandorla", "latte vegetale"])):
+                    attesa = senza_grafo._crea_sostituzione(ricetta["id_pasto"], esclusi, tipo_pasto, "test", preferiti)
+                    ottenuta = con_grafo._crea_sostituzione(ricetta["id_pasto"], esclusi, tipo_pasto, "test", preferiti)
+                    self.assertEqual(attesa, ottenuta)
+
+class TestSnapshotCatalogo(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "ricette.json")
+        shutil.copy(DatabaseRicette().path_ricette, self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_snapshot_equivalente_al_json(self):
+        da_json = DatabaseRicette(self.path)
+        DatabaseRicette(self.path, usa_snapshot=True)
+        self.assertTrue(os.path.exists(self.path + ".snapshot"))
+        da_snapshot = DatabaseRicette(self.path, usa_snapshot=True)
+        self.assertEqual(da_snapshot.versione, da_json.versione)
+        self.assertEqual(da_snapshot.ricette_per_id, da_json.ricette_per_id)
+        self.assertEqual(da_snapshot.ids.tolist(), da_json.ids.tolist())
+        self.assertTrue((da_snapshot.matrice_nutrienti == da_json.matrice_nutrienti).all())
+        self.assertEqual(da_snapshot.cerca_ricette(Filtro.stagione("estate")), da_json.cerca_ricette(Filtro.stagione("estate")))
+        self.assertTrue((da_snapshot.etichette.mezze_porzioni == da_json.etichette.mezze_porzioni).all())
+
+    def test_snapshot_rigenerato_se_obsoleto(self):
+        vecchio = DatabaseRicette(self.path, usa_snapshot=True)
+        with open(self.path, "r", encoding="utf-8") as f:
+            catalogo = json.load(f)
+        catalogo["spuntini"] = catalogo["spuntini"][:1]
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(catalogo, f)
+        nuovo = DatabaseRicette(self.path, usa_snapshot=True)
+        self.assertNotEqual(nuovo.versione, vecchio.versione)
+        self.assertEqual(len(nuovo.ricette["spuntini"]), 1)
+
+def _ricetta_da_worker(nome_segmento, id_ricetta):
+    catalogo = CatalogoCondiviso.collega(nome_segmento, tracker_condiviso=True)
+    db = DatabaseRicette.da_catalogo_condiviso(catalogo)
+    ricetta = db.get_ricetta_by_id(id_ricetta)
+    scrivibile = db.matrice_nutrienti.flags.writeable
+    del db
+    catalogo.chiudi()
+    return ricetta, scrivibile
+
+class TestCatalogoCondiviso(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = DatabaseRicette()
+        cls.catalogo = CatalogoCondiviso.crea(cls.db)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.catalogo.chiudi()
+        cls.catalogo.elimina()
+
+    def test_interfaccia_come_database_json(self):
+        collegato = CatalogoCondiviso.collega(self.catalogo.nome, tracker_condiviso=True)
+        condiviso = DatabaseRicette.da_catalogo_condiviso(collegato)
+        self.assertEqual(condiviso.versione, self.db.versione)
+        self.assertEqual(condiviso.get_ricetta_by_id("PR004"), self.db.get_ricetta_by_id("PR004"))
+        self.assertIsNone(condiviso.get_ricetta_by_id("inesistente"))
+        self.assertEqual(condiviso.get_ricette_stagione("inverno"), self.db.get_ricette_stagione("inverno"))
+        self.assertEqual(condiviso.get_ricette_con_ingredienti(["cavolfiori", "carote"]),
+                         self.db.get_ricette_con_ingredienti(["cavolfiori", "carote"]))
+        self.assertEqual(list(condiviso.ricette["cene"]), self.db.ricette["cene"])
+        self.assertTrue((condiviso.etichette.mezze_porzioni == self.db.etichette.mezze_porzioni).all())
+        del condiviso
+        collegato.chiudi()
+
+    def test_worker_collegato_in_sola_lettura(self):
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            ricetta, scrivibile = pool.apply(_ricetta_da_worker, (self.catalogo.nome, "COL001"))
+        self.assertEqual(ricetta, self.db.get_ricetta_by_id("COL001"))
+        self.assertFalse(scrivibile)
+
+    def test_processo_indipendente_non_rimuove_il_segmento(self):
+        # Un processo con un proprio resource tracker si collega e termina, attendendo
+        # che il tracker esegua la pulizia di uscita
+        codice = (
+            "import os, sys; from multiprocessing import resource_tracker; "
+            "from mediterrania_orchestrator.database.shared_catalog import CatalogoCondiviso; "
+            "CatalogoCondiviso.collega(sys.argv[1]).chiudi(); "
+            "tracker = resource_tracker._resource_tracker; "
+            "tracker._fd is not None and (os.close(tracker._fd), os.waitpid(tracker._pid, 0))"
+        )
+        subprocess.run([sys.executable, "-c", codice, self.catalogo.nome], check=True)
+        collegato = CatalogoCondiviso.collega(self.catalogo.nome, tracker_condiviso=True)
+        collegato.chiudi()
@@ -0,0 +1,72 @@
+import itertools
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from mediterrania_orchestrator.core.orchestrator import OrchestratoreAlimentare
+from mediterrania_orchestrator.utils.event_log import RegistroEventi, chiudi_registri
+
+class TestRegistroEventi(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "eventi.jsonl")
+
+    def tearDown(self):
+        chiudi_registri()
+        self.tmp.cleanup()
+
+    def _eventi(self, path=None):
+        chiudi_registri()
+        with open(path or self.path, encoding="utf-8") as f:
+            return [json.loads(riga) for riga in f]
+
+    def test_righe_json_compatte(self):
+        registro = RegistroEventi(self.path)
+        self.assertTrue(registro.registra("sostituzione", "r1", fase="personalizzazione",
+                                          ricetta_originale="PR001", delta={"calorie": -20.0}))
+        evento, = self._eventi()
+        self.assertEqual(evento["tipo"], "sostituzione")
+        self.assertEqual(evento["richiesta"], "r1")
+        self.assertEqual(evento["delta"], {"calorie": -20.0})
+        with open(self.path, encoding="utf-8") as f:
+            self.assertNotIn(" ", f.readline())
+
+    def test_campionamento_per_tipo(self):
+        valori = itertools.cycle([0.1, 0.9])
+        registro = RegistroEventi(self.path, {"sostituzione": 0.5, "verifica": 0}, casuale=lambda: next(valori))
+        for i in range(10):
+            registro.registra("sostituzione", str(i))
+            registro.registra("verifica", str(i))
+            registro.registra("piano", str(i))
+        conteggi = pd.Series([e["tipo"] for e in self._eventi()]).value_counts().to_dict()
+        self.assertEqual(conteggi, {"piano": 10, "sostituzione": 5})
+
+    def test_rotazione_per_dimensione(self):
+        registro = RegistroEventi(self.path, dimensione_max=2000, backup=2)
+        for i in range(200):
+            registro.registra("piano", str(i), durata_ms=1.0)
+        chiudi_registri()
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertTrue(os.path.exists(self.path + ".2"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+        self.assertLessEqual(os.path.getsize(self.path), 2000)
+
+    def test_eventi_dell_orchestratore(self):
+        orchestratore = OrchestratoreAlimentare(path_eventi=self.path)
+        dati_utente = {
+            "sesso": "F", "età": 30, "peso": 65, "altezza": 165, "obiettivo": "Perdere peso",
+            "tipo_dieta": "vegetariano", "allergie": [], "verdure_escluse": ["cipolla"]
+        }
+        with self.assertRaises(ValueError):
+            orchestratore.crea_piano_personalizzato(dati_utente)
+        eventi = pd.DataFrame(self._eventi())
+        self.assertEqual(eventi["richiesta"].nunique(), 1)
+        self.assertEqual(set(eventi["tipo"]), {"sostituzione", "verifica", "piano"})
+        sostituzioni = eventi[eventi["tipo"] == "sostituzione"]
+        self.assertTrue(all(set(delta) >= {"calorie", "proteine"} for delta in sostituzioni["delta"]))
+        piano = eventi[eventi["tipo"] == "piano"].iloc[0]
+        self.assertFalse(piano["bilanciato"])
+        self.assertIn("personalizzazione", piano["durate"])
@@ -0,0 +1,72 @@
+import logging
+import logging.handlers
+import os
+import tempfile
+import unittest
+import uuid
+
+from mediterrania_orchestrator.utils import logger as modulo_logger
+from mediterrania_orchestrator.utils.logger import LoggerMediterranIA, arresta_logging
+
+class TestLoggerAsincrono(unittest.TestCase):
+    def setUp(self):
+        # I log del test vanno in una directory temporanea
+        arresta_logging()
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        arresta_logging()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def _leggi_log(self):
+        with open(os.path.join("logs", "mediterrania.log"), encoding="utf-8") as f:
+            return f.read()
+
+    def test_handler_installati_una_volta(self):
+        for _ in range(5):
+            LoggerMediterranIA()
+        handler = [h for h in logging.getLogger("MediterranIA").handlers
+                   if isinstance(h, logging.handlers.QueueHandler)]
+        self.assertEqual(len(handler), 1)
+
+        messaggio = f"messaggio-{uuid.uuid4()}"
+        LoggerMediterranIA().log_info("%s", messaggio)
+        arresta_logging()
+        self.assertEqual(self._leggi_log().count(messaggio), 1)
+
+    def test_scrittura_nel_thread_di_background(self):
+        logger = LoggerMediterranIA()
+        self.assertIsNotNone(modulo_logger._listener)
+        logger.log_sostituzione("PR001", "PR002", "test")
+        arresta_logging()
+        self.assertIn("Originale: PR001 -> Nuova: PR002 - Motivo: test", self._leggi_log())
+
+    def test_livello_scelto_dall_applicazione(self):
+        logger = logging.getLogger("MediterranIA")
+        precedente = logger.level
+        logger.setLevel(logging.WARNING)
+        try:
+            # Né la prima installazione né le istanze successive toccano il livello
+            for _ in range(2):
+                self.assertFalse(LoggerMediterranIA().abilitato(logging.INFO))
+            self.assertEqual(logger.level, logging.WARNING)
+        finally:
+            logger.setLevel(precedente)
+
+    def test_formattazione_pigra(self):
+        logger = LoggerMediterranIA()
+        logger.logger.setLevel(logging.WARNING)
+        try:
+            self.assertFalse(logger.abilitato(logging.INFO))
+
+            class NonFormattabile:
+                def __format__(self, spec):
+                    raise AssertionError("messaggio formattato con livello disattivato")
+                __str__ = __repr__ = lambda self: self.__format__("")
+
+            logger.log_info("%s", NonFormattabile())
+        finally:
+            logger.logger.setLevel(logging.DEBUG)
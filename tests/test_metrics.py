@@ -0,0 +1,88 @@
+import os
+import random
+import tempfile
+import unittest
+
+from mediterrania_orchestrator.core.orchestrator import OrchestratoreAlimentare
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+from mediterrania_orchestrator.utils.metrics import Istogramma, RegistroMetriche, cronometrato
+
+class TestIstogramma(unittest.TestCase):
+    def test_quantili_con_errore_limitato(self):
+        casuale = random.Random(3)
+        valori = sorted(casuale.lognormvariate(-7, 1.5) for _ in range(5000))
+        istogramma = Istogramma()
+        for valore in valori:
+            istogramma.osserva(valore)
+        for q in (0.5, 0.95, 0.99):
+            esatto = valori[int(q * len(valori)) - 1]
+            self.assertAlmostEqual(istogramma.quantile(q) / esatto, 1, delta=0.1)
+        self.assertEqual(istogramma.quantile(1.0), max(valori))
+        self.assertEqual(istogramma.conteggio, 5000)
+
+    def test_vuoto(self):
+        self.assertEqual(Istogramma().quantile(0.99), 0.0)
+
+class TestRegistroMetriche(unittest.TestCase):
+    def setUp(self):
+        self.metriche = RegistroMetriche()
+
+    def test_istantanea_ed_esportazione(self):
+        for durata in (0.001, 0.002, 0.004):
+            self.metriche.osserva("fase_durata_secondi", durata, fase="verifica")
+        self.metriche.incrementa("richieste_total", esito="cache")
+        self.metriche.registra_collettore(lambda: [("cache_hit_rate", {"livello": "memoria"}, 0.5)])
+
+        stato = self.metriche.istantanea()
+        istogramma, = stato["istogrammi"]
+        self.assertEqual(istogramma["etichette"], {"fase": "verifica"})
+        self.assertEqual(istogramma["conteggio"], 3)
+        self.assertLessEqual(istogramma["p99"], 0.004)
+
+        testo = self.metriche.esporta_prometheus()
+        self.assertIn("# TYPE mediterrania_fase_durata_secondi summary", testo)
+        self.assertIn('mediterrania_fase_durata_secondi_count{fase="verifica"} 3', testo)
+        self.assertIn('mediterrania_richieste_total{esito="cache"} 1.0', testo)
+        self.assertIn('mediterrania_cache_hit_rate{livello="memoria"} 0.5', testo)
+
+        with tempfile.TemporaryDirectory() as cartella:
+            path = os.path.join(cartella, "mediterrania.prom")
+            self.metriche.scrivi_prometheus(path)
+            with open(path, encoding="utf-8") as f:
+                self.assertIn("mediterrania_fase_durata_secondi", f.read())
+
+    def test_collettori_di_metodi_non_trattengono_l_oggetto(self):
+        class Sorgente:
+            def valori(self):
+                return [("valore", {}, 1.0)]
+
+        sorgente = Sorgente()
+        self.metriche.registra_collettore(sorgente.valori)
+        self.assertIn("valore", [v["nome"] for v in self.metriche.istantanea()["valori"]])
+        del sorgente
+        self.assertNotIn("valore", [v["nome"] for v in self.metriche.istantanea()["valori"]])
+
+    def test_cronometrato_con_campionamento(self):
+        @cronometrato("durata_secondi", registro=self.metriche, campionamento=4, operazione="somma")
+        def somma(a, b):
+            return a + b
+
+        self.assertEqual([somma(i, 1) for i in range(8)], list(range(1, 9)))
+        self.assertEqual(self.metriche.istogramma("durata_secondi", operazione="somma").conteggio, 2)
+
+    def test_durate_per_fase_dell_orchestratore(self):
+        orchestratore = OrchestratoreAlimentare(db_ricette=DatabaseRicette(), metriche=self.metriche)
+        dati_utente = {
+            "sesso": "F", "età": 30, "peso": 65, "altezza": 165, "obiettivo": "Perdere peso",
+            "tipo_dieta": "vegetariano", "verdure_escluse": ["cipolla"]
+        }
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                orchestratore.crea_piano_personalizzato(dati_utente)
+        stato = self.metriche.istantanea()
+        fasi = {i["etichette"]["fase"] for i in stato["istogrammi"] if i["nome"] == "fase_durata_secondi"}
+        self.assertEqual(fasi, {"cache", "selezione", "personalizzazione", "verifica"})
+        esiti = {c["etichette"]["esito"]: c["valore"] for c in stato["contatori"]}
+        self.assertEqual(esiti, {"non_bilanciato": 1, "cache": 1})
+        hit_rate = [v["valore"] for v in stato["valori"] if v["nome"] == "cache_hit_rate"]
+        self.assertEqual(hit_rate, [0.5])
@@ -0,0 +1,99 @@
+import unittest
+from mediterrania_orchestrator.core.nutritional_verifier import VerificatoreNutrizionale
+from mediterrania_orchestrator.core.plan_totals import TotaliPiano
+from mediterrania_orchestrator.core.substitution_handler import GestoreSostituzioni
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+from mediterrania_orchestrator.database.ingredient_index import normalizza_ingrediente
+
+class TestPersonalizzazionePiano(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = DatabaseRicette()
+        cls.piano = {tipo_pasto: [r["id_pasto"] for r in cls.db.ricette[tipo_pasto]]
+                     for tipo_pasto in ("colazioni", "pranzi", "cene", "spuntini")}
+
+    def setUp(self):
+        self.gestore = GestoreSostituzioni(self.db)
+
+    def _ingredienti(self, id_ricetta):
+        return {normalizza_ingrediente(ing["nome"]) for ing in self.db.get_ricetta_by_id(id_ricetta)["ingredienti"]}
+
+    def test_tutti_i_vincoli_rispettati(self):
+        allergie, verdure = ["noci", "mandorle"], ["pomodori", "cipolla", "zucchine"]
+        piano, sostituzioni = self.gestore.personalizza_piano(self.piano, allergie, verdure, "mandorla")
+        vietati = {normalizza_ingrediente(i) for i in allergie + verdure + ["latte"]}
+        self.assertTrue(sostituzioni)
+        for ricette in piano.values():
+            for id_ricetta in ricette:
+                self.assertFalse(self._ingredienti(id_ricetta) & vietati, id_ricetta)
+        for sostituzione in sostituzioni:
+            self.assertNotIn(sostituzione.ricetta_sostitutiva, self.db.get_ricette_con_ingredienti(allergie))
+
+    def test_equivalente_ai_passaggi_separati_senza_conflitti(self):
+        verdure = {"cipolla"}
+        atteso, _ = self.gestore.sostituisci_verdure(self.piano, verdure)
+        piano, _ = self.gestore.personalizza_piano(self.piano, verdure_escluse=verdure)
+        self.assertEqual(piano, atteso)
+
+    def test_allergeni_rimossi_senza_sostituzione(self):
+        piano, sostituzioni = self.gestore.personalizza_piano(self.piano, allergie=["cavolfiori"])
+        self.assertNotIn("PR032", piano["pranzi"])
+        self.assertEqual(sostituzioni, [])
+        self.assertEqual(len(piano["pranzi"]), len(self.piano["pranzi"]) - 1)
+
+
+class TestTotaliIncrementali(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = DatabaseRicette()
+        cls.verificatore = VerificatoreNutrizionale(cls.db)
+        cls.piano = {tipo_pasto: [r["id_pasto"] for r in cls.db.ricette[tipo_pasto]]
+                     for tipo_pasto in ("colazioni", "pranzi", "cene", "spuntini")}
+
+    def setUp(self):
+        self.gestore = GestoreSostituzioni(self.db)
+
+    def _confronta(self, totali, piano):
+        atteso = self.verificatore._calcola_totali_giornalieri(piano)
+        for nutriente, valore in totali.come_dizionario().items():
+            self.assertAlmostEqual(valore, atteso[nutriente], places=6)
+
+    def test_delta_completo(self):
+        _, sostituzioni = self.gestore.personalizza_piano(self.piano, verdure_escluse=["cipolla"])
+        self.assertTrue(sostituzioni)
+        for sostituzione in sostituzioni:
+            originale = self.db.get_ricetta_by_id(sostituzione.ricetta_originale)["valori_nutrizionali"]
+            sostitutiva = self.db.get_ricetta_by_id(sostituzione.ricetta_sostitutiva)["valori_nutrizionali"]
+            for nutriente, delta in sostituzione.delta_nutrienti.items():
+                self.assertAlmostEqual(delta, sostitutiva[nutriente] - originale[nutriente], places=6)
+            self.assertAlmostEqual(sostituzione.valore_nutrizionale_delta, abs(sostituzione.delta_nutrienti["calorie"]))
+
+    def test_totali_uguali_al_ricalcolo(self):
+        profili = [
+            {"verdure_escluse": ["cipolla", "pomodori"]},
+            {"preferenza_latte": "soia"},
+            {"allergie": ["uova", "noci"], "verdure_escluse": ["zucchine"], "preferenza_latte": "mandorla"},
+        ]
+        for profilo in profili:
+            totali = TotaliPiano.da_piano(self.piano, self.db)
+            piano, _ = self.gestore.personalizza_piano(self.piano, totali=totali, **profilo)
+            self._confronta(totali, piano)
+
+    def test_rimozione_del_campione(self):
+        primo = self.piano["pranzi"][0]
+        allergene = next(ing["nome"] for ing in self.db.get_ricetta_by_id(primo)["ingredienti"])
+        totali = TotaliPiano.da_piano(self.piano, self.db)
+        piano, _ = self.gestore.personalizza_piano(self.piano, allergie=[allergene], totali=totali)
+        self.assertNotEqual(piano["pranzi"][0], primo)
+        self._confronta(totali, piano)
+
+    def test_annulla(self):
+        totali = TotaliPiano.da_piano(self.piano, self.db)
+        iniziali = dict(totali.valori)
+        _, sostituzioni = self.gestore.personalizza_piano(self.piano, verdure_escluse=["cipolla", "aglio"])
+        applicate = [s for s in sostituzioni if totali.applica(s)]
+        self.assertTrue(applicate)
+        for sostituzione in reversed(applicate):
+            self.assertTrue(totali.annulla(sostituzione))
+        for nutriente, valore in iniziali.items():
+            self.assertAlmostEqual(totali.valori[nutriente], valore, places=6)
@@ -0,0 +1,88 @@
+import itertools
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from mediterrania_orchestrator.core.nutritional_verifier import VerificatoreNutrizionale
+from mediterrania_orchestrator.core.orchestrator import OrchestratoreAlimentare
+from mediterrania_orchestrator.core.plan_builder import CostruttorePiano
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+
+UTENTE = {"sesso": "F", "età": 30, "peso": 55, "altezza": 160, "obiettivo": "Perdere peso"}
+UTENTE_IMPOSSIBILE = {"sesso": "M", "età": 30, "peso": 80, "altezza": 180, "obiettivo": "Aumentare massa muscolare"}
+
+class TestCostruttorePiano(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = DatabaseRicette()
+        cls.verificatore = VerificatoreNutrizionale(cls.db)
+        cls.costruttore = CostruttorePiano(cls.db, cls.verificatore, budget_ms=1000)
+        with open(os.path.join(os.path.dirname(cls.db.path_ricette), "base_plans.json"), encoding="utf-8") as f:
+            cls.piano = json.load(f)["V-WL"]
+
+    def _violazione_esaustiva(self, pool, dati_utente):
+        requisiti = self.verificatore.calcola_requisiti(dati_utente)
+        limiti = self.costruttore._limiti(requisiti)
+        vettori = self.verificatore.vettori_ricette()
+        migliore = np.inf
+        candidati = [[r for r in ricette if r in self.db.posizione_per_id] for ricette in pool.values()]
+        for combinazione in itertools.product(*(r for r in candidati if r)):
+            totali = vettori[[self.db.posizione_per_id[r] for r in combinazione]].sum(axis=0)
+            migliore = min(migliore, float(self.costruttore._violazione(totali, totali, *limiti)))
+        return migliore
+
+    def test_trova_piano_bilanciato(self):
+        pool = self.costruttore.pool_candidati(self.piano, ["noci"], "vegetariano")
+        esito = self.costruttore.costruisci(pool, UTENTE, self.piano)
+        self.assertTrue(esito.bilanciato)
+        verifica = self.verificatore.verifica_bilanciamento(esito.piano, UTENTE)
+        self.assertTrue(verifica["bilanciato"], verifica["problemi"])
+        vietate = self.db.get_ricette_con_ingredienti(["noci"])
+        for tipo_pasto, id_ricetta in esito.scelta.items():
+            self.assertEqual(esito.piano[tipo_pasto][0], id_ricetta)
+            self.assertNotIn(id_ricetta, vietate)
+
+    def test_ottimo_uguale_alla_ricerca_esaustiva(self):
+        for dati_utente in (UTENTE, UTENTE_IMPOSSIBILE):
+            esito = self.costruttore.costruisci(self.piano, dati_utente)
+            self.assertTrue(esito.esaustiva)
+            self.assertAlmostEqual(esito.violazione, self._violazione_esaustiva(self.piano, dati_utente), places=9)
+
+    def test_budget_esaurito_restituisce_il_migliore(self):
+        pool = self.costruttore.pool_candidati(self.piano)
+        esito = self.costruttore.costruisci(pool, UTENTE_IMPOSSIBILE, budget_ms=0)
+        self.assertFalse(esito.esaustiva)
+        self.assertFalse(esito.bilanciato)
+        self.assertEqual(set(esito.scelta), set(pool))
+        for tipo_pasto, id_ricetta in esito.scelta.items():
+            self.assertIn(id_ricetta, pool[tipo_pasto])
+
+    def test_pool_vuoto(self):
+        esito = self.costruttore.costruisci({"colazioni": []}, UTENTE)
+        self.assertEqual(esito.scelta, {})
+        self.assertFalse(esito.bilanciato)
+
+class TestCostruzioneNellOrchestratore(unittest.TestCase):
+    def _crea(self, orchestratore, dati_utente):
+        try:
+            return orchestratore.crea_piano_personalizzato(dict(dati_utente, tipo_dieta="vegetariano"))
+        except ValueError as e:
+            return str(e)
+
+    def test_piano_scartato_dal_precontrollo(self):
+        orchestratore = OrchestratoreAlimentare(budget_costruzione_ms=1000)
+        with patch.object(orchestratore.verificatore, "verifica_bilanciamento",
+                          wraps=orchestratore.verificatore.verifica_bilanciamento) as verifica:
+            piano = self._crea(orchestratore, UTENTE)
+        self.assertIsInstance(piano, dict)
+        # Analisi completa solo sul piano costruito, non su quello scartato dalle etichette
+        self.assertEqual(verifica.call_count, 1)
+
+    def test_errore_uguale_senza_costruzione(self):
+        # Nessuna combinazione bilanciata: l'errore è quello dell'analisi completa
+        errore = self._crea(OrchestratoreAlimentare(budget_costruzione_ms=1000), UTENTE_IMPOSSIBILE)
+        self.assertEqual(errore, self._crea(OrchestratoreAlimentare(), UTENTE_IMPOSSIBILE))
+        self.assertTrue(errore.startswith("Piano non bilanciato nutrizionalmente: Calorie fuori range"))
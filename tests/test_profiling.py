@@ -0,0 +1,66 @@
+import os
+import pstats
+import tempfile
+import unittest
+
+from mediterrania_orchestrator.core.orchestrator import OrchestratoreAlimentare
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+from mediterrania_orchestrator.utils.profiling import ProfilatoreRichieste
+
+class TestProfilatoreRichieste(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cartella = os.path.join(self.tmp.name, "profili")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_campionamento(self):
+        self.assertFalse(ProfilatoreRichieste(self.cartella).attivo())
+        self.assertTrue(ProfilatoreRichieste(self.cartella).attivo(forzato=True))
+        profilatore = ProfilatoreRichieste(self.cartella, 0.5, casuale=iter([0.1, 0.9]).__next__)
+        self.assertEqual([profilatore.attivo(), profilatore.attivo()], [True, False])
+
+    def test_profilo_e_memoria(self):
+        profilatore = ProfilatoreRichieste(self.cartella, memoria=True)
+        with profilatore.profila("r1") as path:
+            dati = [list(range(100)) for _ in range(100)]
+        self.assertEqual(len(dati), 100)
+        self.assertEqual(profilatore.profili(), [path])
+        self.assertGreater(pstats.Stats(path).total_calls, 0)
+        with open(path[:-len(".prof")] + ".memoria.txt", encoding="utf-8") as f:
+            self.assertTrue(f.readline().startswith("Picco:"))
+
+    def test_rotazione(self):
+        profilatore = ProfilatoreRichieste(self.cartella, memoria=True, max_profili=2)
+        percorsi = []
+        for i in range(4):
+            with profilatore.profila(str(i)) as path:
+                percorsi.append(path)
+        self.assertEqual(profilatore.profili(), percorsi[-2:])
+        self.assertEqual(len(os.listdir(self.cartella)), 4)
+
+    def test_un_profilo_alla_volta(self):
+        profilatore = ProfilatoreRichieste(self.cartella)
+        with profilatore.profila("esterna") as esterna:
+            with profilatore.profila("interna") as interna:
+                pass
+        self.assertIsNotNone(esterna)
+        self.assertIsNone(interna)
+        self.assertEqual(len(profilatore.profili()), 1)
+
+    def test_richiesta_profilata_dall_orchestratore(self):
+        orchestratore = OrchestratoreAlimentare(db_ricette=DatabaseRicette(), path_profili=self.cartella)
+        dati_utente = {
+            "sesso": "F", "età": 30, "peso": 65, "altezza": 165, "obiettivo": "Perdere peso",
+            "tipo_dieta": "vegetariano", "verdure_escluse": ["cipolla"]
+        }
+        with self.assertRaises(ValueError):
+            orchestratore.crea_piano_personalizzato(dati_utente)
+        self.assertEqual(orchestratore.profilatore.profili(), [])
+
+        with self.assertRaises(ValueError):
+            orchestratore.crea_piano_personalizzato(dict(dati_utente, verdure_escluse=[]), profila=True)
+        path, = orchestratore.profilatore.profili()
+        funzioni = {funzione for _, _, funzione in pstats.Stats(path).stats}
+        self.assertIn("personalizza_piano", funzioni)
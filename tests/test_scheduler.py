@@ -0,0 +1,125 @@
+import unittest
+from concurrent.futures import Future
+
+from mediterrania_orchestrator.core.scheduler import (
+    BULK, INTERATTIVA, ClassePriorita, LavoroScaduto, SchedulatorePriorita, classi_predefinite
+)
+
+class EsecutoreManuale:
+    """Esecutore i cui lavori terminano solo quando il test li completa"""
+
+    def __init__(self):
+        self.avviati = []
+
+    def __call__(self, lavoro):
+        futuro = Future()
+        self.avviati.append((lavoro, futuro))
+        return futuro
+
+    def completa(self, indice=0):
+        lavoro, futuro = self.avviati.pop(indice)
+        futuro.set_result(lavoro)
+
+class TestSchedulatorePriorita(unittest.TestCase):
+    def setUp(self):
+        self.adesso = 0.0
+        self.esecutore = EsecutoreManuale()
+
+    def schedulatore(self, capacita, classi=None):
+        return SchedulatorePriorita(self.esecutore, capacita, classi, orologio=lambda: self.adesso)
+
+    def test_capacita_e_risultati(self):
+        schedulatore = self.schedulatore(2)
+        futuri = [schedulatore.invia(i) for i in range(3)]
+        self.assertEqual([l for l, _ in self.esecutore.avviati], [0, 1])
+        self.esecutore.completa()
+        self.assertEqual(futuri[0].result(), 0)
+        self.assertEqual([l for l, _ in self.esecutore.avviati], [1, 2])
+        self.assertEqual(schedulatore.statistiche()[INTERATTIVA]["avviati"], 3)
+
+    def test_distribuzione_pesata(self):
+        schedulatore = self.schedulatore(1, [ClassePriorita("a", peso=3.0), ClassePriorita("b", peso=1.0)])
+        for i in range(8):
+            schedulatore.invia(f"a{i}", "a")
+            schedulatore.invia(f"b{i}", "b")
+        ordine = []
+        for _ in range(8):
+            ordine.append(self.esecutore.avviati[0][0])
+            self.esecutore.completa()
+        self.assertEqual(sum(l.startswith("a") for l in ordine), 6)
+
+    def test_bulk_cede_alle_interattive(self):
+        schedulatore = self.schedulatore(4)
+        for i in range(6):
+            schedulatore.invia(f"bulk{i}", BULK)
+        self.assertEqual(len(self.esecutore.avviati), 4)
+        for i in range(3):
+            schedulatore.invia(f"int{i}", INTERATTIVA)
+        # I posti liberati dai lavori bulk vanno alle interattive finché ne restano in coda
+        self.esecutore.completa()
+        self.esecutore.completa()
+        self.esecutore.completa()
+        self.assertEqual([l for l, _ in self.esecutore.avviati], ["bulk3", "int0", "int1", "int2"])
+        # Svuotata la coda interattiva, i lavori bulk riprendono tutta la capacità
+        self.esecutore.completa(1)
+        self.esecutore.completa(1)
+        self.assertEqual([l for l, _ in self.esecutore.avviati], ["bulk3", "int2", "bulk4", "bulk5"])
+
+    def test_limite_per_classe(self):
+        schedulatore = self.schedulatore(4, [ClassePriorita(INTERATTIVA), ClassePriorita(BULK, max_in_corso=1)])
+        for i in range(3):
+            schedulatore.invia(i, BULK)
+        self.assertEqual(len(self.esecutore.avviati), 1)
+        schedulatore.invia("int", INTERATTIVA)
+        self.assertEqual(len(self.esecutore.avviati), 2)
+
+    def test_scarto_dei_lavori_scaduti(self):
+        schedulatore = self.schedulatore(1, classi_predefinite(scadenza_bulk=10))
+        schedulatore.invia("in_corso", BULK)
+        scaduto = schedulatore.invia("vecchio", BULK)
+        senza_scadenza = schedulatore.invia("interattivo", INTERATTIVA)
+        self.adesso = 11
+        self.esecutore.completa()
+        self.assertIsInstance(scaduto.exception(), LavoroScaduto)
+        self.assertEqual(self.esecutore.avviati[0][0], "interattivo")
+        self.esecutore.completa()
+        self.assertEqual(senza_scadenza.result(), "interattivo")
+        self.assertEqual(schedulatore.statistiche()[BULK]["scartati"], 1)
+
+    def test_scarto_dei_lavori_scaduti_non_in_testa(self):
+        schedulatore = self.schedulatore(1)
+        schedulatore.invia("in_corso", BULK)
+        in_testa = schedulatore.invia("lungo", BULK, scadenza=100)
+        scaduto = schedulatore.invia("breve", BULK, scadenza=5)
+        self.adesso = 6
+        # Capacità occupata: il nuovo invio scarta comunque il lavoro scaduto dietro la testa
+        schedulatore.invia("interattivo", INTERATTIVA)
+        self.assertIsInstance(scaduto.exception(timeout=0), LavoroScaduto)
+        self.assertEqual(schedulatore.statistiche()[BULK]["in_coda"], 1)
+        self.esecutore.completa()
+        self.esecutore.completa()
+        self.assertEqual(self.esecutore.avviati[0][0], "lungo")
+        self.esecutore.completa()
+        self.assertEqual(in_testa.result(), "lungo")
+        self.assertEqual(schedulatore.statistiche()[BULK], {"in_coda": 0, "in_corso": 0, "avviati": 2, "scartati": 1})
+
+    def test_annullamento_e_chiusura(self):
+        schedulatore = self.schedulatore(1)
+        schedulatore.invia("primo")
+        annullato = schedulatore.invia("annullato")
+        in_coda = schedulatore.invia("in_coda")
+        self.assertTrue(annullato.cancel())
+        self.esecutore.completa()
+        self.assertEqual(self.esecutore.avviati[0][0], "in_coda")
+
+        in_attesa = schedulatore.invia("in_attesa")
+        schedulatore.chiudi()
+        self.assertTrue(in_attesa.cancelled())
+        self.assertFalse(in_coda.done())
+        with self.assertRaises(RuntimeError):
+            schedulatore.invia("dopo")
+        with self.assertRaises(KeyError):
+            self.schedulatore(1).invia("x", "sconosciuta")
+
+if __name__ == "__main__":
+    unittest.main()
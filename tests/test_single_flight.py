@@ -0,0 +1,129 @@
+import asyncio
+import copy
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from mediterrania_orchestrator.cache.single_flight import RichiesteInCorso
+from mediterrania_orchestrator.core.orchestrator import OrchestratoreAlimentare
+
+class TestRichiesteInCorso(unittest.TestCase):
+    def _concorrenti(self, in_corso, funzione, n=4):
+        """Avvia `n` thread sulla stessa chiave mentre il primo calcolo è bloccato"""
+        avviato, sblocca = threading.Event(), threading.Event()
+        esiti = [None] * n
+
+        def calcolo():
+            avviato.set()
+            sblocca.wait(5)
+            return funzione()
+
+        def richiedi(i):
+            try:
+                esiti[i] = in_corso.esegui("chiave", calcolo)
+            except Exception as e:
+                esiti[i] = e
+
+        threads = [threading.Thread(target=richiedi, args=(0,))]
+        threads[0].start()
+        avviato.wait(5)
+        threads += [threading.Thread(target=richiedi, args=(i,)) for i in range(1, n)]
+        for t in threads[1:]:
+            t.start()
+        while in_corso.condivise < n - 1:
+            time.sleep(0.001)
+        sblocca.set()
+        for t in threads:
+            t.join(5)
+        return esiti
+
+    def test_un_solo_calcolo_con_copie(self):
+        in_corso = RichiesteInCorso(copia=copy.deepcopy)
+        esiti = self._concorrenti(in_corso, lambda: {"pranzi": ["PR001"]})
+
+        self.assertEqual(in_corso.calcoli, 1)
+        self.assertEqual(in_corso.condivise, 3)
+        self.assertTrue(all(e == {"pranzi": ["PR001"]} for e in esiti))
+        self.assertEqual(len({id(e) for e in esiti}), 4)
+        self.assertEqual(len(in_corso), 0)
+
+    def test_eccezione_condivisa(self):
+        in_corso = RichiesteInCorso()
+
+        def fallisce():
+            raise ValueError("Piano non bilanciato")
+        esiti = self._concorrenti(in_corso, fallisce, n=3)
+
+        self.assertEqual(in_corso.calcoli, 1)
+        self.assertTrue(all(isinstance(e, ValueError) for e in esiti))
+        # Rilasciata la chiave, la richiesta successiva esegue un nuovo calcolo
+        self.assertEqual(in_corso.esegui("chiave", lambda: 1), 1)
+        self.assertEqual(in_corso.calcoli, 2)
+
+class TestRichiesteInCorsoAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_annullamento_del_primo_chiamante(self):
+        in_corso = RichiesteInCorso()
+        sblocca = asyncio.Event()
+        calcoli = []
+
+        async def calcolo():
+            calcoli.append(1)
+            await sblocca.wait()
+            return "piano"
+
+        primo = asyncio.create_task(in_corso.esegui_async("chiave", calcolo))
+        secondo = asyncio.create_task(in_corso.esegui_async("chiave", calcolo))
+        await asyncio.sleep(0)
+        self.assertIn("chiave", in_corso)
+        primo.cancel()
+        await asyncio.sleep(0)
+        sblocca.set()
+
+        self.assertEqual(await secondo, "piano")
+        self.assertTrue(primo.cancelled())
+        self.assertEqual(len(calcoli), 1)
+        self.assertNotIn("chiave", in_corso)
+
+class TestCoalescenzaOrchestratore(unittest.TestCase):
+    def test_profili_identici_concorrenti(self):
+        orchestratore = OrchestratoreAlimentare()
+        dati_utente = {
+            "sesso": "F", "età": 30, "peso": 65, "altezza": 165, "obiettivo": "Perdere peso",
+            "tipo_dieta": "vegetariano", "verdure_escluse": ["cipolla"]
+        }
+        originale = orchestratore._crea_piano
+        avviato, sblocca = threading.Event(), threading.Event()
+
+        def lento(*args):
+            avviato.set()
+            sblocca.wait(5)
+            return originale(*args)
+
+        errori = []
+        def richiedi(profilo):
+            try:
+                orchestratore.crea_piano_personalizzato(profilo)
+            except ValueError as e:
+                errori.append(e)
+
+        with patch.object(orchestratore, "_crea_piano", side_effect=lento) as crea:
+            primo = threading.Thread(target=richiedi, args=(dati_utente,))
+            primo.start()
+            avviato.wait(5)
+            # Profilo equivalente (verdura scritta in modo diverso): stessa chiave
+            altri = [threading.Thread(target=richiedi, args=(dict(dati_utente, verdure_escluse=["Cipolla"]),))
+                     for _ in range(3)]
+            for t in altri:
+                t.start()
+            while orchestratore.in_corso.condivise < 3:
+                time.sleep(0.001)
+            sblocca.set()
+            for t in [primo] + altri:
+                t.join(5)
+
+        self.assertEqual(crea.call_count, 1)
+        self.assertEqual(len(errori), 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette, TIPI_PASTO
+
+def crea_catalogo_scalato(path_origine: str, moltiplicatore: int, path_destinazione: str):
+    """Replica le ricette del catalogo con ID distinti per simulare un catalogo più grande"""
+    with open(path_origine, "r", encoding="utf-8") as f:
+        catalogo = json.load(f)
+    for tipo_pasto in TIPI_PASTO:
+        originali = catalogo[tipo_pasto]
+        catalogo[tipo_pasto] = [
+            dict(ricetta, id_pasto=f"{ricetta['id_pasto']}-{copia}")
+            for copia in range(moltiplicatore) for ricetta in originali
+        ]
+    with open(path_destinazione, "w", encoding="utf-8") as f:
+        json.dump(catalogo, f, ensure_ascii=False)
+
+def misura(funzione, ripetizioni: int) -> dict:
+    """Esegue la funzione più volte e restituisce i tempi in millisecondi"""
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append((time.perf_counter() - inizio) * 1000)
+    return {"mediana_ms": statistics.median(tempi), "min_ms": min(tempi), "max_ms": max(tempi)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta l'avvio a freddo da JSON e da snapshot binario")
+    parser.add_argument("--moltiplicatore", type=int, default=100, help="copie del catalogo incluso")
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    parser.add_argument("--output", default=None, help="file JSON dove salvare i risultati")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path_ricette = os.path.join(directory, "ricette.json")
+        crea_catalogo_scalato(DatabaseRicette().path_ricette, args.moltiplicatore, path_ricette)
+
+        # Il primo caricamento genera lo snapshot
+        db = DatabaseRicette(path_ricette, usa_snapshot=True)
+        risultati = {
+            "ricette": len(db.ricette_per_id),
+            "dimensione_json_byte": os.path.getsize(path_ricette),
+            "dimensione_snapshot_byte": os.path.getsize(db.path_snapshot),
+            "json": misura(lambda: DatabaseRicette(path_ricette), args.ripetizioni),
+            "snapshot": misura(lambda: DatabaseRicette(path_ricette, usa_snapshot=True), args.ripetizioni)
+        }
+
+    risultati["speedup"] = risultati["json"]["mediana_ms"] / risultati["snapshot"]["mediana_ms"]
+    print(f"Ricette: {risultati['ricette']}")
+    print(f"JSON:     {risultati['json']['mediana_ms']:.1f} ms ({risultati['dimensione_json_byte']} byte)")
+    print(f"Snapshot: {risultati['snapshot']['mediana_ms']:.1f} ms ({risultati['dimensione_snapshot_byte']} byte)")
+    print(f"Speedup:  {risultati['speedup']:.1f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(risultati, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from mediterrania_orchestrator.core.batch import GeneratorePianiBatch
+from mediterrania_orchestrator.core.orchestrator import OrchestratoreAlimentare
+from mediterrania_orchestrator.core.scheduler import BULK
+
+# Distribuzioni dei profili: pesi relativi dei valori del questionario
+TIPI_DIETA = {"nessuno": 0.6, "vegetariano": 0.25, "vegano": 0.15}
+OBIETTIVI = {"Perdere peso": 0.5, "Mantenere peso": 0.3, "Aumentare massa muscolare": 0.2}
+
+# Allergeni e verdure escluse in ordine di frequenza: la probabilità segue una legge di Zipf
+ALLERGENI = ["noci", "uova", "mandorle", "gamberi", "semi di sesamo", "salsa di soia",
+             "ricotta", "yogurt greco", "parmigiano reggiano", "tonno al naturale"]
+VERDURE = ["cipolla", "peperoni", "aglio", "zucchine", "spinaci", "sedano", "cetriolo",
+           "zucca", "carote", "cipolla rossa", "pomodorini", "patate"]
+
+# Esiti di una richiesta
+BILANCIATO, NON_BILANCIATO, ERRORE = "bilanciato", "non_bilanciato", "errore"
+
+def _scegli(casuale: random.Random, pesi: Dict[str, float]) -> str:
+    return casuale.choices(list(pesi), weights=list(pesi.values()))[0]
+
+def _lista_zipf(casuale: random.Random, valori: List[str], probabilita_vuota: float) -> List[str]:
+    """Lista di lunghezza geometrica con valori estratti secondo Zipf (i primi sono i più frequenti)"""
+    if casuale.random() < probabilita_vuota:
+        return []
+    pesi = [1 / (rango + 1) for rango in range(len(valori))]
+    scelti = {casuale.choices(valori, weights=pesi)[0]}
+    while casuale.random() < 0.4 and len(scelti) < len(valori):
+        scelti.add(casuale.choices(valori, weights=pesi)[0])
+    return sorted(scelti)
+
+def genera_profili(seme: int = 0) -> Iterator[Dict]:
+    """
+    Profili del questionario con distribuzioni realistiche e infinite
+
+    La maggior parte dei profili non ha allergie né esclusioni; chi le ha
+    tende a indicare gli stessi pochi ingredienti, così che la cache dei
+    piani veda la ripetizione tipica del traffico reale.
+    """
+    casuale = random.Random(seme)
+    while True:
+        sesso = casuale.choice("MF")
+        altezza = round(casuale.gauss(176 if sesso == "M" else 164, 7))
+        profilo = {
+            "sesso": sesso,
+            "età": casuale.randint(18, 75),
+            "peso": round(casuale.gauss((altezza / 100) ** 2 * 24, 8)),
+            "altezza": altezza,
+            "obiettivo": _scegli(casuale, OBIETTIVI),
+            "tipo_dieta": _scegli(casuale, TIPI_DIETA),
+            "allergie": _lista_zipf(casuale, ALLERGENI, 0.8),
+            "verdure_escluse": _lista_zipf(casuale, VERDURE, 0.6)
+        }
+        if casuale.random() < 0.1:
+            profilo["preferenza_latte"] = "vegetale"
+        yield profilo
+
+def _classifica_errore(messaggio: str) -> str:
+    """Un piano non bilanciato è un esito previsto, non un errore del servizio"""
+    return NON_BILANCIATO if "Piano non bilanciato" in messaggio else ERRORE
+
+class EsecutoreThread:
+    """Richieste in-process su un orchestratore condiviso tra i thread client"""
+
+    def __init__(self, opzioni_orchestratore: Dict):
+        self.orchestratore = OrchestratoreAlimentare(**opzioni_orchestratore)
+
+    def esegui(self, profilo: Dict) -> str:
+        try:
+            self.orchestratore.crea_piano_personalizzato(profilo)
+            return BILANCIATO
+        except ValueError as e:
+            return _classifica_errore(str(e))
+
+    def chiudi(self):
+        pass
+
+class EsecutoreProcessi:
+    """Richieste inviate a un pool di processi con il catalogo in memoria condivisa"""
+
+    def __init__(self, processi: int, opzioni_orchestratore: Dict):
+        self.generatore = GeneratorePianiBatch(processi, opzioni_orchestratore=opzioni_orchestratore)
+        self.bulk_completati = 0
+        self._fine_bulk = threading.Event()
+        self._client_bulk: List[threading.Thread] = []
+
+    def esegui(self, profilo: Dict) -> str:
+        _, errore = self.generatore.invia(profilo).result()
+        return BILANCIATO if errore is None else _classifica_errore(errore)
+
+    def avvia_bulk(self, concorrenza: int, profili: Iterator[Dict]):
+        """Rigenerazione massiva in sottofondo: `concorrenza` client inviano profili bulk finché il test non termina"""
+        lock = threading.Lock()
+
+        def client():
+            while not self._fine_bulk.is_set():
+                with lock:
+                    profilo = next(profili)
+                self.generatore.invia(profilo, BULK).result()
+                with lock:
+                    self.bulk_completati += 1
+        self._client_bulk = [threading.Thread(target=client, daemon=True) for _ in range(concorrenza)]
+        for thread in self._client_bulk:
+            thread.start()
+
+    def chiudi(self):
+        self._fine_bulk.set()
+        for thread in self._client_bulk:
+            thread.join()
+        self.generatore.chiudi()
+
+class _GestoreStandIn(BaseHTTPRequestHandler):
+    """POST /piani con il profilo in JSON: 200 con il piano, 422 se non bilanciato, 500 per gli errori"""
+    protocol_version = "HTTP/1.1"
+    # Intestazioni e corpo sono scritti separatamente: senza TCP_NODELAY ogni risposta attende l'ACK ritardato
+    disable_nagle_algorithm = True
+    orchestratore: OrchestratoreAlimentare = None
+
+    def do_POST(self):
+        lunghezza = int(self.headers.get("Content-Length", 0))
+        try:
+            profilo = json.loads(self.rfile.read(lunghezza))
+            corpo, stato = {"piano": self.orchestratore.crea_piano_personalizzato(profilo)}, 200
+        except ValueError as e:
+            corpo, stato = {"errore": str(e)}, 422
+        except Exception as e:
+            corpo, stato = {"errore": f"{type(e).__name__}: {e}"}, 500
+        dati = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(stato)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dati)))
+        self.end_headers()
+        self.wfile.write(dati)
+
+    def log_message(self, *args):
+        pass
+
+class EsecutoreHTTP:
+    """
+    Richieste HTTP a un servizio che espone POST /piani
+
+    Senza `url` avvia nel processo un server di prova (`ThreadingHTTPServer`)
+    davanti a un orchestratore condiviso. Ogni thread client riusa la
+    propria connessione keep-alive.
+    """
+
+    def __init__(self, url: Optional[str], opzioni_orchestratore: Dict):
+        self.server = None
+        if url is None:
+            gestore = type("GestoreStandIn", (_GestoreStandIn,), {
+                "orchestratore": OrchestratoreAlimentare(**opzioni_orchestratore)
+            })
+            self.server = ThreadingHTTPServer(("127.0.0.1", 0), gestore)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        parti = urlsplit(url)
+        self.host, self.porta = parti.hostname, parti.port or 80
+        self.percorso = (parti.path.rstrip("/") or "") + "/piani"
+        self._locale = threading.local()
+
+    def esegui(self, profilo: Dict) -> str:
+        connessione = getattr(self._locale, "connessione", None)
+        if connessione is None:
+            connessione = self._locale.connessione = http.client.HTTPConnection(self.host, self.porta, timeout=60)
+        corpo = json.dumps(profilo).encode("utf-8")
+        try:
+            connessione.request("POST", self.percorso, corpo, {"Content-Type": "application/json"})
+            risposta = connessione.getresponse()
+            risposta.read()
+        except (OSError, http.client.HTTPException):
+            connessione.close()
+            self._locale.connessione = None
+            return ERRORE
+        if risposta.status == 200:
+            return BILANCIATO
+        return NON_BILANCIATO if risposta.status == 422 else ERRORE
+
+    def chiudi(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+def _figli(pid: int) -> List[int]:
+    figli = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                figli.extend(int(figlio) for figlio in f.read().split())
+    except OSError:
+        pass
+    return figli
+
+def memoria_residente() -> Optional[int]:
+    """Memoria residente in byte del processo e dei suoi discendenti (None se /proc non è disponibile)"""
+    totale, da_visitare = 0, [os.getpid()]
+    while da_visitare:
+        pid = da_visitare.pop()
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                totale += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            if pid == os.getpid():
+                return None
+            continue
+        da_visitare.extend(_figli(pid))
+    return totale
+
+def _percentile(valori: List[float], q: float) -> float:
+    return valori[min(len(valori) - 1, int(q * len(valori)))] if valori else 0.0
+
+def esegui_carico(esegui: Callable[[Dict], str], profili: Iterator[Dict], concorrenza: int,
+                  richieste: Optional[int], durata: Optional[float], intervallo: float = 1.0) -> Dict:
+    """
+    Esegue il carico a ciclo chiuso: `concorrenza` client inviano una richiesta appena ricevuta la precedente
+
+    Args:
+        esegui: funzione che esegue una richiesta e ne restituisce l'esito
+        profili: sorgente dei profili
+        concorrenza: numero di client concorrenti
+        richieste: numero totale di richieste (None = fino a `durata`)
+        durata: durata massima in secondi (None = fino a `richieste`)
+        intervallo: secondi tra due campioni della serie temporale
+
+    Returns:
+        Riepilogo con throughput, percentili di latenza, tassi di errore e
+        serie temporale di throughput, latenza, memoria e handler del logger
+    """
+    lock = threading.Lock()
+    latenze: List[Tuple[float, float, str]] = []
+    inviate = 0
+    inizio = time.perf_counter()
+    fine_prevista = inizio + durata if durata is not None else None
+    logger = logging.getLogger("MediterranIA")
+
+    def prossimo() -> Optional[Dict]:
+        nonlocal inviate
+        with lock:
+            if richieste is not None and inviate >= richieste:
+                return None
+            if fine_prevista is not None and time.perf_counter() >= fine_prevista:
+                return None
+            inviate += 1
+            return next(profili)
+
+    def client():
+        while True:
+            profilo = prossimo()
+            if profilo is None:
+                return
+            partenza = time.perf_counter()
+            try:
+                esito = esegui(profilo)
+            except Exception:
+                esito = ERRORE
+            arrivo = time.perf_counter()
+            with lock:
+                latenze.append((arrivo - inizio, (arrivo - partenza) * 1000, esito))
+
+    serie = []
+    completato = threading.Event()
+
+    def campiona():
+        precedenti = 0
+        while True:
+            fermato = completato.wait(intervallo)
+            with lock:
+                finestra = [latenza for _, latenza, _ in latenze[precedenti:]]
+                precedenti = len(latenze)
+            finestra.sort()
+            serie.append({
+                "secondi": round(time.perf_counter() - inizio, 3),
+                "richieste": len(finestra),
+                "p50_ms": _percentile(finestra, 0.5),
+                "p99_ms": _percentile(finestra, 0.99),
+                "memoria_byte": memoria_residente(),
+                "handler_logger": len(logger.handlers)
+            })
+            if fermato:
+                return
+
+    campionatore = threading.Thread(target=campiona, daemon=True)
+    campionatore.start()
+    with ThreadPoolExecutor(concorrenza) as pool:
+        for futuro in [pool.submit(client) for _ in range(concorrenza)]:
+            futuro.result()
+    durata_effettiva = time.perf_counter() - inizio
+    completato.set()
+    campionatore.join()
+
+    tempi = sorted(latenza for _, latenza, _ in latenze)
+    esiti = [esito for _, _, esito in latenze]
+    totale = len(latenze)
+    memorie = [campione["memoria_byte"] for campione in serie if campione["memoria_byte"] is not None]
+    return {
+        "richieste": totale,
+        "concorrenza": concorrenza,
+        "durata_s": durata_effettiva,
+        "throughput_rps": totale / durata_effettiva if durata_effettiva else 0.0,
+        "latenza_ms": {
+            "p50": _percentile(tempi, 0.5),
+            "p95": _percentile(tempi, 0.95),
+            "p99": _percentile(tempi, 0.99),
+            "media": statistics.fmean(tempi) if tempi else 0.0,
+            "massimo": tempi[-1] if tempi else 0.0
+        },
+        "tasso_errori": esiti.count(ERRORE) / totale if totale else 0.0,
+        "tasso_non_bilanciati": esiti.count(NON_BILANCIATO) / totale if totale else 0.0,
+        "crescita_memoria_byte": memorie[-1] - memorie[0] if len(memorie) > 1 else None,
+        "serie": serie
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico dell'orchestratore con profili realistici")
+    parser.add_argument("--modalita", choices=("thread", "processi", "http"), default="thread")
+    parser.add_argument("--concorrenza", type=int, default=8)
+    parser.add_argument("--richieste", type=int, default=None, help="numero di richieste (default: 2000)")
+    parser.add_argument("--durata", type=float, default=None, help="durata in secondi, in alternativa a --richieste")
+    parser.add_argument("--processi", type=int, default=None, help="worker della modalità processi")
+    parser.add_argument("--bulk", type=int, default=0,
+                        help="client bulk in sottofondo durante il test (solo modalità processi)")
+    parser.add_argument("--url", default=None,
+                        help="servizio HTTP da testare (default: server di prova avviato nel processo)")
+    parser.add_argument("--budget-costruzione", type=float, default=None,
+                        help="budget in ms del costruttore per i piani non bilanciati (default: disattivato)")
+    parser.add_argument("--ttl-cache", type=float, default=3600, help="validità dei piani in cache (0 = cache disattivata)")
+    parser.add_argument("--intervallo", type=float, default=1.0, help="secondi tra due campioni della serie")
+    parser.add_argument("--seme", type=int, default=0)
+    parser.add_argument("--output", default=None, help="file JSON dove salvare i risultati")
+    args = parser.parse_args()
+    if args.richieste is None and args.durata is None:
+        args.richieste = 2000
+
+    # Con TTL 0 ogni piano scade appena salvato: tutte le richieste attraversano la pipeline
+    opzioni = {"ttl_cache_piani": args.ttl_cache, "budget_costruzione_ms": args.budget_costruzione}
+    if args.modalita == "thread":
+        esecutore = EsecutoreThread(opzioni)
+    elif args.modalita == "processi":
+        esecutore = EsecutoreProcessi(args.processi, opzioni)
+        if args.bulk:
+            esecutore.avvia_bulk(args.bulk, genera_profili(args.seme + 1))
+    else:
+        esecutore = EsecutoreHTTP(args.url, opzioni)
+    try:
+        risultati = esegui_carico(esecutore.esegui, genera_profili(args.seme), args.concorrenza,
+                                  args.richieste, args.durata, args.intervallo)
+    finally:
+        esecutore.chiudi()
+    risultati.update(modalita=args.modalita, data=datetime.now().isoformat(timespec="seconds"),
+                     python=platform.python_version())
+    if args.bulk:
+        risultati["bulk_completati"] = getattr(esecutore, "bulk_completati", None)
+
+    latenza = risultati["latenza_ms"]
+    print(f"Richieste:      {risultati['richieste']} in {risultati['durata_s']:.1f} s "
+          f"({args.modalita}, concorrenza {args.concorrenza})")
+    print(f"Throughput:     {risultati['throughput_rps']:.1f} richieste/s")
+    print(f"Latenza:        p50 {latenza['p50']:.2f} ms  p95 {latenza['p95']:.2f} ms  p99 {latenza['p99']:.2f} ms")
+    print(f"Errori:         {risultati['tasso_errori']:.2%} (non bilanciati {risultati['tasso_non_bilanciati']:.2%})")
+    if risultati.get("bulk_completati") is not None:
+        print(f"Bulk:           {risultati['bulk_completati']} piani in sottofondo ({args.bulk} client)")
+    if risultati["crescita_memoria_byte"] is not None:
+        print(f"Memoria:        {risultati['crescita_memoria_byte'] / 1e6:+.1f} MB durante il test")
+    handler = {campione["handler_logger"] for campione in risultati["serie"]}
+    if len(handler) > 1:
+        print(f"ATTENZIONE: handler del logger cresciuti durante il test ({min(handler)} -> {max(handler)})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(risultati, f, indent=2)
+    if risultati["tasso_errori"] > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from mediterrania_orchestrator.core.orchestrator import OrchestratoreAlimentare
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette, TIPI_PASTO
+
+from synthetic_catalog import genera_catalogo
+
+DIMENSIONI_PREDEFINITE = (1000, 10000, 100000, 1000000)
+
+# Profilo usato per le operazioni che richiedono i dati dell'utente
+DATI_UTENTE = {
+    "sesso": "F", "età": 30, "peso": 65, "altezza": 165, "obiettivo": "Perdere peso",
+    "tipo_dieta": "vegetariano", "allergie": ["frutta secca"], "verdure_escluse": ["cipolla", "peperoni"]
+}
+
+def misura(funzione: Callable, ripetizioni: int, chiamate: int = 1) -> Dict[str, float]:
+    """
+    Esegue la funzione `ripetizioni` volte e restituisce i tempi per chiamata in millisecondi
+
+    Args:
+        funzione: funzione da misurare; se esegue `chiamate` operazioni, i
+            tempi vengono divisi per `chiamate`
+        ripetizioni: numero di misure
+        chiamate: operazioni eseguite da ogni chiamata di `funzione`
+    """
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append((time.perf_counter() - inizio) * 1000 / chiamate)
+    tempi.sort()
+    return {
+        "mediana_ms": statistics.median(tempi),
+        "p95_ms": tempi[min(len(tempi) - 1, int(0.95 * len(tempi)))],
+        "min_ms": tempi[0],
+        "ripetizioni": ripetizioni,
+        "chiamate": chiamate
+    }
+
+def esegui_dimensione(n_ricette: int, ripetizioni: int, cartella: str) -> Dict:
+    """Genera il catalogo sintetico di `n_ricette` ricette e misura tutte le operazioni"""
+    path_ricette = os.path.join(cartella, f"ricette_{n_ricette}.json")
+    path_piani_base = os.path.join(cartella, f"base_plans_{n_ricette}.json")
+    inizio = time.perf_counter()
+    genera_catalogo(n_ricette, path_ricette, path_piani_base)
+    generazione_ms = (time.perf_counter() - inizio) * 1000
+
+    # Il caricamento dei cataloghi grandi dura secondi: bastano poche misure
+    ripetizioni_caricamento = max(1, min(ripetizioni, 100000 // n_ricette))
+    operazioni = {"caricamento": misura(lambda: DatabaseRicette(path_ricette), ripetizioni_caricamento)}
+
+    orchestratore = OrchestratoreAlimentare(db_ricette=DatabaseRicette(path_ricette), path_piani_base=path_piani_base)
+    db = orchestratore.db_ricette
+    gestore = orchestratore.gestore_sostituzioni
+    tipo_piano = orchestratore.determina_tipo_piano(DATI_UTENTE["tipo_dieta"], DATI_UTENTE["obiettivo"])
+    piano = orchestratore.piani_base[tipo_piano]
+
+    casuale = random.Random(0)
+    ids = [casuale.choice(db.ricette[tipo])["id_pasto"] for tipo in TIPI_PASTO for _ in range(2500)]
+    operazioni["get_ricetta_by_id"] = misura(lambda: [db.get_ricetta_by_id(i) for i in ids], ripetizioni, len(ids))
+    operazioni["get_ricette_stagione"] = misura(lambda: db.get_ricette_stagione("inverno"), ripetizioni)
+    operazioni["filtra_per_allergie"] = misura(
+        lambda: orchestratore.filtra_per_allergie(piano, DATI_UTENTE["allergie"]), ripetizioni
+    )
+
+    def sostituisci_verdure():
+        # Senza la cache delle sostituzioni si misura la ricerca dei sostituti
+        gestore.cache_sostituzioni.svuota()
+        gestore.sostituisci_verdure(piano, set(DATI_UTENTE["verdure_escluse"]))
+    operazioni["sostituisci_verdure"] = misura(sostituisci_verdure, ripetizioni)
+    operazioni["verifica_bilanciamento"] = misura(
+        lambda: orchestratore.verificatore.verifica_bilanciamento(piano, DATI_UTENTE), ripetizioni
+    )
+
+    esiti = []
+    def crea_piano():
+        # Senza la cache dei piani si misura la pipeline completa
+        orchestratore.cache_piani.svuota()
+        try:
+            orchestratore.crea_piano_personalizzato(DATI_UTENTE)
+            esiti.append(True)
+        except ValueError:
+            esiti.append(False)
+    operazioni["crea_piano_personalizzato"] = misura(crea_piano, ripetizioni)
+
+    return {
+        "ricette": len(db.ricette_per_id),
+        "dimensione_json_byte": os.path.getsize(path_ricette),
+        "generazione_ms": generazione_ms,
+        "piani_bilanciati": sum(esiti) / len(esiti),
+        "operazioni": operazioni
+    }
+
+def _commit_corrente() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def confronta(risultati: Dict, riferimento: Dict, soglia: float) -> List[str]:
+    """
+    Operazioni la cui mediana è peggiorata di più di `soglia` rispetto al riferimento
+
+    Args:
+        risultati: risultati correnti
+        riferimento: risultati salvati di una versione precedente
+        soglia: peggioramento relativo tollerato (es. 0.2 = +20%)
+    """
+    regressioni = []
+    for dimensione, corrente in risultati["dimensioni"].items():
+        precedente = riferimento.get("dimensioni", {}).get(dimensione)
+        if precedente is None:
+            continue
+        for operazione, tempi in corrente["operazioni"].items():
+            tempi_precedenti = precedente["operazioni"].get(operazione)
+            if tempi_precedenti is None or tempi_precedenti["mediana_ms"] <= 0:
+                continue
+            rapporto = tempi["mediana_ms"] / tempi_precedenti["mediana_ms"]
+            if rapporto > 1 + soglia:
+                regressioni.append(
+                    f"{operazione} ({dimensione} ricette): {tempi_precedenti['mediana_ms']:.4f} ms -> "
+                    f"{tempi['mediana_ms']:.4f} ms ({rapporto:.2f}x)"
+                )
+    return regressioni
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark delle operazioni principali su cataloghi sintetici")
+    parser.add_argument("--ricette", type=int, nargs="+", default=list(DIMENSIONI_PREDEFINITE),
+                        help="dimensioni dei cataloghi da generare")
+    parser.add_argument("--ripetizioni", type=int, default=20)
+    parser.add_argument("--output", default=None,
+                        help="file JSON dei risultati (default: tools/benchmark/results/<data>-<commit>.json)")
+    parser.add_argument("--confronta", default=None, help="file JSON di riferimento per rilevare regressioni")
+    parser.add_argument("--soglia", type=float, default=0.2, help="peggioramento tollerato rispetto al riferimento")
+    args = parser.parse_args()
+    # I log di ogni richiesta riempirebbero l'output e peserebbero sulle misure
+    logging.getLogger("MediterranIA").setLevel(logging.CRITICAL)
+
+    commit = _commit_corrente()
+    risultati = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "piattaforma": platform.platform(),
+        "dimensioni": {}
+    }
+    with tempfile.TemporaryDirectory() as cartella:
+        for n_ricette in args.ricette:
+            risultato = esegui_dimensione(n_ricette, args.ripetizioni, cartella)
+            risultati["dimensioni"][str(n_ricette)] = risultato
+            print(f"{risultato['ricette']} ricette ({risultato['dimensione_json_byte'] / 1e6:.1f} MB)")
+            for operazione, tempi in risultato["operazioni"].items():
+                print(f"  {operazione:<28} {tempi['mediana_ms']:>12.4f} ms  (p95 {tempi['p95_ms']:.4f} ms)")
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'locale'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(risultati, f, indent=2)
+    print(f"Risultati salvati in {output}")
+
+    if args.confronta:
+        with open(args.confronta, encoding="utf-8") as f:
+            regressioni = confronta(risultati, json.load(f), args.soglia)
+        for regressione in regressioni:
+            print(f"REGRESSIONE: {regressione}")
+        if regressioni:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
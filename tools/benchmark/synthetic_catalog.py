@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import random
+import re
+from typing import Dict, List
+
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette, TIPI_PASTO
+
+# Ricette per piano base e tipo pasto, come nei piani inclusi
+RICETTE_PER_PIANO = {"colazioni": 6, "pranzi": 6, "cene": 6, "spuntini": 5}
+
+# Proprietà richiesta ai piani base per prefisso del codice (VE = vegano, V = vegetariano, S = standard)
+PROPRIETA_PIANI = {"VE": "vegano", "V": "vegetariano", "S": None}
+
+def _prefisso(id_pasto: str) -> str:
+    return re.match(r"[A-Z]+", id_pasto).group()
+
+def _ricetta_sintetica(modello: Dict, id_pasto: str, ingredienti: List[str], casuale: random.Random) -> Dict:
+    """
+    Variante di una ricetta del catalogo incluso con ID nuovo
+
+    Valori nutrizionali e quantità vengono perturbati del ±20%; a volte un
+    ingrediente viene sostituito con uno qualsiasi del catalogo, così che
+    l'indice degli ingredienti abbia una distribuzione realistica.
+    """
+    ricetta = dict(modello, id_pasto=id_pasto, nome=f"{modello['nome']} #{id_pasto}")
+    ricetta["valori_nutrizionali"] = {
+        nutriente: round(valore * casuale.uniform(0.8, 1.2), 1)
+        for nutriente, valore in modello["valori_nutrizionali"].items()
+    }
+    ricetta["ingredienti"] = [
+        dict(ingrediente, quantita=round(ingrediente["quantita"] * casuale.uniform(0.8, 1.2), 1))
+        for ingrediente in modello["ingredienti"]
+    ]
+    if ricetta["ingredienti"] and casuale.random() < 0.3:
+        posizione = casuale.randrange(len(ricetta["ingredienti"]))
+        ricetta["ingredienti"][posizione] = dict(ricetta["ingredienti"][posizione], nome=casuale.choice(ingredienti))
+    return ricetta
+
+def genera_catalogo(n_ricette: int, path_ricette: str, path_piani_base: str, seme: int = 0):
+    """
+    Scrive un catalogo sintetico con lo schema di `ricette.json` e i piani base corrispondenti
+
+    Le ricette sono varianti di quelle incluse, ripartite tra i tipi pasto
+    nelle stesse proporzioni. Il file viene scritto una ricetta alla volta,
+    così che anche il catalogo da un milione di ricette non debba stare in
+    memoria durante la generazione.
+
+    Args:
+        n_ricette: numero totale di ricette
+        path_ricette: file JSON del catalogo da scrivere
+        path_piani_base: file JSON dei piani base da scrivere
+        seme: seme del generatore casuale
+    """
+    casuale = random.Random(seme)
+    db_incluso = DatabaseRicette()
+    incluso = db_incluso.ricette
+    with open(os.path.join(os.path.dirname(db_incluso.path_ricette), "base_plans.json"), encoding="utf-8") as f:
+        codici_piani = list(json.load(f))
+    ingredienti = sorted({i["nome"] for tipo in TIPI_PASTO for r in incluso[tipo] for i in r["ingredienti"]})
+    totale_incluso = sum(len(incluso[tipo]) for tipo in TIPI_PASTO)
+
+    conteggi = {tipo: n_ricette * len(incluso[tipo]) // totale_incluso for tipo in TIPI_PASTO}
+    conteggi[TIPI_PASTO[0]] += n_ricette - sum(conteggi.values())
+    metadata = dict(incluso["metadata"], totale_ricette=conteggi, tipo_contenuto="database_pasti_sintetico")
+
+    # Per ogni piano base bastano le prime ricette compatibili con la dieta
+    candidati = {(codice, tipo): [] for codice in PROPRIETA_PIANI for tipo in TIPI_PASTO}
+
+    for path in (path_ricette, path_piani_base):
+        cartella = os.path.dirname(path)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+    with open(path_ricette, "w", encoding="utf-8") as f:
+        f.write('{"metadata": ' + json.dumps(metadata, ensure_ascii=False))
+        for tipo in TIPI_PASTO:
+            f.write(f', "{tipo}": [')
+            prefisso = _prefisso(incluso[tipo][0]["id_pasto"])
+            cifre = max(3, len(str(conteggi[tipo])))
+            for numero in range(conteggi[tipo]):
+                ricetta = _ricetta_sintetica(
+                    casuale.choice(incluso[tipo]), f"{prefisso}{numero + 1:0{cifre}d}", ingredienti, casuale
+                )
+                if numero:
+                    f.write(", ")
+                f.write(json.dumps(ricetta, ensure_ascii=False))
+                for codice, proprieta in PROPRIETA_PIANI.items():
+                    scelte = candidati[(codice, tipo)]
+                    if len(scelte) < 3 * RICETTE_PER_PIANO[tipo] and (
+                            proprieta is None or ricetta["proprieta"].get(proprieta)):
+                        scelte.append(ricetta["id_pasto"])
+            f.write("]")
+        f.write("}")
+
+    piani_base = {}
+    for codice_piano in codici_piani:
+        codice = codice_piano.split("-")[0]
+        piani_base[codice_piano] = {
+            tipo: casuale.sample(candidati[(codice, tipo)], min(RICETTE_PER_PIANO[tipo], len(candidati[(codice, tipo)])))
+            for tipo in TIPI_PASTO
+        }
+    with open(path_piani_base, "w", encoding="utf-8") as f:
+        json.dump(piani_base, f, ensure_ascii=False, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un catalogo sintetico di ricette e i piani base")
+    parser.add_argument("ricette", type=int, help="numero di ricette")
+    parser.add_argument("--cartella", default=".", help="directory di ricette.json e base_plans.json")
+    parser.add_argument("--seme", type=int, default=0)
+    args = parser.parse_args()
+    genera_catalogo(
+        args.ricette,
+        os.path.join(args.cartella, "ricette.json"),
+        os.path.join(args.cartella, "base_plans.json"),
+        args.seme
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import argparse
+
+from mediterrania_orchestrator.database.database_handler import DatabaseRicette
+from mediterrania_orchestrator.database.substitution_graph import GrafoSostituzioni, path_grafo_predefinito
+
+def main():
+    parser = argparse.ArgumentParser(description="Costruisce il grafo k-NN delle sostituzioni")
+    parser.add_argument("--ricette", default=None, help="percorso di ricette.json")
+    parser.add_argument("--output", default=None, help="file di destinazione del grafo")
+    parser.add_argument("-k", type=int, default=10, help="numero di vicini per ricetta")
+    parser.add_argument("--threshold", type=float, default=0.2, help="soglia di similarità nutrizionale")
+    args = parser.parse_args()
+
+    db = DatabaseRicette(args.ricette)
+    grafo = GrafoSostituzioni.costruisci(db, k=args.k, threshold=args.threshold)
+    output = args.output or path_grafo_predefinito(db)
+    grafo.salva(output)
+
+    archi = sum(len(vicini) for vicini in grafo.vicini.values())
+    print(f"Grafo salvato in {output}: {len(grafo.vicini)} ricette, {archi} archi")
+
+if __name__ == "__main__":
+    main()